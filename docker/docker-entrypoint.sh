@@ -25,23 +25,21 @@ elif [[ "$1" == "run-ingest" ]]; then
         echo "iinit failed"
     fi
 
-    celery -A irods_capability_automated_ingest.sync_task worker -l error -Q restart,path,file -c 12 &
-
-    for i in $RODEOS_INGEST_PATH/*; do
-        echo "Going for the following ingest path:"
-        echo $i
-        TARGET=/$IRODS_ZONE_NAME/home/$IRODS_USER/$RODEOS_TARGET_COLLECTION
-        DIR=$(basename $i)
-        YEAR=20${DIR::2}  # first two chars
-        imkdir $TARGET
-        imkdir $TARGET/$YEAR
-        imkdir $TARGET/$YEAR/$DIR
-
-        python -m irods_capability_automated_ingest.irods_sync start \
-            --event_handler $RODEOS_EVENT_HANDLER \
-            --synchronous \
-            $i $TARGET/$YEAR/$DIR
-    done
+    if [[ -n "$RODEOS_QUEUE_METADATA" ]]; then
+        celery -A irods_capability_automated_ingest.sync_task worker -l error \
+            -Q $RODEOS_QUEUE_METADATA -c ${CONCURRENCY_METADATA:-2} -n metadata@%h &
+    fi
+    if [[ -n "$RODEOS_QUEUE_LARGE" ]]; then
+        celery -A irods_capability_automated_ingest.sync_task worker -l error \
+            -Q $RODEOS_QUEUE_LARGE -c ${CONCURRENCY_LARGE:-2} -n large@%h &
+    fi
+    celery -A irods_capability_automated_ingest.sync_task worker -l error \
+        -Q restart,path,file -c 12 -n file@%h &
+
+    rodeos-ingest-orchestrate \
+        --ingest-root $RODEOS_INGEST_PATH \
+        --target /$IRODS_ZONE_NAME/home/$IRODS_USER/$RODEOS_TARGET_COLLECTION \
+        --event-handler $RODEOS_EVENT_HANDLER
 
 
 else
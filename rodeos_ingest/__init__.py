@@ -1,7 +1,12 @@
-from ._version import get_versions
+def __getattr__(name):
+    # Determining the version runs ``git`` in source checkouts, so only do it on first access.
+    if name == "__version__":
+        from ._version import get_versions
+
+        globals()["__version__"] = get_versions()["version"]
+        return globals()["__version__"]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
-__version__ = get_versions()["version"]
-del get_versions
 
 # from ._check_path import _check_executables_in_path
 
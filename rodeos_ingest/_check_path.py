@@ -1,38 +1,64 @@
-"""Checking for presence of required external programs."""
+"""Checking for presence of required external programs.
 
+Executables are resolved in-process and cached for the whole process.  The cache is dropped when
+``$PATH`` changes.  ``require_tools()`` validates tools once per process by running each with a
+version option.  It is called right before running a tool, so that the path and file workers check
+the tools that they use, and ``startup_check()`` validates all required tools in ``pre_job`` and
+logs a report with the versions and timings.
+"""
+
+import os
+import re
+import shutil
 import subprocess  # nosec
+import threading
+import time
 import typing
 
-from .settings import RODEOS_LOOK_FOR_EXECUTABLES
+import attr
+
+from .settings import (
+    RODEOS_LOOK_FOR_EXECUTABLES,
+    RODEOS_MANIFEST_ENGINE as MANIFEST_ENGINE,
+    RODEOS_TOOLS_CHECK_TIMEOUT_SECONDS as TOOLS_CHECK_TIMEOUT_SECONDS,
+)
+
+#: Resolved executables by name, valid for the ``$PATH`` in ``_cache_path``.
+_cache: typing.Dict[str, str] = {}
+#: The ``$PATH`` that ``_cache`` was filled with.
+_cache_path: typing.Optional[str] = None
+#: Lock for ``_cache``.
+_cache_lock = threading.Lock()
+
+
+def _resolve(name: str) -> typing.Optional[str]:
+    """Return the path of executable ``name`` in ``$PATH``, ``None`` if not found.
+
+    Found executables are cached until ``$PATH`` changes, missing ones are looked up again.
+    """
+    global _cache_path
+    path = os.environ.get("PATH", os.defpath)
+    with _cache_lock:
+        if path != _cache_path:
+            _cache.clear()
+            _cache_path = path
+        if name not in _cache:
+            result = shutil.which(name, path=path)
+            if result is None:
+                return None
+            _cache[name] = result
+        return _cache[name]
 
 
 def _executable_in_path(name: str) -> typing.Union[str, bool]:
     """Check whether an executable with the given ``name`` is in the ``$PATH``.
 
-    Uses ``which``.
-
-    Return path to executable or ``True`` if output is empty.  Returns ``False``
-    if ``which`` could not find it.
+    Return path to executable.  Returns ``False`` if it could not be found.
     """
     if not RODEOS_LOOK_FOR_EXECUTABLES:  # pragma: no cover
         return False
     else:
-        try:
-            res = subprocess.run(  # nosec
-                ["which", name],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=1,
-                encoding="utf-8",
-                check=True,
-            )
-        except subprocess.CalledProcessError:  # pragma: no cover
-            return False
-        else:
-            if res.returncode == 0:
-                return res.stdout or True
-            else:  # pragma: no cover
-                return False
+        return _resolve(name) or False
 
 
 def _check_executables_in_path(names: typing.List[str]) -> None:
@@ -41,3 +67,130 @@ def _check_executables_in_path(names: typing.List[str]) -> None:
     if problematic:  # pragma: no cover
         tpl = "The following executable(s) are required but not in PATH: %s"
         raise RuntimeError(tpl % ", ".join(problematic))
+
+
+#: Arguments for printing the version of the external tools.  The iRODS icommands print their
+#: version at the end of the help.
+TOOL_VERSION_ARGS = {
+    "hashdeep": ("-V",),
+    "ichksum": ("-h",),
+    "iquest": ("-h",),
+    "find": ("--version",),
+}
+
+#: Regular expression for finding the version in the output.
+_VERSION_RE = re.compile(r"(\d+(?:\.\d+)+)")
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ToolStatus:
+    """Result of checking one external tool."""
+
+    #: Name of the executable.
+    name: str
+    #: Path of the executable, ``None`` if not found.
+    path: typing.Optional[str]
+    #: Version printed by the tool, ``None`` if unknown.
+    version: typing.Optional[str]
+    #: Seconds for resolving the tool and printing its version.
+    seconds: float
+    #: Problem with the tool, if any.
+    error: typing.Optional[str] = None
+
+
+def required_tools() -> typing.List[str]:
+    """Return the external tools required with the current settings."""
+    names = ["ichksum", "iquest", "find"]
+    if MANIFEST_ENGINE != "python":
+        names.insert(0, "hashdeep")
+    return names
+
+
+def check_tool(name: str, timeout: float = TOOLS_CHECK_TIMEOUT_SECONDS) -> ToolStatus:
+    """Resolve the tool ``name`` and run it to get its version."""
+    start = time.monotonic()
+    path = _resolve(name)
+    if path is None:
+        return ToolStatus(name, None, None, time.monotonic() - start, "not found in PATH")
+    try:
+        res = subprocess.run(  # nosec
+            [path, *TOOL_VERSION_ARGS.get(name, ("--version",))],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            timeout=timeout,
+            encoding="utf-8",
+            errors="replace",
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return ToolStatus(name, path, None, time.monotonic() - start, str(e))
+    match = _VERSION_RE.search(res.stdout)
+    error = "exited with status %d" % res.returncode if res.returncode else None
+    return ToolStatus(
+        name, path, match.group(1) if match else None, time.monotonic() - start, error
+    )
+
+
+def check_tools(names: typing.Iterable[str]) -> typing.List[ToolStatus]:
+    """Check the tools ``names``, see ``check_tool()``."""
+    return [check_tool(name) for name in names]
+
+
+def format_report(statuses: typing.Iterable[ToolStatus]) -> str:
+    """Return report of the ``statuses`` with one line per tool."""
+    lines = []
+    for status in statuses:
+        lines.append(
+            "%s %s (%s) in %.1f ms%s"
+            % (
+                status.name,
+                status.version or "unknown version",
+                status.path or "-",
+                status.seconds * 1000,
+                " -- %s" % status.error if status.error else "",
+            )
+        )
+    return "\n".join(lines)
+
+
+#: Process that each tool was checked successfully in, by name.
+_checked: typing.Dict[str, int] = {}
+
+
+def require_tools(names: typing.Iterable[str], logger=None) -> None:
+    """Validate the tools ``names`` once per process, see ``check_tool()``.
+
+    Raises ``RuntimeError`` with the report if a tool is missing or fails, the check is repeated
+    on the next call then.  The report is logged to ``logger`` if given.  Does nothing if
+    ``RODEOS_LOOK_FOR_EXECUTABLES`` is disabled.
+    """
+    if not RODEOS_LOOK_FOR_EXECUTABLES:
+        return
+    pid = os.getpid()
+    unchecked = [name for name in names if _checked.get(name) != pid]
+    if not unchecked:
+        return
+    start = time.monotonic()
+    statuses = check_tools(unchecked)
+    report = format_report(statuses)
+    problematic = [status.name for status in statuses if status.error]
+    if problematic:
+        if logger:
+            logger.error("external tools check failed:\n%s" % report)
+        raise RuntimeError(
+            "External tool(s) missing or failing: %s\n%s" % (", ".join(problematic), report)
+        )
+    if logger:
+        logger.info(
+            "external tools checked in %.1f ms:\n%s" % ((time.monotonic() - start) * 1000, report)
+        )
+    for name in unchecked:
+        _checked[name] = pid
+
+
+def startup_check(logger) -> None:
+    """Validate all required external tools once per process and log a report.
+
+    See ``require_tools()``, the path and file workers check the tools they use on first use.
+    """
+    require_tools(required_tools(), logger)
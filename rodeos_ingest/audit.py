@@ -0,0 +1,259 @@
+"""Fixity audit of ingested collections.
+
+After a run folder has been finalized (``rodeos::ingest::status`` is ``complete``) and moved to
+the ingested area, its data is never looked at again by the ingest.  The audit
+(``rodeos-ingest-audit``) periodically re-verifies such collections, oldest audit first:
+
+- the stored ``_MANIFEST_LOCAL.txt`` (or its compressed variant) is compared to the current
+  iRODS checksums obtained with bulk ``iquest`` queries (as in ``compute_irods_manifest()``),
+- the checksums of all data objects are verified on the server with ``ichksum -K`` in parallel
+  (for bundled directories, only their archive is verified: the checksums of the members come
+  from the index computed locally when the archive was created and are not re-verified).
+
+Server-side verification is limited to a budget of bytes per second and operations per second
+using ``TokenBucket`` objects such that the audit does not saturate the storage and the iCAT
+during ingest.  The outcome of each data object and collection is appended to a progress file
+such that an interrupted audit can be resumed, and the result is written to the
+``rodeos::ingest::last_audit``, ``rodeos::ingest::audit_status``, and
+``rodeos::ingest::audit_message`` AVUs of the collection.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import os
+import subprocess  # nosec
+import tempfile
+import time
+import typing
+
+import dateutil.parser
+from irods.meta import iRODSMeta
+
+from rodeos_ingest._check_path import require_tools
+from rodeos_ingest.bundle import BUNDLE_SUFFIX, is_bundled
+from rodeos_ingest.cli import _irods_session
+from rodeos_ingest.common import (
+    KEY_STATUS,
+    _iquest,
+    cleanuping,
+    compute_irods_manifest,
+    _compare_manifests,
+)
+from rodeos_ingest.manifest import COMPRESSION_SUFFIXES, load_manifest
+from rodeos_ingest.progress import Progress, STATUS_FAILED, STATUS_OK
+from rodeos_ingest.settings import (
+    RODEOS_AUDIT_BYTES_PER_SECOND as AUDIT_BYTES_PER_SECOND,
+    RODEOS_AUDIT_JOBS as AUDIT_JOBS,
+    RODEOS_AUDIT_MIN_AGE_DAYS as AUDIT_MIN_AGE_DAYS,
+    RODEOS_AUDIT_OPS_PER_SECOND as AUDIT_OPS_PER_SECOND,
+    RODEOS_MANIFEST_LOCAL as MANIFEST_LOCAL,
+)
+from rodeos_ingest.throttle import TokenBucket
+
+#: AVU key with time of last audit.
+KEY_LAST_AUDIT = "rodeos::ingest::last_audit"
+#: AVU key with status of last audit.
+KEY_AUDIT_STATUS = "rodeos::ingest::audit_status"
+#: AVU key with detailed message of last audit.
+KEY_AUDIT_MESSAGE = "rodeos::ingest::audit_message"
+
+
+def find_completed_collections(root: str) -> typing.List[str]:
+    """Return collections below ``root`` with ``rodeos::ingest::status`` set to ``complete``."""
+    return sorted(
+        _iquest(
+            "%s",
+            "SELECT COLL_NAME WHERE COLL_NAME like '%s/%%' AND META_COLL_ATTR_NAME = '%s' "
+            "AND META_COLL_ATTR_VALUE = 'complete'" % (root.rstrip("/"), KEY_STATUS),
+        )
+    )
+
+
+def query_last_audit(root: str) -> typing.Dict[str, datetime.datetime]:
+    """Return time of last audit for the audited collections below ``root``."""
+    result = {}
+    for line in _iquest(
+        "%s\t%s",
+        "SELECT COLL_NAME, META_COLL_ATTR_VALUE WHERE COLL_NAME like '%s/%%' "
+        "AND META_COLL_ATTR_NAME = '%s'" % (root.rstrip("/"), KEY_LAST_AUDIT),
+    ):
+        coll_name, _, value = line.partition("\t")
+        result[coll_name] = dateutil.parser.parse(value)
+    return result
+
+
+def select_due(
+    collections: typing.Iterable[str],
+    last_audit: typing.Dict[str, datetime.datetime],
+    min_age: datetime.timedelta,
+    now: typing.Optional[datetime.datetime] = None,
+) -> typing.List[str]:
+    """Return ``collections`` not audited within ``min_age``, never audited first, then oldest."""
+    now = now or datetime.datetime.now()
+    due = [c for c in collections if c not in last_audit or now - last_audit[c] >= min_age]
+    return sorted(due, key=lambda c: (c in last_audit, last_audit.get(c, now), c))
+
+
+class Auditor:
+    """Verify collections against their stored local manifest within a rate budget."""
+
+    def __init__(
+        self,
+        logger,
+        session,
+        jobs: int = AUDIT_JOBS,
+        bytes_per_second: float = AUDIT_BYTES_PER_SECOND,
+        ops_per_second: float = AUDIT_OPS_PER_SECOND,
+        progress: typing.Optional[Progress] = None,
+    ):
+        #: Logger to use.
+        self.logger = logger
+        #: The iRODS session to use.
+        self.session = session
+        #: Number of data objects verified at the same time.
+        self.jobs = max(1, jobs)
+        #: Budget for bytes verified per second.
+        self.bytes = TokenBucket(bytes_per_second)
+        #: Budget for iRODS operations per second.
+        self.ops = TokenBucket(ops_per_second)
+        #: Optional progress for resuming.
+        self.progress = progress
+
+    def verify_object(self, path: str, size: int) -> None:
+        """Verify checksum of data object at ``path`` on the server with ``ichksum -K``."""
+        self.bytes.acquire(size)
+        self.ops.acquire()
+        require_tools(["ichksum"])
+        subprocess.run(["ichksum", "-K", path], stdout=subprocess.DEVNULL, check=True)  # nosec
+
+    def verify_objects(self, coll_path: str, manifest_path: str) -> typing.List[str]:
+        """Verify all data objects from the iRODS manifest, return paths that failed.
+
+        The records of bundle members are skipped, their archive is verified instead.  This only
+        covers the archive's checksum, the member checksums in its index are not re-verified.
+        """
+        table = load_manifest(manifest_path)
+        done = self.progress.succeeded() if self.progress else set()
+        suffix = BUNDLE_SUFFIX.encode("ascii")
+        bundle_dirs = [
+            os.fsdecode(path[2 : -len(suffix)]) for path in table.paths if path.endswith(suffix)
+        ]
+        items = [
+            (coll_path + os.fsdecode(path)[1:], size)
+            for path, size in zip(table.paths, table.sizes)
+            if path.endswith(suffix) or not is_bundled(os.fsdecode(path), bundle_dirs)
+        ]
+        items = [(path, size) for path, size in items if path not in done]
+
+        def _verify(item) -> bool:
+            path, size = item
+            try:
+                self.verify_object(path, size)
+            except subprocess.CalledProcessError as e:
+                self.logger.error("verification of %s failed: %s" % (path, e))
+                if self.progress:
+                    self.progress.record(path, STATUS_FAILED)
+                return False
+            if self.progress:
+                self.progress.record(path, STATUS_OK)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return [path for (path, _), ok in zip(items, executor.map(_verify, items)) if not ok]
+
+    def _stored_manifest_name(self, coll_path: str) -> str:
+        """Return name of the stored local manifest in ``coll_path``, possibly compressed."""
+        for suffix in ("",) + tuple(COMPRESSION_SUFFIXES.values()):
+            self.ops.acquire()
+            if self.session.data_objects.exists("%s/%s%s" % (coll_path, MANIFEST_LOCAL, suffix)):
+                return MANIFEST_LOCAL + suffix
+        raise RuntimeError("no %s found in %s" % (MANIFEST_LOCAL, coll_path))
+
+    def audit_collection(self, coll_path: str) -> bool:
+        """Audit the collection at ``coll_path``, update its AVUs, and return success."""
+        self.logger.info("auditing %s" % coll_path)
+        coll = self.session.collections.get(coll_path)
+        message = "all good"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                name = self._stored_manifest_name(coll_path)
+                local_path = os.path.join(tmp_dir, name)
+                self.ops.acquire()
+                subprocess.run(  # nosec
+                    ["iget", "-f", "%s/%s" % (coll_path, name), local_path], check=True
+                )
+                self.ops.acquire(2)  # two iquest calls
+                irods_path = compute_irods_manifest(coll, self.logger, tmp_dir)
+                _compare_manifests(local_path, irods_path, self.logger, skip_tree_digests=True)
+                failed = self.verify_objects(coll_path, irods_path)
+                if failed:
+                    message = "checksum verification failed for %d files, e.g., %s" % (
+                        len(failed),
+                        failed[0],
+                    )
+            except (RuntimeError, subprocess.CalledProcessError) as e:
+                message = str(e)
+        ok = message == "all good"
+        coll.metadata[KEY_LAST_AUDIT] = iRODSMeta(
+            KEY_LAST_AUDIT, datetime.datetime.now().isoformat(), ""
+        )
+        coll.metadata[KEY_AUDIT_STATUS] = iRODSMeta(
+            KEY_AUDIT_STATUS, "success" if ok else "failed", ""
+        )
+        coll.metadata[KEY_AUDIT_MESSAGE] = iRODSMeta(KEY_AUDIT_MESSAGE, message, "")
+        if self.progress:
+            self.progress.record(coll_path, STATUS_OK if ok else STATUS_FAILED)
+        self.logger.info("audit of %s: %s" % (coll_path, message))
+        return ok
+
+    def run(
+        self, root: str, min_age: datetime.timedelta, resume: bool = False
+    ) -> typing.Dict[str, bool]:
+        """Audit the completed collections below ``root`` that are due and return the results."""
+        collections = select_due(find_completed_collections(root), query_last_audit(root), min_age)
+        if resume and self.progress:
+            done = self.progress.succeeded()
+            collections = [c for c in collections if c not in done]
+        elif self.progress and self.progress.path.exists():
+            self.progress.path.unlink()
+        self.logger.info("%d collections due for audit" % len(collections))
+        return {coll_path: self.audit_collection(coll_path) for coll_path in collections}
+
+
+def main(argv=None):  # pragma: no cover
+    """Entry point for ``rodeos-ingest-audit``."""
+    parser = argparse.ArgumentParser(description="Audit fixity of ingested collections")
+    parser.add_argument("--jobs", "-j", type=int, default=AUDIT_JOBS)
+    parser.add_argument("--bytes-per-second", type=float, default=AUDIT_BYTES_PER_SECOND)
+    parser.add_argument("--ops-per-second", type=float, default=AUDIT_OPS_PER_SECOND)
+    parser.add_argument("--min-age-days", type=float, default=AUDIT_MIN_AGE_DAYS)
+    parser.add_argument("--progress", default="rodeos-ingest-audit.progress")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted audit")
+    parser.add_argument(
+        "--interval", type=float, default=0, help="seconds between audits, 0 to run once"
+    )
+    parser.add_argument("root", help="collection with the ingested run folders")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("rodeos_ingest.audit")
+    resume = args.resume
+    while True:
+        with cleanuping(_irods_session()) as session:
+            auditor = Auditor(
+                logger,
+                session,
+                args.jobs,
+                args.bytes_per_second,
+                args.ops_per_second,
+                Progress(args.progress),
+            )
+            results = auditor.run(
+                args.root, datetime.timedelta(days=args.min_age_days), resume=resume
+            )
+        if not args.interval:
+            return int(not all(results.values()))
+        resume = False
+        time.sleep(args.interval)
@@ -0,0 +1,259 @@
+"""Bundling of directories with many small files into indexed ``tar`` archives.
+
+Run folders contain directories with tens of thousands of small files (e.g., ``InterOp``,
+``Thumbnail_Images``, and ``Logs`` for Illumina sequencers).  Ingesting each of them as a data
+object makes the number of iCAT rows and the per-object overhead the limiting factor.  Instead,
+such directories can be bundled into one ``tar`` archive ``<dir>.rodeos-bundle.tar`` per
+directory when the run folder is at rest; the files themselves are not uploaded.  The archives are
+built in a staging directory outside of the scanned source tree (``RODEOS_BUNDLE_STAGING_DIR``)
+and removed after the upload, so the run folder is not changed.
+
+The last member of each archive is an index (``.rodeos-bundle-index.tsv``) with one
+``offset<TAB>size<TAB>digest<TAB>path`` line per member, where ``offset`` is the position of the
+member's data in the archive.  It allows random access to single members, also in iRODS where the
+position of the index itself is stored in the ``rodeos::bundle::index_offset`` and
+``rodeos::bundle::index_size`` AVUs of the archive.
+
+The digest of the archive is computed while it is written and compared to the iRODS checksum of
+the uploaded data object.  ``expand_manifest()`` adds one record per bundled member (with the
+digest from the index) to the iRODS manifest, such that it can be compared with the local manifest
+that lists the original files.  As the index is computed locally, this only checks that the
+archive covers the local files: the verification of the data in iRODS covers the archive's
+checksum only, also in the audit (``rodeos_ingest.audit``).
+"""
+
+import os
+import tarfile
+import tempfile
+import typing
+
+import attr
+
+from rodeos_ingest.digest import DigestAlgorithm, format_irods_checksum
+from rodeos_ingest.manifest import iter_records, mapped
+
+#: Suffix of bundle archive names.
+BUNDLE_SUFFIX = ".rodeos-bundle.tar"
+#: Name of the index member.
+INDEX_NAME = ".rodeos-bundle-index.tsv"
+#: AVU key with the offset of the index data in the archive.
+KEY_INDEX_OFFSET = "rodeos::bundle::index_offset"
+#: AVU key with the size of the index data.
+KEY_INDEX_SIZE = "rodeos::bundle::index_size"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class BundleMember:
+    """One entry of a bundle index."""
+
+    #: Offset of the member data in the archive.
+    offset: int
+    #: Size of the member.
+    size: int
+    #: Hex digest of the member.
+    digest: str
+    #: Path relative to the run folder, ``./``-prefixed as in the manifests.
+    path: str
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class Bundle:
+    """A created bundle archive."""
+
+    #: Path to the archive.
+    path: str
+    #: Hex digest of the archive.
+    digest: str
+    #: Offset of the index data in the archive.
+    index_offset: int
+    #: Size of the index data.
+    index_size: int
+    #: The bundled members.
+    members: typing.List[BundleMember]
+
+
+def bundle_name(name: str) -> str:
+    """Return name of the archive for directory ``name``."""
+    return name + BUNDLE_SUFFIX
+
+
+def is_bundled(rel_path: str, bundle_dirs: typing.Iterable[str]) -> bool:
+    """Return whether ``rel_path`` (relative to the run folder) is handled by bundling.
+
+    This is the case for files in one of ``bundle_dirs`` and for their (temporary) archives.
+    """
+    parts = os.path.normpath(rel_path).split(os.sep)
+    bundle_dirs = set(bundle_dirs)
+    if len(parts) > 1:
+        return parts[0] in bundle_dirs
+    archives = {bundle_name(name) for name in bundle_dirs}
+    return parts[0] in archives or parts[0][: -len(".tmp")] in archives
+
+
+class _HashingWriter:
+    """File wrapper that feeds all written data to a hash object."""
+
+    def __init__(self, fileobj: typing.BinaryIO, hasher):
+        self.fileobj = fileobj
+        self.hasher = hasher
+
+    def write(self, data: bytes) -> int:
+        self.hasher.update(data)
+        return self.fileobj.write(data)
+
+    def tell(self) -> int:
+        return self.fileobj.tell()
+
+
+class _HashingReader:
+    """File wrapper that feeds all read data to a hash object."""
+
+    def __init__(self, fileobj: typing.BinaryIO, hasher):
+        self.fileobj = fileobj
+        self.hasher = hasher
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+
+def _data_offset(tar: tarfile.TarFile, size: int) -> int:
+    """Return offset of the data of the member of ``size`` bytes that was just added."""
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return tar.offset - (blocks + (1 if remainder else 0)) * tarfile.BLOCKSIZE
+
+
+def _normalize(info: tarfile.TarInfo) -> tarfile.TarInfo:
+    """Remove owner information such that archives only depend on names, times, and data."""
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+def create_bundle(
+    src_folder, name: str, algorithm: DigestAlgorithm, staging_dir: typing.Optional[str] = None
+) -> Bundle:
+    """Bundle the directory ``name`` in ``src_folder`` into an indexed archive in ``staging_dir``.
+
+    The archive and its members are hashed with ``algorithm`` while they are written.  The
+    archive is created as a new file in ``staging_dir`` (the system's temporary directory if
+    ``None``) and must be removed by the caller.
+    """
+    base = os.path.join(src_folder, name)
+    fd, path = tempfile.mkstemp(prefix=name + ".", suffix=BUNDLE_SUFFIX, dir=staging_dir)
+    members = []
+    archive_hasher = algorithm.new()
+    try:
+        with os.fdopen(fd, "wb") as outf:
+            writer = _HashingWriter(outf, archive_hasher)
+            with tarfile.open(fileobj=writer, mode="w", format=tarfile.PAX_FORMAT) as tar:
+                for root, dirs, files in os.walk(base):
+                    dirs.sort()
+                    for file_name in sorted(files):
+                        file_path = os.path.join(root, file_name)
+                        if os.path.islink(file_path) or not os.path.isfile(file_path):
+                            continue
+                        arcname = os.path.relpath(file_path, src_folder)
+                        info = _normalize(tar.gettarinfo(file_path, arcname=arcname))
+                        hasher = algorithm.new()
+                        with open(file_path, "rb") as inputf:
+                            tar.addfile(info, _HashingReader(inputf, hasher))
+                        members.append(
+                            BundleMember(
+                                _data_offset(tar, info.size),
+                                info.size,
+                                hasher.hexdigest(),
+                                "./%s" % arcname,
+                            )
+                        )
+                index = b"".join(
+                    b"%d\t%d\t%s\t%s\n"
+                    % (m.offset, m.size, m.digest.encode("ascii"), os.fsencode(m.path))
+                    for m in members
+                )
+                info = _normalize(tarfile.TarInfo(INDEX_NAME))
+                info.size = len(index)
+                tar.addfile(info, _HashingReader(_BytesReader(index), algorithm.new()))
+                index_offset = _data_offset(tar, len(index))
+    except BaseException:
+        os.remove(path)
+        raise
+    return Bundle(path, archive_hasher.hexdigest(), index_offset, len(index), members)
+
+
+class _BytesReader:
+    """Minimal file-like object reading from ``bytes``."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.data) if size < 0 else self.pos + size
+        result = self.data[self.pos : end]
+        self.pos += len(result)
+        return result
+
+
+def parse_index(data: bytes) -> typing.List[BundleMember]:
+    """Parse the index ``data`` into ``BundleMember`` objects."""
+    result = []
+    for line in data.splitlines():
+        offset, size, digest, path = line.split(b"\t", 3)
+        result.append(BundleMember(int(offset), int(size), digest.decode(), os.fsdecode(path)))
+    return result
+
+
+def read_index(
+    fileobj: typing.BinaryIO,
+    offset: typing.Optional[int] = None,
+    size: typing.Optional[int] = None,
+) -> typing.List[BundleMember]:
+    """Read the index of the archive ``fileobj``.
+
+    With ``offset`` and ``size`` given, the index data is read directly, otherwise the archive
+    headers are scanned for the index member.
+    """
+    if offset is None or size is None:
+        with tarfile.open(fileobj=fileobj, mode="r:") as tar:
+            member = tar.getmember(INDEX_NAME)
+            offset, size = member.offset_data, member.size
+    fileobj.seek(offset)
+    return parse_index(fileobj.read(size))
+
+
+def read_member(fileobj: typing.BinaryIO, member: BundleMember) -> bytes:
+    """Read the data of ``member`` from the archive ``fileobj``."""
+    fileobj.seek(member.offset)
+    return fileobj.read(member.size)
+
+
+def expand_manifest(
+    manifest_path,
+    read_bundle_index: typing.Callable[[str], typing.List[BundleMember]],
+    algorithm: str,
+) -> int:
+    """Append records for the members of bundles listed in the manifest at ``manifest_path``.
+
+    ``read_bundle_index`` is called with the manifest path of each bundle (e.g.,
+    ``./InterOp.rodeos-bundle.tar``).  The member digests are written in iRODS checksum format
+    for ``algorithm``.  Return the number of appended records.
+    """
+    suffix = BUNDLE_SUFFIX.encode("ascii")
+    with mapped(manifest_path) as buf:
+        bundles = [os.fsdecode(path) for _, _, path in iter_records(buf) if path.endswith(suffix)]
+    count = 0
+    with open(manifest_path, "ab") as outf:
+        for bundle_path in bundles:
+            for member in read_bundle_index(bundle_path):
+                outf.write(
+                    b"%d,%s,%s\n"
+                    % (
+                        member.size,
+                        format_irods_checksum(algorithm, member.digest).encode("ascii"),
+                        os.fsencode(member.path),
+                    )
+                )
+                count += 1
+    return count
@@ -0,0 +1,242 @@
+"""Command line interface for running finalization steps outside of the Celery scan loop.
+
+The ``rodeos-ingest`` entry point provides the following sub commands that work on run folders
+given on the command line:
+
+``manifest-local``
+    compute the local manifest with ``compute_local_manifest()``
+``manifest-irods``
+    compute the iRODS manifest with ``compute_irods_manifest()``, optionally after ``ichksum -r``
+``verify``
+    compare existing local and iRODS manifests with ``_compare_manifests()``
+``finalize``
+    finalize run folders with ``_post_job_run_folder_done()`` as the ``post_job`` would do, holding
+    the same lease as the workers (see ``rodeos_ingest.lease``)
+``calibrate``
+    measure the hashing throughput at different thread counts with ``calibrate()`` and store the
+    best thread count for the folder's mount point in ``RODEOS_HASHING_TUNING_FILE``
+
+The folders are processed by ``--jobs`` parallel workers.  The outcome for each folder is
+appended to a progress file, ``--resume`` skips the folders that were processed successfully
+before, and ``--dry-run`` only logs what would be done.  The destination collection of a run
+folder is the subcollection of ``--target`` with the same name.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import logging
+import os
+import pathlib
+import sys
+import typing
+
+from rodeos_ingest.common import (
+    cleanuping,
+    compute_irods_manifest,
+    compute_local_manifest,
+    run_ichksum,
+    _compare_manifests,
+    _post_job_run_folder_done,
+)
+from rodeos_ingest.digest import get_algorithms
+from rodeos_ingest.lease import open_lease
+from rodeos_ingest.progress import Progress, STATUS_FAILED, STATUS_OK, STATUS_SKIPPED
+from rodeos_ingest.settings import (
+    RODEOS_DELAY_UNTIL_AT_REST_SECONDS as DELAY_UNTIL_AT_REST_SECONDS,
+    RODEOS_HASHDEEP_ALGO as HASHDEEP_ALGO,
+    RODEOS_HASHING_TUNING_FILE as HASHING_TUNING_FILE,
+    RODEOS_ILLUMINA_FASTQ_CHUNKED_HASHING_THRESHOLD as FASTQ_CHUNKED_HASHING_THRESHOLD,
+    RODEOS_MANIFEST_IRODS as MANIFEST_IRODS,
+    RODEOS_MANIFEST_LOCAL as MANIFEST_LOCAL,
+)
+from rodeos_ingest.tuning import TuningStore, calibrate, mount_point
+
+
+def run_folders(
+    logger,
+    folders: typing.Sequence[str],
+    func: typing.Callable[[str], typing.Optional[bool]],
+    jobs: int = 1,
+    dry_run: bool = False,
+    progress: typing.Optional[Progress] = None,
+    resume: bool = False,
+) -> typing.Dict[str, str]:
+    """Call ``func(folder)`` for all ``folders`` with ``jobs`` workers and return status by folder.
+
+    ``func`` returning ``False`` marks the folder as skipped, exceptions mark it as failed.
+    """
+    done = progress.succeeded() if (progress and resume) else set()
+    todo = [folder for folder in folders if folder not in done]
+    for folder in sorted(set(folders) & done):
+        logger.info("skipping %s, already processed" % folder)
+    if dry_run:
+        for folder in todo:
+            logger.info("would process %s" % folder)
+        return {}
+
+    def _process(folder: str) -> str:
+        try:
+            status = STATUS_SKIPPED if func(folder) is False else STATUS_OK
+        except Exception as e:
+            logger.error("processing %s failed: %s" % (folder, e))
+            status = STATUS_FAILED
+        if progress:
+            progress.record(folder, status)
+        return status
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return dict(zip(todo, executor.map(_process, todo)))
+
+
+def _irods_session():  # pragma: no cover
+    """Return new ``iRODSSession`` from the iRODS environment file."""
+    from irods.session import iRODSSession
+
+    env_file = os.environ.get(
+        "IRODS_ENVIRONMENT_FILE", os.path.expanduser("~/.irods/irods_environment.json")
+    )
+    return iRODSSession(irods_env_file=env_file)
+
+
+def _is_folder_done(handler: str) -> typing.Callable:
+    """Return done-marker check for ``handler``."""
+    if handler == "bcl":
+        from rodeos_ingest.genomics.illumina.bcl import is_runfolder_done as is_folder_done
+    else:
+        from rodeos_ingest.genomics.illumina.fastq import is_demuxfolder_done as is_folder_done
+    return is_folder_done
+
+
+def _bundle_dirs(handler: str) -> typing.Tuple[str, ...]:
+    """Return directories to bundle for ``handler``."""
+    if handler == "bcl":
+        from rodeos_ingest.genomics.illumina.bcl import BUNDLE_DIRS
+
+        return BUNDLE_DIRS
+    return ()
+
+
+def _make_func(logger, args) -> typing.Callable[[str], typing.Optional[bool]]:
+    """Return the per-folder callable for the sub command in ``args``."""
+    if args.command == "manifest-local":
+        return lambda folder: bool(
+            compute_local_manifest(logger, folder, args.chunked_hashing_threshold)
+        )
+    elif args.command == "verify":
+        return lambda folder: _compare_manifests(
+            os.path.join(folder, MANIFEST_LOCAL), os.path.join(folder, MANIFEST_IRODS), logger
+        )
+    elif args.command == "calibrate":
+
+        def _calibrate(folder: str) -> bool:
+            levels = [int(level) for level in args.levels.split(",")]
+            throughput = calibrate(folder, get_algorithms(HASHDEEP_ALGO), levels, args.sample_bytes)
+            for level, value in sorted(throughput.items()):
+                logger.info("%s: %d threads: %.1f MB/s" % (folder, level, value / 1e6))
+            threads = TuningStore(args.tuning_file).put(mount_point(folder), throughput)
+            logger.info("using %d threads for %s" % (threads, mount_point(folder)))
+            return True
+
+        return _calibrate
+
+    def _with_collection(folder: str) -> bool:  # pragma: no cover
+        dst_path = "/".join((args.target.rstrip("/"), os.path.basename(folder)))
+        with cleanuping(_irods_session()) as session:
+            dst_collection = session.collections.get(dst_path)
+            if args.command == "manifest-irods":
+                if args.ichksum:
+                    run_ichksum(dst_path, recurse=True)
+                return bool(compute_irods_manifest(dst_collection, logger, folder))
+            else:
+                return _post_job_run_folder_done(
+                    logger,
+                    session,
+                    folder,
+                    dst_collection,
+                    _is_folder_done(args.handler),
+                    datetime.timedelta(seconds=args.delay),
+                    args.chunked_hashing_threshold,
+                    _bundle_dirs(args.handler),
+                    open_lease({}, "finalize:%s" % dst_path),
+                )
+
+    return _with_collection
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Return the ``ArgumentParser`` for ``rodeos-ingest``."""
+    parser = argparse.ArgumentParser(description="Run ingest finalization steps on run folders")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="number of parallel workers")
+    parser.add_argument("--dry-run", action="store_true", help="only log what would be done")
+    parser.add_argument(
+        "--resume", action="store_true", help="skip folders recorded as ok in progress file"
+    )
+    parser.add_argument(
+        "--progress",
+        default=None,
+        help="progress file (default: rodeos-ingest-<command>.progress in current directory)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    def _add(name, help, target=False, hashing=False):
+        sub = subparsers.add_parser(name, help=help)
+        if target:
+            sub.add_argument("--target", required=True, help="destination base collection")
+        if hashing:
+            sub.add_argument(
+                "--chunked-hashing-threshold",
+                type=int,
+                default=0,
+                help="hash files of at least this size in parallel chunks, 0 to disable",
+            )
+        sub.add_argument("folders", nargs="+", help="run folders to process")
+        return sub
+
+    _add("manifest-local", "compute local manifest", hashing=True)
+    sub = _add("manifest-irods", "compute iRODS manifest", target=True)
+    sub.add_argument("--ichksum", action="store_true", help="run ichksum -r before")
+    _add("verify", "compare local and iRODS manifest")
+    sub = _add("calibrate", "measure hashing throughput and store best thread count")
+    sub.add_argument("--tuning-file", default=HASHING_TUNING_FILE, required=not HASHING_TUNING_FILE)
+    sub.add_argument("--levels", default="1,2,4,8,16,32", help="thread counts to measure")
+    sub.add_argument(
+        "--sample-bytes", type=int, default=4 * 1024**3, help="bytes to hash per level"
+    )
+    sub = _add("finalize", "finalize run folders as the post-job does", target=True, hashing=True)
+    sub.add_argument("--handler", choices=("bcl", "fastq"), required=True)
+    sub.add_argument(
+        "--delay",
+        type=float,
+        default=DELAY_UNTIL_AT_REST_SECONDS,
+        help="seconds since last update until a folder is considered at rest",
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    """Entry point for ``rodeos-ingest``."""
+    args = build_parser().parse_args(argv)
+    if (
+        args.command == "finalize"
+        and args.handler == "fastq"
+        and not args.chunked_hashing_threshold
+    ):
+        args.chunked_hashing_threshold = FASTQ_CHUNKED_HASHING_THRESHOLD
+    if args.command == "calibrate":
+        args.jobs = 1  # concurrent calibration would distort the measurements
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("rodeos_ingest.cli")
+    progress = Progress(args.progress or "rodeos-ingest-%s.progress" % args.command)
+    folders = [os.path.abspath(folder) for folder in args.folders]
+    result = run_folders(
+        logger, folders, _make_func(logger, args), args.jobs, args.dry_run, progress, args.resume
+    )
+    counts = {s: list(result.values()).count(s) for s in (STATUS_OK, STATUS_SKIPPED, STATUS_FAILED)}
+    logger.info("done: %s" % ", ".join("%d %s" % (n, s) for s, n in counts.items()))
+    return int(counts[STATUS_FAILED] > 0)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -1,8 +1,9 @@
 """Common code for the omics ingest."""
 
-import base64
-from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
 import datetime
+import itertools
 import os
 import os.path
 import pathlib
@@ -10,17 +11,63 @@ import subprocess  # nosec
 import tempfile
 import typing
 
-import dateutil.parser
-from irods_capability_automated_ingest.sync_irods import irods_session
-from irods.meta import iRODSMeta
-
 from rodeos_ingest.settings import (
+    RODEOS_BUNDLE_STAGING_DIR as BUNDLE_STAGING_DIR,
+    RODEOS_CHUNKED_HASHING_CHUNK_SIZE as CHUNKED_HASHING_CHUNK_SIZE,
+    RODEOS_FINALIZE_STAGE_TIMEOUT_SECONDS as FINALIZE_STAGE_TIMEOUT_SECONDS,
+    RODEOS_FINALIZE_STAGE_TIMEOUTS as FINALIZE_STAGE_TIMEOUTS,
     RODEOS_HASHDEEP_ALGO as HASHDEEP_ALGO,
     RODEOS_HASHDEEP_THREADS as HASHDEEP_THREADS,
+    RODEOS_HASH_CACHE as HASH_CACHE,
+    RODEOS_HASHING_AUTOTUNE as HASHING_AUTOTUNE,
+    RODEOS_HASHING_BYTES_PER_SECOND as HASHING_BYTES_PER_SECOND,
+    RODEOS_HASHING_IOPS as HASHING_IOPS,
+    RODEOS_HASHING_MAX_THREADS as HASHING_MAX_THREADS,
+    RODEOS_HASHING_TARGET_LATENCY_MS as HASHING_TARGET_LATENCY_MS,
+    RODEOS_HASHING_TUNING_FILE as HASHING_TUNING_FILE,
+    RODEOS_MANIFEST_COMPRESSION as MANIFEST_COMPRESSION,
+    RODEOS_MANIFEST_ENGINE as MANIFEST_ENGINE,
     RODEOS_MANIFEST_LOCAL as MANIFEST_LOCAL,
     RODEOS_MANIFEST_IRODS as MANIFEST_IRODS,
     RODEOS_MOVE_AFTER_INGEST as _MOVE_AFTER_INGEST,
+    RODEOS_MOVE_THREADS as MOVE_THREADS,
+)
+from rodeos_ingest._check_path import require_tools, startup_check
+from rodeos_ingest.bundle import (
+    BUNDLE_SUFFIX,
+    KEY_INDEX_OFFSET,
+    KEY_INDEX_SIZE,
+    bundle_name,
+    create_bundle,
+    expand_manifest,
+    read_index,
+)
+from rodeos_ingest.digest import (
+    get_algorithm,
+    get_algorithms,
+    hash_file,
+    parse_irods_checksum,
+    TREE_PREFIX,
+    UnknownDigestAlgorithm,
 )
+from rodeos_ingest.hashcache import HashCache
+from rodeos_ingest.lease import Lease, LeaseLost, open_lease
+from rodeos_ingest.memory import MemoryMonitor, RecordStore, open_record_store
+from rodeos_ingest.manifest import (
+    COMPRESSION_SUFFIXES,
+    compress_manifest,
+    iter_records,
+    mapped,
+    read_algorithms,
+    write_manifest,
+)
+from rodeos_ingest.metrics import apply_metrics
+from rodeos_ingest.move import PROGRESS_NAME, MoveVerificationError, move_tree
+from rodeos_ingest.pipeline import Pipeline, parse_timeouts
+from rodeos_ingest.profiling import profile_section
+from rodeos_ingest.throttle import IOGovernor
+from rodeos_ingest.tuning import ConcurrencyController, threads_for
+from rodeos_ingest.watch import get_journal
 
 #: AVU key to use for ``last_update`` attribute.
 KEY_LAST_UPDATE = "rodeos::ingest::last_update"
@@ -36,6 +83,17 @@ KEY_MANIFEST_MESSAGE = "rodeos::ingest::manifest_message"
 MOVE_AFTER_INGEST = _MOVE_AFTER_INGEST
 
 
+def irods_session(*args, **kwargs):
+    """Return an iRODS session of the automated ingest, see its ``sync_irods.irods_session``.
+
+    The automated ingest and the iRODS client are imported on first use only, as they take
+    longer to import than the handler modules.
+    """
+    from irods_capability_automated_ingest.sync_irods import irods_session as _irods_session
+
+    return _irods_session(*args, **kwargs)
+
+
 @contextmanager
 def cleanuping(thing):
     try:
@@ -51,61 +109,353 @@ def to_ingested_path(orig_path: typing.Union[str, pathlib.Path]) -> pathlib.Path
     return ingested_base / orig_path.name
 
 
-def _compare_manifests(path_local, path_irods, logger):
-    """Compare manifests at paths ``path_local`` and ``path_irods``."""
-    # Load file sizes and checksums.
-    info_local = {}
-    with open(path_local, "rt") as inputf:
-        for line in inputf:
-            if line.startswith("#") or line.startswith("%"):
-                continue
-            line = line.strip()
-            size, chksum, path = line.split(",", 2)
-            info_local[path] = (size, chksum)
-    info_irods = {}
-    with open(path_irods, "rt") as inputf:
-        for line in inputf:
-            line = line.strip()
-            size, chksum, path = line.split(",", 2)
-            if chksum.startswith("sha2:"):
-                chksum = base64.b64decode(chksum[5:]).hex()
-            info_irods[path] = (size, chksum)
-
-    # Compare file sizes and checksums.
-    problem = None
-    for path in sorted(info_local.keys() & info_irods.keys()):
-        size_local, chksum_local = info_local[path]
-        size_irods, chksum_irods = info_irods[path]
-        if size_local != size_irods:
-            problem = "file size mismatch %s vs %s for %s" % (size_local, size_irods, path)
+def _hashing_governor() -> typing.Optional[IOGovernor]:
+    """Return ``IOGovernor`` for hashing local files if any ``RODEOS_HASHING_*`` limit is set."""
+    if HASHING_BYTES_PER_SECOND or HASHING_IOPS or HASHING_TARGET_LATENCY_MS:
+        return IOGovernor(HASHING_BYTES_PER_SECOND, HASHING_IOPS, HASHING_TARGET_LATENCY_MS / 1000)
+    else:
+        return None
+
+
+def open_hash_cache() -> typing.Optional[HashCache]:
+    """Return the ``HashCache`` configured with ``RODEOS_HASH_CACHE``, if any."""
+    return HashCache(HASH_CACHE) if HASH_CACHE else None
+
+
+def _verify_tree_digests(logger, src_folder, algorithm, store: RecordStore) -> None:
+    """Replace tree digests of the local records in ``store`` by whole-file digests.
+
+    Files that were hashed in chunks cannot be compared to iRODS checksums directly, so they are
+    hashed again with a single sequential pass (in parallel over files) unless their digest is
+    found in the hash cache, e.g., after a server-side copy.  Only files with an iRODS checksum and
+    the same size in iRODS are hashed again, the comparison fails for the others anyway.
+    """
+    paths = []
+    for path in store.paths_with_checksum_prefix("local", TREE_PREFIX.encode("ascii")):
+        record_local, record_irods = store.get("local", path), store.get("irods", path)
+        if record_irods and record_irods[1] and record_irods[0] == record_local[0]:
+            paths.append(path)
+    if not paths:
+        return
+    logger.info("verifying %d files with tree digests with sequential pass" % len(paths))
+    algorithms = [get_algorithm(algorithm)]
+    governor = _hashing_governor()
+    cache = open_hash_cache()
+
+    def _hash(path):
+        full_path = os.path.join(src_folder, os.fsdecode(path))
+        if cache:
+            return cache.hash_file(full_path, algorithms, governor)[0]
+        return hash_file(full_path, algorithms, governor)[0]
+
+    with ThreadPoolExecutor(max_workers=max(1, HASHDEEP_THREADS)) as executor:
+        for path, digest in zip(paths, executor.map(_hash, paths)):
+            store.set_checksum("local", path, digest.encode("ascii"))
+
+
+def _compare_manifests(path_local, path_irods, logger, skip_tree_digests: bool = False):
+    """Compare manifests at paths ``path_local`` and ``path_irods``.
+
+    Files with tree digests in the local manifest are hashed again sequentially, relative to the
+    directory containing ``path_local``.  With ``skip_tree_digests``, only their sizes are
+    compared, e.g., when the local files are not available any more.
+
+    The records of bundle archives in the iRODS manifest are skipped, the archives are built
+    outside of the run folder and verified on upload, see ``_bundle_run_folder()``.
+
+    The records are held on disk instead of in memory if they would exceed
+    ``RODEOS_FINALIZE_MEMORY_BUDGET``, see ``rodeos_ingest.memory``.
+    """
+    with closing(open_record_store(logger, path_local, path_irods)) as store:
+        _load_manifests(store, path_local, path_irods, logger, skip_tree_digests)
+
+        problem = None
+        # Compare file sizes and checksums.
+        for path, (size_local, chksum_local), (size_irods, chksum_irods) in store.common():
+            if size_local != size_irods:
+                problem = "file size mismatch %s vs %s for %s" % (
+                    size_local,
+                    size_irods,
+                    os.fsdecode(path),
+                )
+                logger.error(
+                    "file size does not match %s vs %s for %s"
+                    % (size_local, size_irods, os.fsdecode(path))
+                )
+            if chksum_local != chksum_irods:
+                chksum_local, chksum_irods = chksum_local.decode(), chksum_irods.decode()
+                problem = "file checksum mismatch %s vs %s for %s" % (
+                    chksum_local,
+                    chksum_irods,
+                    os.fsdecode(path),
+                )
+                logger.error(
+                    "file checksum does not match %s vs %s for %s"
+                    % (chksum_local, chksum_irods, os.fsdecode(path))
+                )
+        # Find extra items on either side.
+        count, extra_local = store.extra("local")
+        extra_local = list(map(os.fsdecode, extra_local))
+        if extra_local:
+            problem = "extra file in local: %s" % extra_local[0]
             logger.error(
-                "file size does not match %s vs %s for %s" % (size_local, size_irods, path)
+                "%d items locally that are not in irods, up to 10 shown:\n  %s"
+                % (count, "  \n".join(extra_local))
             )
-        if chksum_local != chksum_irods:
-            problem = "file checksum mismatch %s vs %s for %s" % (chksum_local, chksum_irods, path)
+        count, extra_irods = store.extra("irods")
+        extra_irods = list(map(os.fsdecode, extra_irods))
+        if extra_irods:
+            problem = "extra file in irods : %s" % extra_irods[0]
             logger.error(
-                "file checksum does not match %s vs %s for %s" % (chksum_local, chksum_irods, path)
+                "%d items in irods that are not present locally, up to 10 shown:\n  %s"
+                % (count, "  \n".join(extra_irods))
             )
-    # Find extra items on either side.
-    extra_local = info_local.keys() - info_irods.keys()
-    if sorted(extra_local):
-        problem = "extra file in local: %s" % list(sorted(extra_local))[0]
-        logger.error(
-            "%d items locally that are not in irods, up to 10 shown:\n  %s"
-            % (len(extra_local), "  \n".join(list(sorted(extra_local))[:10]))
-        )
-    extra_irods = info_irods.keys() - info_local.keys()
-    if sorted(extra_irods):
-        problem = "extra file in irods : %s" % list(sorted(extra_irods))[0]
-        logger.error(
-            "%d items in irods that are not present locally, up to 10 shown:\n  %s"
-            % (len(extra_irods), "  \n".join(list(sorted(extra_irods))[:10]))
-        )
 
     if problem:
         raise RuntimeError("Difference in manifests: %s" % problem)
 
 
+def _load_manifests(
+    store: RecordStore, path_local, path_irods, logger, skip_tree_digests: bool
+) -> None:
+    """Load the records of the manifests at ``path_local`` and ``path_irods`` into ``store``."""
+    # Load file sizes and checksums, paths and checksums are kept as ``bytes``.
+    algorithms_irods = set()
+    bundle_suffix = BUNDLE_SUFFIX.encode("ascii")
+    with mapped(path_irods) as buf:
+        for size, chksums, path in iter_records(buf, len(read_algorithms(buf))):
+            if path.endswith(bundle_suffix):
+                # Bundle archives are not in the run folder, they are verified on upload.
+                continue
+            algorithm_irods, chksum = parse_irods_checksum(chksums.split(b",", 1)[0])
+            algorithms_irods.add(algorithm_irods)
+            store.add("irods", path, int(size), chksum)
+
+    with mapped(path_local) as buf:
+        algorithms_local = read_algorithms(buf)
+        # Checksums can only be compared when computed with the same algorithm, pick the
+        # matching column of the local manifest.
+        algorithm = next(iter(algorithms_irods), algorithms_local[0])
+        if len(algorithms_irods) > 1 or algorithm not in algorithms_local:
+            problem = "checksum algorithm mismatch %s vs %s" % (
+                ",".join(algorithms_local),
+                ", ".join(sorted(algorithms_irods)),
+            )
+            logger.error(
+                "local manifest uses %s but irods checksums use %s, set RODEOS_HASHDEEP_ALGO "
+                "accordingly" % (",".join(algorithms_local), ", ".join(sorted(algorithms_irods)))
+            )
+            raise RuntimeError("Difference in manifests: %s" % problem)
+        column = algorithms_local.index(algorithm)
+        for size, chksums, path in iter_records(buf, len(algorithms_local)):
+            store.add("local", path, int(size), chksums.split(b",")[column].lower())
+
+    if skip_tree_digests:
+        for path in store.paths_with_checksum_prefix("local", TREE_PREFIX.encode("ascii")):
+            record_irods = store.get("irods", path)
+            if record_irods:
+                store.set_checksum("local", path, record_irods[1])
+    else:
+        _verify_tree_digests(logger, os.path.dirname(path_local), algorithm, store)
+
+
+def manifest_names() -> typing.Tuple[str, ...]:
+    """Return the names of the manifest files, including the compressed variants."""
+    return tuple(
+        name + suffix
+        for name in (MANIFEST_LOCAL, MANIFEST_IRODS)
+        for suffix in ("",) + tuple(COMPRESSION_SUFFIXES.values())
+    )
+
+
+def _put_manifest(session, local_path, dest_path):
+    """Put the manifest file at ``local_path`` to ``dest_path`` and compute its checksum.
+
+    With ``RODEOS_MANIFEST_COMPRESSION``, the compressed manifest is uploaded instead and the
+    destination name gets the corresponding suffix.
+    """
+    if MANIFEST_COMPRESSION:
+        suffix = COMPRESSION_SUFFIXES[MANIFEST_COMPRESSION]
+        compress_manifest(local_path, local_path + suffix, MANIFEST_COMPRESSION)
+        try:
+            session.data_objects.put(local_path + suffix, dest_path + suffix)
+        finally:
+            os.remove(local_path + suffix)
+        run_ichksum(dest_path + suffix)
+    else:
+        session.data_objects.put(local_path, dest_path)
+        run_ichksum(dest_path)
+
+
+def _move_to_ingested(logger, src_folder):
+    """Move ``src_folder`` to the "ingested" area if configured to do so.
+
+    When the "ingested" area is on another file system, the files are copied and verified
+    against the local manifest, see ``move_tree()``.
+    """
+    if MOVE_AFTER_INGEST:
+        new_src_folder = to_ingested_path(src_folder)
+        logger.info("attempting move %s => %s" % (src_folder, new_src_folder))
+        try:
+            new_src_folder.parent.mkdir(exist_ok=True)
+            move_tree(
+                logger,
+                str(src_folder),
+                str(new_src_folder),
+                os.path.join(src_folder, MANIFEST_LOCAL),
+                MOVE_THREADS,
+            )
+        except (OSError, MoveVerificationError) as e:  # pragma: no cover
+            logger.error("could not move to ingested: %s" % e)
+    else:
+        logger.info("configured to not move %s" % src_folder)
+
+
+def _bundle_run_folder(logger, session, src_folder, dst_collection, bundle_dirs) -> None:
+    """Bundle the ``bundle_dirs`` of ``src_folder`` into archives and upload them.
+
+    The archives are built in ``RODEOS_BUNDLE_STAGING_DIR`` and removed after the upload.  The
+    member digests in the index must be comparable to the iRODS checksums, so the archive is
+    created again if the iRODS checksum of the uploaded archive uses another algorithm.  Otherwise,
+    the iRODS checksum must equal the digest of the archive computed while writing it.  The
+    position of each archive's index is stored in the AVUs of the data object.
+    """
+    from irods.keywords import FORCE_FLAG_KW
+    from irods.meta import iRODSMeta
+
+    algorithm = get_algorithm(HASHDEEP_ALGO.split(",")[0])
+    for name in bundle_dirs:
+        if not os.path.isdir(os.path.join(src_folder, name)):
+            continue
+        dest_path = "%s/%s" % (dst_collection.path, bundle_name(name))
+        while True:
+            bundle = create_bundle(src_folder, name, algorithm, BUNDLE_STAGING_DIR or None)
+            logger.info("bundled %d files into %s" % (len(bundle.members), bundle.path))
+            try:
+                session.data_objects.put(bundle.path, dest_path, **{FORCE_FLAG_KW: ""})
+            finally:
+                os.remove(bundle.path)
+            run_ichksum(dest_path)
+            obj = session.data_objects.get(dest_path)
+            irods_algorithm = _irods_checksum_algorithm((obj.checksum or "").encode("ascii"))
+            if irods_algorithm == algorithm.name:
+                _, irods_digest = parse_irods_checksum(obj.checksum.encode("ascii"))
+                if irods_digest.decode("ascii") != bundle.digest:
+                    raise RuntimeError(
+                        "checksum mismatch %s vs %s for %s"
+                        % (bundle.digest, irods_digest.decode("ascii"), dest_path)
+                    )
+                break
+            logger.info("iRODS checksums use %s, bundling again" % irods_algorithm)
+            algorithm = get_algorithm(irods_algorithm)
+        obj.metadata[KEY_INDEX_OFFSET] = iRODSMeta(KEY_INDEX_OFFSET, str(bundle.index_offset), "")
+        obj.metadata[KEY_INDEX_SIZE] = iRODSMeta(KEY_INDEX_SIZE, str(bundle.index_size), "")
+
+
+def _check_lease(lease: typing.Optional[Lease]) -> None:
+    """Raise ``LeaseLost`` if ``lease`` is given and no longer held."""
+    if lease is not None:
+        lease.check()
+
+
+async def _finalize_run_folder(
+    pipeline,
+    logger,
+    session,
+    src_folder,
+    dst_collection,
+    chunked_hashing_threshold,
+    bundle_dirs=(),
+    lease=None,
+):
+    """Compute and compare the manifests, upload them, and move the run folder.
+
+    The ``bundle_dirs`` are bundled and uploaded first.  Hashing the local files and building the
+    iRODS manifest (after ``ichksum -r``) are independent and run concurrently, as do the uploads
+    of the two manifest files.  The ``lease``, if any, is checked before each step that changes
+    iRODS or the source folder.
+    """
+    from irods.meta import iRODSMeta
+
+    if bundle_dirs:
+        _check_lease(lease)
+        await pipeline.stage(
+            "bundle", _bundle_run_folder, logger, session, src_folder, dst_collection, bundle_dirs
+        )
+
+    async def _irods_side():
+        await pipeline.stage("ichksum", run_ichksum, dst_collection.path, recurse=True)
+        return await pipeline.stage(
+            "irods_manifest", compute_irods_manifest, dst_collection, logger, src_folder
+        )
+
+    local_path, irods_path = await pipeline.gather(
+        pipeline.stage(
+            "local_manifest",
+            compute_local_manifest,
+            logger,
+            src_folder,
+            chunked_hashing_threshold=chunked_hashing_threshold,
+        ),
+        _irods_side(),
+    )
+    # Compare the manifest files.
+    try:
+        await pipeline.stage("compare", _compare_manifests, local_path, irods_path, logger)
+    except RuntimeError as e:  # pragma: no cover
+        _check_lease(lease)
+        dst_collection.metadata[KEY_MANIFEST_STATUS] = iRODSMeta(KEY_MANIFEST_STATUS, "failed", "")
+        dst_collection.metadata[KEY_MANIFEST_MESSAGE] = iRODSMeta(KEY_MANIFEST_MESSAGE, str(e), "")
+        raise
+    else:
+        _check_lease(lease)
+        dst_collection.metadata[KEY_MANIFEST_STATUS] = iRODSMeta(KEY_MANIFEST_STATUS, "success", "")
+        dst_collection.metadata[KEY_MANIFEST_MESSAGE] = iRODSMeta(
+            KEY_MANIFEST_MESSAGE, "all good", ""
+        )
+    # Put local hashdeep manifest and manifest built from irods.
+    _check_lease(lease)
+    await pipeline.gather(
+        pipeline.stage(
+            "put_local_manifest",
+            _put_manifest,
+            session,
+            local_path,
+            os.path.join(dst_collection.path, MANIFEST_LOCAL),
+        ),
+        pipeline.stage(
+            "put_irods_manifest",
+            _put_manifest,
+            session,
+            irods_path,
+            os.path.join(dst_collection.path, MANIFEST_IRODS),
+        ),
+    )
+    # Move folder.
+    _check_lease(lease)
+    await pipeline.stage("move", _move_to_ingested, logger, src_folder)
+
+
+def _move_interrupted(src_folder: pathlib.Path, dst_collection) -> bool:
+    """Return whether moving ``src_folder`` to the "ingested" area was interrupted.
+
+    This is the case if the progress file of ``move_tree()`` exists in the destination and the
+    manifests were compared successfully before.
+    """
+    if not MOVE_AFTER_INGEST or not (to_ingested_path(src_folder) / PROGRESS_NAME).exists():
+        return False
+    return any(
+        meta.value == "success" for meta in dst_collection.metadata.get_all(KEY_MANIFEST_STATUS)
+    )
+
+
+async def _resume_move(pipeline, logger, src_folder, lease=None):
+    """Resume the interrupted move of ``src_folder`` without computing the manifests again."""
+    logger.info("resuming interrupted move of %s" % src_folder)
+    _check_lease(lease)
+    await pipeline.stage("move", _move_to_ingested, logger, src_folder)
+
+
 def _post_job_run_folder_done(
     logger,
     session,
@@ -113,12 +463,26 @@ def _post_job_run_folder_done(
     dst_collection,
     is_folder_done: typing.Callable[[typing.Union[pathlib.Path, str]], bool],
     delay_until_at_rest,
+    chunked_hashing_threshold: int = 0,
+    bundle_dirs: typing.Sequence[str] = (),
+    lease: typing.Optional[Lease] = None,
 ):
     """Handle run folder being done:
 
+    - Bundle the ``bundle_dirs``, if any, see ``rodeos_ingest.bundle``.
     - Move into ingested folder on source.
     - Update status meta data in destination collection.
+
+    An interrupted move into the ingested folder is resumed directly, see
+    ``_move_interrupted()``.
+
+    If a ``lease`` is given, the run folder is only finalized while holding it and skipped if
+    another worker holds it.  Finalizing stops before the next step that changes iRODS or the
+    source folder if the lease is lost meanwhile.  Return whether the run folder was finalized.
     """
+    import dateutil.parser
+    from irods.meta import iRODSMeta
+
     src_folder = pathlib.Path(src_folder)
     # Get "last updated" time from meta data.
     last_update = None
@@ -131,77 +495,107 @@ def _post_job_run_folder_done(
     # Do not proceed if not marked as done.
     if not is_folder_done(src_folder):  # pragma: no cover
         logger.info("folder %s is not marked as done" % src_folder)
-        return
+        return False
     # Compute and check manifest and move if data is considered at rest.
     if last_update_age >= delay_until_at_rest:
         logger.info(
             "age of last update of %s is %s (<%s) -- will finalize (manifest+move)"
             % (dst_collection.path, last_update_age, delay_until_at_rest)
         )
-        run_ichksum(dst_collection.path, recurse=True)
-        local_path = compute_local_manifest(logger, src_folder)
-        irods_path = compute_irods_manifest(dst_collection, logger, src_folder)
-        # Compare the manifest files.
-        try:
-            _compare_manifests(local_path, irods_path, logger)
-        except RuntimeError as e:  # pragma: no cover
-            dst_collection.metadata[KEY_MANIFEST_STATUS] = iRODSMeta(
-                KEY_MANIFEST_STATUS, "failed", ""
+        with lease.held(logger) if lease else nullcontext(True) as acquired:
+            if not acquired:
+                logger.info("%s is being finalized by another worker -- skipping" % src_folder)
+                return False
+            if not src_folder.exists():
+                logger.info("%s was finalized by another worker -- skipping" % src_folder)
+                return False
+            pipeline = Pipeline(
+                logger,
+                timeouts=parse_timeouts(FINALIZE_STAGE_TIMEOUTS),
+                default_timeout=FINALIZE_STAGE_TIMEOUT_SECONDS,
             )
-            dst_collection.metadata[KEY_MANIFEST_MESSAGE] = iRODSMeta(
-                KEY_MANIFEST_MESSAGE, str(e), ""
-            )
-            raise
-        else:
-            dst_collection.metadata[KEY_MANIFEST_STATUS] = iRODSMeta(
-                KEY_MANIFEST_STATUS, "success", ""
-            )
-            dst_collection.metadata[KEY_MANIFEST_MESSAGE] = iRODSMeta(
-                KEY_MANIFEST_MESSAGE, "all good", ""
-            )
-        # Put local hashdeep manifest.
-        local_manifest_dest = os.path.join(dst_collection.path, MANIFEST_LOCAL)
-        session.data_objects.put(local_path, local_manifest_dest)
-        run_ichksum(local_manifest_dest)
-        # Put manifest built from irods.
-        irods_manifest_dest = os.path.join(dst_collection.path, MANIFEST_IRODS)
-        session.data_objects.put(irods_path, irods_manifest_dest)
-        run_ichksum(irods_manifest_dest)
-        # Move folder.
-        if MOVE_AFTER_INGEST:
-            new_src_folder = to_ingested_path(src_folder)
-            logger.info("attempting move %s => %s" % (src_folder, new_src_folder))
+            monitor = MemoryMonitor()
             try:
-                new_src_folder.parent.mkdir(exist_ok=True)
-                src_folder.rename(new_src_folder)
-            except OSError as e:  # pragma: no cover
-                logger.error("could not move to ingested: %s" % e)
-        else:
-            logger.info("configured to not move %s" % src_folder)
-        # Update ``status`` meta data.
-        dst_collection.metadata[KEY_STATUS] = iRODSMeta(KEY_STATUS, "complete", "")
+                with monitor, profile_section("finalize", 1.0):
+                    if _move_interrupted(src_folder, dst_collection):
+                        pipeline.run(_resume_move(pipeline, logger, src_folder, lease))
+                    else:
+                        pipeline.run(
+                            _finalize_run_folder(
+                                pipeline,
+                                logger,
+                                session,
+                                src_folder,
+                                dst_collection,
+                                chunked_hashing_threshold,
+                                bundle_dirs,
+                                lease,
+                            )
+                        )
+                # Update ``status`` meta data.
+                _check_lease(lease)
+                dst_collection.metadata[KEY_STATUS] = iRODSMeta(KEY_STATUS, "complete", "")
+            except LeaseLost as e:
+                logger.warning("stopped finalizing %s: %s" % (src_folder, e))
+                return False
+            finally:
+                # Another worker may be finalizing the run folder now.
+                if not (lease and lease.lost):
+                    durations = pipeline.durations.items()
+                    apply_metrics(
+                        dst_collection,
+                        {"finalize::%s" % name: value for name, value in durations},
+                        "s",
+                    )
+                    apply_metrics(dst_collection, monitor.metrics(), "bytes")
+                for stat in monitor.top():
+                    logger.info("finalize allocations: %s" % stat)
+            return True
     else:
         logger.info(
             "age of last update of %s is %s (<%s) -- not moving to ingested"
             % (dst_collection.path, last_update_age, delay_until_at_rest)
         )
+        return False
+
+
+def _read_bundle_index(dst_collection, src_folder, rel_path: str):
+    """Return the index of the bundle at ``rel_path``, from ``src_folder`` if still present."""
+    local_path = os.path.join(src_folder, rel_path)
+    if os.path.exists(local_path):
+        with open(local_path, "rb") as inputf:
+            return read_index(inputf)
+    else:  # pragma: no cover
+        session = dst_collection.manager.sess
+        obj = session.data_objects.get(dst_collection.path + rel_path[1:])
+        with obj.open("r") as inputf:
+            return read_index(
+                inputf,
+                int(obj.metadata.get_one(KEY_INDEX_OFFSET).value),
+                int(obj.metadata.get_one(KEY_INDEX_SIZE).value),
+            )
 
 
 def compute_irods_manifest(dst_collection, logger, src_folder):
-    """Compute manifest from irods checksums."""
+    """Compute manifest from irods checksums.
+
+    Records for the members of bundle archives are added from the archives' indices, in the
+    format of the iRODS checksums.
+    """
     logger.info("pull irods checksums into manifest")
+    require_tools(["iquest"], logger)
     irods_path = os.path.join(src_folder, MANIFEST_IRODS)
     try:
-        with tempfile.TemporaryFile("w+t") as tmp_f:
+        with tempfile.NamedTemporaryFile("w+t") as tmp_f:
             # Obtain information for files directly in destination collection.
             cmd = [
                 "iquest",
                 "%d,%s,%s/%s",
-                (
-                    "SELECT DATA_SIZE, DATA_CHECKSUM, COLL_NAME, DATA_NAME "
-                    "WHERE COLL_NAME = '%s' AND DATA_NAME != '%s' AND DATA_NAME != '%s'"
-                )
-                % (dst_collection.path, MANIFEST_LOCAL, MANIFEST_IRODS),
+                "SELECT DATA_SIZE, DATA_CHECKSUM, COLL_NAME, DATA_NAME WHERE COLL_NAME = '%s'%s"
+                % (
+                    dst_collection.path,
+                    "".join(" AND DATA_NAME != '%s'" % name for name in manifest_names()),
+                ),
             ]
             subprocess.run(cmd, stdout=tmp_f, encoding="utf-8", check=True)  # nosec
             # Obtain information for files destination subcollections.
@@ -215,17 +609,28 @@ def compute_irods_manifest(dst_collection, logger, src_folder):
                 % dst_collection.path,
             ]
             subprocess.run(cmd_sub, stdout=tmp_f, encoding="utf-8", check=True)  # nosec
-            # Copy to final output file.
+            # Copy to final output file, ``CAT_NO_ROWS_FOUND`` lines are skipped by the parser.
             tmp_f.flush()
-            tmp_f.seek(0)
-            with open(irods_path, "wt") as chk_f:
-                for line in tmp_f:
-                    line = line.strip()
-                    if line.startswith("CAT_NO_ROWS_FOUND"):
-                        continue
-                    size, chksum, path = line.split(",", 2)
-                    path = ".%s" % path[len(dst_collection.path) :]
-                    print(",".join([size, chksum, path]), file=chk_f)
+            prefix_len = len(os.fsencode(dst_collection.path))
+            with mapped(tmp_f.name) as buf, open(irods_path, "wb") as chk_f:
+                records = iter_records(buf)
+                first = next(records, None)
+                algorithm = HASHDEEP_ALGO.split(",")[0]
+                # Write header with the algorithm tag, as in ``hashdeep`` output.
+                chk_f.write(b"%%%% IRODS-MANIFEST-1.0\n")
+                if first:
+                    algorithm = _irods_checksum_algorithm(first[1])
+                    chk_f.write(b"%%%%%%%% size,%s,filename\n" % algorithm.encode("ascii"))
+                    records = itertools.chain([first], records)
+                chk_f.writelines(
+                    b"%s,%s,.%s\n" % (size, chksum, path[prefix_len:])
+                    for size, chksum, path in records
+                )
+            expand_manifest(
+                irods_path,
+                lambda rel_path: _read_bundle_index(dst_collection, src_folder, rel_path),
+                algorithm,
+            )
 
     except subprocess.CalledProcessError as e:  # pragma: no cover
         logger.warn("Creation of iRODS manifest failed, aborting: %s" % e)
@@ -234,40 +639,94 @@ def compute_irods_manifest(dst_collection, logger, src_folder):
     return irods_path
 
 
-def compute_local_manifest(logger, src_folder):
-    """Compute local hashdeep manifest."""
+def _iquest(fmt: str, query: str) -> typing.List[str]:
+    """Run ``iquest`` and return output lines, skipping ``CAT_NO_ROWS_FOUND``."""
+    require_tools(["iquest"])
+    output = subprocess.run(  # nosec
+        ["iquest", fmt, query], stdout=subprocess.PIPE, encoding="utf-8", check=True
+    ).stdout
+    return [line for line in output.splitlines() if line and "CAT_NO_ROWS_FOUND" not in line]
+
+
+def _irods_checksum_algorithm(chksum: bytes) -> str:
+    """Return algorithm name for iRODS checksum ``chksum``, default to first ``HASHDEEP_ALGO``."""
+    default = HASHDEEP_ALGO.split(",")[0]
+    try:
+        return parse_irods_checksum(chksum)[0] if chksum else default
+    except UnknownDigestAlgorithm:  # pragma: no cover
+        return default
+
+
+def _run_hashdeep(src_folder, chk_f, threads: int = HASHDEEP_THREADS):
+    """Write ``hashdeep`` manifest of ``src_folder`` to ``chk_f``."""
+    require_tools(["find", "hashdeep"])
+    cmd_find = ["find", ".", "-type", "f"]
+    for name in manifest_names():
+        cmd_find += ["-and", "-not", "-path", "./%s" % name]
+    p_find = subprocess.Popen(cmd_find, cwd=src_folder, stdout=subprocess.PIPE,)  # nosec
+    subprocess.run(  # nosec
+        ["hashdeep", "-c", HASHDEEP_ALGO, "-f", "/dev/stdin", "-j", str(threads),],
+        cwd=src_folder,
+        stdin=p_find.stdout,
+        stdout=chk_f,
+        encoding="utf-8",
+        check=True,
+    )
+    if p_find.wait() != 0:  # pragma: no cover
+        raise subprocess.CalledProcessError(
+            cmd_find, "Problem running find: %s" % p_find.returncode
+        )
+
+
+def compute_local_manifest(logger, src_folder, chunked_hashing_threshold: int = 0):
+    """Compute local hashdeep manifest.
+
+    Uses ``hashdeep`` unless ``RODEOS_MANIFEST_ENGINE`` is ``python`` or one of the configured
+    algorithms is not supported by ``hashdeep``.  Several comma-separated algorithms are computed
+    from a single read of each file in both cases and written as separate columns.
+
+    Files of at least ``chunked_hashing_threshold`` bytes (if non-zero) are hashed in chunks of
+    ``RODEOS_CHUNKED_HASHING_CHUNK_SIZE`` in parallel using the ``python`` engine.  The same
+    holds when reads are limited through the ``RODEOS_HASHING_*`` settings.
+
+    The number of threads is looked up for the mount point of ``src_folder`` in
+    ``RODEOS_HASHING_TUNING_FILE`` and adjusted at runtime with ``RODEOS_HASHING_AUTOTUNE``.
+    Digests are reused from and stored to the hash cache ``RODEOS_HASH_CACHE`` if configured.
+    """
     local_path = os.path.join(src_folder, MANIFEST_LOCAL)
     logger.info("compute checksums and store to %s" % local_path)
+    algorithms = get_algorithms(HASHDEEP_ALGO)
+    governor = _hashing_governor()
+    threads = threads_for(src_folder, HASHING_TUNING_FILE, HASHDEEP_THREADS)
+    controller = (
+        ConcurrencyController(threads, maximum=HASHING_MAX_THREADS) if HASHING_AUTOTUNE else None
+    )
+    cache = open_hash_cache()
     try:
-        with open(local_path, "wt") as chk_f:
-            cmd_find = [
-                "find",
-                ".",
-                "-type",
-                "f",
-                "-and",
-                "-not",
-                "-path",
-                "./%s" % MANIFEST_LOCAL,
-                "-and",
-                "-not",
-                "-path",
-                "./%s" % MANIFEST_IRODS,
-            ]
-            p_find = subprocess.Popen(cmd_find, cwd=src_folder, stdout=subprocess.PIPE,)  # nosec
-            subprocess.run(  # nosec
-                ["hashdeep", "-c", HASHDEEP_ALGO, "-f", "/dev/stdin", "-j", str(HASHDEEP_THREADS),],
-                cwd=src_folder,
-                stdin=p_find.stdout,
-                stdout=chk_f,
-                encoding="utf-8",
-                check=True,
-            )
-            if p_find.wait() != 0:  # pragma: no cover
-                raise subprocess.CalledProcessError(
-                    cmd_find, "Problem running find: %s" % p_find.returncode
+        with open(local_path, "wb") as chk_f:
+            if (
+                MANIFEST_ENGINE == "python"
+                or chunked_hashing_threshold
+                or governor
+                or controller
+                or cache
+                or not all(a.hashdeep for a in algorithms)
+            ):
+                write_manifest(
+                    src_folder,
+                    chk_f,
+                    algorithms,
+                    threads,
+                    manifest_names(),
+                    chunk_threshold=chunked_hashing_threshold,
+                    chunk_size=CHUNKED_HASHING_CHUNK_SIZE,
+                    governor=governor,
+                    controller=controller,
+                    cache=cache,
                 )
-    except subprocess.CalledProcessError as e:  # pragma: no cover
+            else:
+                _run_hashdeep(src_folder, chk_f, threads)
+    except (OSError, subprocess.CalledProcessError) as e:  # pragma: no cover
         logger.warn("Computing checksums failed, aborting: %s" % e)
         os.remove(local_path)
         raise
@@ -275,7 +734,13 @@ def compute_local_manifest(logger, src_folder):
 
 
 def pre_job(hdlr_mod, logger, meta):
-    """Set the ``first_seen`` meta data value."""
+    """Set the ``first_seen`` meta data value.
+
+    The required external tools are checked on the first call in each worker process.
+    """
+    from irods.meta import iRODSMeta
+
+    startup_check(logger)
     src_root = pathlib.Path(meta["root"])
     with cleanuping(irods_session(handler_module=hdlr_mod, meta=meta, logger=logger)) as session:
         dst_root = session.collections.get(meta["target"])
@@ -297,14 +762,24 @@ def post_job(
     meta,
     is_folder_done: typing.Callable[[typing.Union[pathlib.Path, str]], bool],
     delay_until_at_rest,
+    chunked_hashing_threshold: int = 0,
+    bundle_dirs: typing.Sequence[str] = (),
 ):
-    """Move completed run folders into the "ingested" area."""
+    """Move completed run folders into the "ingested" area.
+
+    Files of at least ``chunked_hashing_threshold`` bytes (if non-zero) are hashed in parallel
+    chunks for the local manifest.  The ``bundle_dirs`` of each run folder are bundled into
+    archives before.
+    """
     src_root = pathlib.Path(meta["root"])
     with cleanuping(irods_session(handler_module=hdlr_mod, meta=meta, logger=logger)) as session:
         dst_root = session.collections.get(meta["target"])
         dst_collections = {c.name: c for c in dst_root.subcollections}
         for src_folder in sorted([f.name for f in sorted(src_root.iterdir())]):
-            if src_folder in dst_collections:
+            journal = get_journal(src_root / src_folder)
+            if journal is not None and journal.is_done() is False:
+                logger.info("Skipping %s post-job as change journal marks it not done" % src_folder)
+            elif src_folder in dst_collections:
                 _post_job_run_folder_done(
                     logger,
                     session,
@@ -312,13 +787,21 @@ def post_job(
                     dst_collections[src_folder],
                     is_folder_done,
                     delay_until_at_rest,
+                    chunked_hashing_threshold,
+                    bundle_dirs,
+                    open_lease(meta, "finalize:%s" % dst_collections[src_folder].path),
                 )
             else:
                 logger.info("Skipping %s post-job as it corresponds to no destination collection" % src_folder)
 
 
-def refresh_last_update_metadata(logger, session, meta):
-    """Update the ``last_update`` and ``status`` meta data value."""
+def refresh_last_update_metadata(logger, session, meta, cleanup: bool = True):
+    """Update the ``last_update`` and ``status`` meta data value.
+
+    The ``session`` is cleaned up afterwards unless ``cleanup`` is ``False``.
+    """
+    from irods.meta import iRODSMeta
+
     _ = logger
     # Get path in irods that corresponds to root and update the meta data there.
     path = pathlib.Path(meta["path"])
@@ -332,18 +815,27 @@ def refresh_last_update_metadata(logger, session, meta):
     print("... %s" % rel_folder_path)
     root_target = str(target)[: -(len(str(rel_folder_path)) + 1)]
     print("... %s" % root_target)
-    with cleanuping(session) as wrapped_session:
-        coll = wrapped_session.collections.get(root_target)
+    try:
+        coll = session.collections.get(root_target)
         # Replace ``last_update`` and ``status`` meta data.
         coll.metadata[KEY_LAST_UPDATE] = iRODSMeta(
             KEY_LAST_UPDATE, datetime.datetime.now().isoformat(), ""
         )
         coll.metadata[KEY_STATUS] = iRODSMeta(KEY_STATUS, "running", "")
+    finally:
+        if cleanup:
+            session.cleanup()
 
 
-def run_ichksum(irods_path: str, recurse: bool = False) -> None:
-    """Run ``ichksum $irods_path``."""
-    args = ["ichksum", irods_path]
+def run_ichksum(
+    irods_path: typing.Union[str, typing.Sequence[str]], recurse: bool = False
+) -> None:
+    """Run ``ichksum $irods_path``, ``irods_path`` can also be a sequence of paths."""
+    require_tools(["ichksum"])
+    if isinstance(irods_path, str):
+        args = ["ichksum", irods_path]
+    else:
+        args = ["ichksum", *irods_path]
     if recurse:
         args.insert(1, "-r")
     subprocess.run(args, check=True)
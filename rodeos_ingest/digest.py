@@ -0,0 +1,189 @@
+"""Digest algorithms used for the manifest files.
+
+Each supported algorithm is described by a ``DigestAlgorithm`` object and registered in
+``ALGORITHMS`` under the name that is also used in the ``%%%% size,<algorithm>,filename`` header
+lines of the manifest files (following the naming of ``hashdeep``).
+
+The algorithms that iRODS can compute natively (``md5``, ``sha1``, ``sha256``, ``sha512``) also
+know the prefix that iRODS uses for them in ``DATA_CHECKSUM`` (e.g., ``sha2:`` followed by the
+base64 encoded digest for SHA-256).  Use ``parse_irods_checksum()`` to normalise such values to
+hex digests.
+
+Fast non-cryptographic hashes (``xxh64`` through the optional ``xxhash`` module) are available
+for pre-screening only, they cannot be verified against iRODS checksums.
+
+Very large files can be hashed in parallel with ``hash_file_chunked()``.  The file is split into
+chunks of fixed size that are hashed independently, the resulting tree digest is the digest of
+the concatenated binary chunk digests.  It is written to manifests with the ``tree:`` prefix and
+does not equal the whole-file digest that iRODS computes.
+"""
+
+import base64
+from concurrent.futures import Executor
+import hashlib
+import os
+import typing
+
+import attr
+
+from rodeos_ingest.throttle import IOGovernor
+
+try:
+    import xxhash
+except ImportError:  # pragma: no cover
+    xxhash = None
+
+#: Size of blocks to read files in.
+BLOCK_SIZE = 1024 * 1024
+#: Prefix of tree digests in manifest files.
+TREE_PREFIX = "tree:"
+
+
+class UnknownDigestAlgorithm(ValueError):
+    """Raised when a digest algorithm is not known or not available."""
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class DigestAlgorithm:
+    """Description of a digest algorithm."""
+
+    #: Name of the algorithm in manifest headers.
+    name: str
+    #: Callable returning a new ``hashlib``-like object.
+    factory: typing.Callable[[], typing.Any]
+    #: Whether the algorithm is a cryptographic hash.
+    cryptographic: bool = True
+    #: Whether ``hashdeep`` supports the algorithm.
+    hashdeep: bool = False
+    #: Prefix used in iRODS ``DATA_CHECKSUM`` values, ``""`` for plain hex, ``None`` for not
+    #: supported by iRODS.
+    irods_prefix: typing.Optional[str] = None
+
+    def new(self):
+        """Return new hash object."""
+        return self.factory()
+
+
+#: The registered digest algorithms by name.
+ALGORITHMS: typing.Dict[str, DigestAlgorithm] = {}
+
+
+def register_algorithm(algorithm: DigestAlgorithm) -> DigestAlgorithm:
+    """Register ``algorithm`` in ``ALGORITHMS``."""
+    ALGORITHMS[algorithm.name] = algorithm
+    return algorithm
+
+
+register_algorithm(DigestAlgorithm("md5", hashlib.md5, hashdeep=True, irods_prefix=""))
+register_algorithm(DigestAlgorithm("sha1", hashlib.sha1, hashdeep=True, irods_prefix="sha1:"))
+register_algorithm(DigestAlgorithm("sha256", hashlib.sha256, hashdeep=True, irods_prefix="sha2:"))
+register_algorithm(DigestAlgorithm("sha512", hashlib.sha512, irods_prefix="sha512:"))
+register_algorithm(DigestAlgorithm("blake2b", hashlib.blake2b))
+if xxhash is not None:  # pragma: no branch
+    register_algorithm(DigestAlgorithm("xxh64", xxhash.xxh64, cryptographic=False))
+
+
+def get_algorithm(name: str) -> DigestAlgorithm:
+    """Return the ``DigestAlgorithm`` with the given ``name``."""
+    try:
+        return ALGORITHMS[name.lower()]
+    except KeyError:
+        raise UnknownDigestAlgorithm(
+            "Unknown digest algorithm %s, known are: %s" % (name, ", ".join(sorted(ALGORITHMS)))
+        )
+
+
+def parse_irods_checksum(value: bytes) -> typing.Tuple[str, bytes]:
+    """Parse iRODS ``DATA_CHECKSUM`` value into pair of algorithm name and hex digest."""
+    if b":" not in value:
+        return "md5", value.lower()
+    prefix, _, encoded = value.partition(b":")
+    for algorithm in ALGORITHMS.values():
+        if algorithm.irods_prefix and algorithm.irods_prefix.encode() == prefix + b":":
+            return algorithm.name, base64.b64decode(encoded).hex().encode("ascii")
+    raise UnknownDigestAlgorithm("Unknown iRODS checksum scheme in %r" % value)
+
+
+def format_irods_checksum(name: str, hex_digest: str) -> str:
+    """Format ``hex_digest`` of algorithm ``name`` as iRODS ``DATA_CHECKSUM`` value."""
+    prefix = get_algorithm(name).irods_prefix
+    if prefix is None:
+        raise UnknownDigestAlgorithm("Digest algorithm %s is not supported by iRODS" % name)
+    elif not prefix:
+        return hex_digest
+    else:
+        return prefix + base64.b64encode(bytes.fromhex(hex_digest)).decode("ascii")
+
+
+def get_algorithms(spec: str) -> typing.List[DigestAlgorithm]:
+    """Return the ``DigestAlgorithm`` objects for comma-separated names in ``spec``."""
+    return [get_algorithm(name.strip()) for name in spec.split(",")]
+
+
+def _read(inputf: typing.BinaryIO, size: int, governor: typing.Optional[IOGovernor]) -> bytes:
+    """Read ``size`` bytes from ``inputf``, through ``governor`` if given."""
+    return governor.read(inputf, size) if governor else inputf.read(size)
+
+
+def hash_file(
+    path, algorithms: typing.Sequence[DigestAlgorithm], governor: typing.Optional[IOGovernor] = None
+) -> typing.List[str]:
+    """Compute hex digests of the file at ``path`` with all ``algorithms``.
+
+    The file is read only once and each block is fed to all hash objects.  Reads are limited by
+    ``governor`` if given.
+    """
+    hashers = [algorithm.new() for algorithm in algorithms]
+    with open(path, "rb") as inputf:
+        for block in iter(lambda: _read(inputf, BLOCK_SIZE, governor), b""):
+            for hasher in hashers:
+                hasher.update(block)
+    return [hasher.hexdigest() for hasher in hashers]
+
+
+def _hash_range(
+    path,
+    algorithms: typing.Sequence[DigestAlgorithm],
+    offset: int,
+    length: int,
+    governor: typing.Optional[IOGovernor] = None,
+) -> typing.List[bytes]:
+    """Compute binary digests of ``length`` bytes at ``offset`` of the file at ``path``."""
+    hashers = [algorithm.new() for algorithm in algorithms]
+    with open(path, "rb") as inputf:
+        inputf.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = _read(inputf, min(BLOCK_SIZE, remaining), governor)
+            if not block:  # pragma: no cover
+                break
+            remaining -= len(block)
+            for hasher in hashers:
+                hasher.update(block)
+    return [hasher.digest() for hasher in hashers]
+
+
+def hash_file_chunked(
+    path,
+    algorithms: typing.Sequence[DigestAlgorithm],
+    chunk_size: int,
+    executor: Executor,
+    governor: typing.Optional[IOGovernor] = None,
+) -> typing.List[typing.Tuple[str, typing.List[str]]]:
+    """Compute tree digests of the file at ``path`` with chunks hashed in parallel on ``executor``.
+
+    Return one pair of hex tree digest and list of hex chunk digests for each of ``algorithms``.
+    """
+    offsets = range(0, max(1, os.path.getsize(path)), chunk_size)
+    chunks = list(
+        executor.map(
+            lambda offset: _hash_range(path, algorithms, offset, chunk_size, governor), offsets
+        )
+    )
+    result = []
+    for i, algorithm in enumerate(algorithms):
+        tree = algorithm.new()
+        for chunk in chunks:
+            tree.update(chunk[i])
+        result.append((tree.hexdigest(), [chunk[i].hex() for chunk in chunks]))
+    return result
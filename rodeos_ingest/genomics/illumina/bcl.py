@@ -8,16 +8,20 @@
 - If the marker file for being done has been written out and ``rodeos::ingest::last_update``
   is longer than ``DELAY_UNTIL_AT_REST`` (e.g., 15 minutes) in the past then move away the
   run folder into the ingested part of the landing zone.
+- Files in ``RODEOS_ILLUMINA_BCL_BUNDLE_DIRS`` are not uploaded but bundled into one archive per
+  directory when the run folder is finalized.
+- Files are uploaded with a strategy depending on their size, see ``rodeos_ingest.upload``.
+- Meta data bearing files and done markers are routed to a separate queue, see
+  ``rodeos_ingest.routing``.
+- If ``RODEOS_ILLUMINA_BCL_BATCH_SMALL_FILES`` is set, the small files of each file task are
+  handled as a batch: ``rodeos::ingest::last_update`` is refreshed once per batch and their
+  checksums are computed by one ``ichksum`` call.
 """
 
 import datetime
 import pathlib
 import typing
 
-from irods.meta import iRODSMeta
-from irods_capability_automated_ingest.core import Core
-from irods_capability_automated_ingest.utils import Operation
-
 from rodeos_ingest.genomics.illumina.run_folder import (
     parse_runinfo_xml,
     parse_runparameters_xml,
@@ -26,6 +30,7 @@ from rodeos_ingest.genomics.illumina.run_folder import (
     RunInfo,
     NetcopyInfo,
 )
+from rodeos_ingest.bundle import is_bundled
 from rodeos_ingest.common import (
     cleanuping,
     pre_job as common_pre_job,
@@ -33,16 +38,36 @@ from rodeos_ingest.common import (
     refresh_last_update_metadata,
     run_ichksum,
 )
-from rodeos_ingest.settings import RODEOS_DELAY_UNTIL_AT_REST_SECONDS
-
+from rodeos_ingest.profiling import profiled
+from rodeos_ingest.routing import dispatch_metadata_files, is_rerouted, reroute
+from rodeos_ingest.trace import traced
+from rodeos_ingest.upload import SmallFileBatches, TieredUpload, checksum_deferred
+from rodeos_ingest.settings import (
+    RODEOS_DELAY_UNTIL_AT_REST_SECONDS,
+    RODEOS_ILLUMINA_BCL_BATCH_SMALL_FILES,
+    RODEOS_ILLUMINA_BCL_BUNDLE_DIRS,
+)
 
 #: This time should pass after the previous update and the existance of the output marker file
 #: for a run folder to be considered at rest and moved away.
 DELAY_UNTIL_AT_REST = datetime.timedelta(seconds=RODEOS_DELAY_UNTIL_AT_REST_SECONDS)
 
+#: Directories of the run folder to bundle instead of uploading their files.
+BUNDLE_DIRS = tuple(
+    name.strip() for name in RODEOS_ILLUMINA_BCL_BUNDLE_DIRS.split(",") if name.strip()
+)
+
+#: Whether small files of a file task are handled as a batch.
+BATCH_SMALL_FILES = RODEOS_ILLUMINA_BCL_BATCH_SMALL_FILES
+
+#: Batches of small files of this worker process.
+_BATCHES = SmallFileBatches()
+
 
 def apply_runinfo_metadata(session, run_info: RunInfo, target: str) -> None:
     """Apply ``RunInfo`` meta data to collection AVUs."""
+    from irods.meta import iRODSMeta
+
     target_coll = str(pathlib.Path(target).parent)
     with cleanuping(session):
         coll = session.collections.get(target_coll)
@@ -52,6 +77,8 @@ def apply_runinfo_metadata(session, run_info: RunInfo, target: str) -> None:
 
 def apply_runparameters_metadata(session, values: typing.Dict[str, str], target: str) -> None:
     """Apply ``runParameters.xml`` meta data to collection AVUs."""
+    from irods.meta import iRODSMeta
+
     target_coll = str(pathlib.Path(target).parent)
     with cleanuping(session):
         coll = session.collections.get(target_coll)
@@ -61,6 +88,8 @@ def apply_runparameters_metadata(session, values: typing.Dict[str, str], target:
 
 def apply_netcopy_complete_metadata(session, netcopy_info: NetcopyInfo, target: str) -> None:
     """Apply netcopy complete meta data to collection AVUs."""
+    from irods.meta import iRODSMeta
+
     with cleanuping(session):
         coll = session.data_objects.get(target)
         for avu in netcopy_info.to_avus():
@@ -84,6 +113,43 @@ def _post_runinfoxml_create_or_update(logger, session, meta):
             apply_netcopy_complete_metadata(session, netcopy_info, meta["target"])
 
 
+def _is_bundled(meta) -> bool:
+    """Return whether the file in ``meta`` is bundled instead of uploaded."""
+    if not BUNDLE_DIRS:
+        return False
+    rel_root_path = pathlib.Path(meta["path"]).relative_to(meta["root"])
+    return is_bundled(str(pathlib.Path(*rel_root_path.parts[1:])), BUNDLE_DIRS)
+
+
+def _post_data_obj_create_or_update(logger, session, meta):
+    """Apply run folder meta data, refresh ``last_update``, and compute the checksum."""
+    if is_rerouted(meta, is_metadata_file):
+        return
+    bundled = _is_bundled(meta)
+    if not bundled:
+        _post_runinfoxml_create_or_update(logger, session, meta)
+    if BATCH_SMALL_FILES and SmallFileBatches.key(meta):
+        first, complete = _BATCHES.add(meta, None if bundled else meta["target"])
+        if first:
+            refresh_last_update_metadata(logger, session, meta, cleanup=False)
+        if complete:
+            logger.info("computing checksums of batch of %d small files" % len(complete))
+            run_ichksum(complete)
+        return
+    refresh_last_update_metadata(logger, session, meta)
+    if not bundled and not checksum_deferred(meta):
+        run_ichksum(meta["target"])
+
+
+def is_metadata_file(name: str) -> bool:
+    """Return whether the file ``name`` carries run meta data or is a done marker."""
+    name = name.lower()
+    return (
+        name in ("runinfo.xml", "runparameters.xml", "rtacomplete.txt", "copycomplete.txt")
+        or "netcopy_complete" in name
+    )
+
+
 def is_runfolder_done(path: typing.Union[str, pathlib.Path]) -> bool:
     path = pathlib.Path(path)
     for name in ("RunParameters.xml", "runParameters.xml"):
@@ -95,23 +161,34 @@ def is_runfolder_done(path: typing.Union[str, pathlib.Path]) -> bool:
     return False  # pragma: no cover
 
 
-class event_handler(Core):
+@traced
+@profiled
+class event_handler(TieredUpload):
     @staticmethod
     def pre_job(hdlr_mod, logger, meta):
         """Set the ``first_seen`` meta data value."""
         common_pre_job(hdlr_mod, logger, meta)
-        common_post_job(hdlr_mod, logger, meta, is_runfolder_done, DELAY_UNTIL_AT_REST)
+        dispatch_metadata_files(logger, meta, is_metadata_file)
+        common_post_job(
+            hdlr_mod, logger, meta, is_runfolder_done, DELAY_UNTIL_AT_REST, bundle_dirs=BUNDLE_DIRS
+        )
 
     @staticmethod
     def post_job(hdlr_mod, logger, meta):
         """Move completed and at rest run folders into the "ingested" area."""
         _, _, _ = hdlr_mod, logger, meta
-        common_post_job(hdlr_mod, logger, meta, is_runfolder_done, DELAY_UNTIL_AT_REST)
+        common_post_job(
+            hdlr_mod, logger, meta, is_runfolder_done, DELAY_UNTIL_AT_REST, bundle_dirs=BUNDLE_DIRS
+        )
 
     @staticmethod
     def operation(session, meta, **options):
-        """Return ``Operation.PUT_SYNC`` to also put changed files."""
+        """Return ``Operation.PUT_SYNC`` to also put changed files, ``NO_OP`` for bundled ones."""
+        from irods_capability_automated_ingest.utils import Operation
+
         _, _, _ = session, meta, options
+        if _is_bundled(meta) or reroute(meta, is_metadata_file):
+            return Operation.NO_OP
         return Operation.PUT_SYNC
 
     @staticmethod
@@ -119,18 +196,14 @@ class event_handler(Core):
         """Update run folder meta data from ``RunInfo.xml`` and ``runParameters.xml`` files after
         initial upload and update."""
         _, _ = hdlr_mod, options
-        _post_runinfoxml_create_or_update(logger, session, meta)
-        refresh_last_update_metadata(logger, session, meta)
-        run_ichksum(meta["target"])
+        _post_data_obj_create_or_update(logger, session, meta)
 
     @staticmethod
     def post_data_obj_update(hdlr_mod, logger, session, meta, **options):
         """Update run folder meta data from ``RunInfo.xml`` and ``runParameters.xml`` files after
         initial upload and update."""
         _, _ = hdlr_mod, options
-        _post_runinfoxml_create_or_update(logger, session, meta)
-        refresh_last_update_metadata(logger, session, meta)
-        run_ichksum(meta["target"])
+        _post_data_obj_create_or_update(logger, session, meta)
 
     @staticmethod
     def delay(hdlr_mod, logger, meta, retries):
@@ -0,0 +1,244 @@
+"""Benchmark of parsing ``RunInfo.xml`` and ``runParameters.xml`` files per instrument type.
+
+The BCL handler parses these files and checks for the done markers of run folders in its hooks,
+so their latency adds to the per-file hook latency.  The benchmark times ``parse_runinfo_xml()``,
+``parse_runparameters_xml()``, and ``is_runfolder_done()`` on a corpus with one run folder per
+instrument in ``CORPUS``, once with the representative files from the corpus directory and once
+with synthetic large variants.  The large variants are padded with elements in front of the
+parsed elements (e.g., tile lists as found in NovaSeq ``RunInfo.xml`` files), so that searching
+them cannot stop early.
+
+The results can be appended to a history file (JSON lines) to track them over time.  With
+``--max-regression``, the benchmark fails if a case got slower than the same case in the last
+history entry by more than the given fraction.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import pathlib
+import platform
+import re
+import sys
+import tempfile
+import timeit
+import typing
+
+import attr
+
+from rodeos_ingest.genomics.illumina.bcl import is_runfolder_done
+from rodeos_ingest.genomics.illumina.run_folder import (
+    parse_runinfo_xml,
+    parse_runparameters_xml,
+    runparameters_to_marker_file,
+)
+
+#: Representative files by instrument, as instrument model and ``RunInfo.xml`` and
+#: ``runParameters.xml`` file names in the corpus directory.
+CORPUS = {
+    "A01077": ("NovaSeq 6000", "RunInfo-A01077.xml", "RunParameters-A01077.xml"),
+    "K00302": ("HiSeq 4000", "RunInfo-K00302.xml", "runParameters-K00302.xml"),
+    "M06205": ("MiSeq", "RunInfo-M06205.xml", "runParameters-M06205.xml"),
+    "MN00157": ("MiniSeq", "RunInfo-MN00157.xml", "RunParameters-MN00157.xml"),
+    "NB502131": ("NextSeq 500", "RunInfo-NB502131.xml", "RunParameters-NB502131.xml"),
+    "ST-K00106": ("HiSeq 4000", "RunInfo-ST-K00106.xml", "runParameters-ST-K00106.xml"),
+}
+
+#: Default corpus directory, relative to the source checkout.
+DEFAULT_CORPUS_DIR = "tests/data/run_folder"
+
+#: Default size of the synthetic large files in bytes.
+DEFAULT_LARGE_SIZE = 2 * 1024**2
+
+#: Padding element by file name, formatted with a running number.
+PADDING = {
+    "RunInfo.xml": "<Tile>%d_%04d</Tile>",
+    "RunParameters.xml": "<Consumable><SerialNumber>%d</SerialNumber><Id>%04d</Id></Consumable>",
+}
+
+#: Regular expression for the start tag of the root element.
+_ROOT_RE = re.compile(rb"<(RunInfo|RunParameters)\b[^>]*>")
+
+#: Benchmarked operations on a run folder.
+OPERATIONS: typing.Dict[str, typing.Callable[[pathlib.Path], typing.Any]] = {
+    "parse_runinfo_xml": lambda path: parse_runinfo_xml(str(path / "RunInfo.xml")),
+    "parse_runparameters_xml": lambda path: parse_runparameters_xml(path / "RunParameters.xml"),
+    "is_runfolder_done": is_runfolder_done,
+}
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class BenchmarkFolder:
+    """A run folder of the benchmark corpus."""
+
+    #: Instrument identifier, key in ``CORPUS``.
+    instrument: str
+    #: ``"representative"`` or ``"large"``.
+    variant: str
+    #: Path to the run folder.
+    path: pathlib.Path
+
+
+def pad_xml(data: bytes, padding: str, size: int) -> bytes:
+    """Return XML document ``data`` padded to at least ``size`` bytes.
+
+    The ``padding`` elements are inserted as the first children of the root element.
+    """
+    match = _ROOT_RE.search(data)
+    if not match:
+        raise ValueError("no RunInfo or RunParameters root element")
+    missing = size - len(data)
+    elements = []
+    count = 0
+    while missing > 0:
+        element = (padding % (count // 100 + 1, count % 100)).encode("ascii")
+        elements.append(element)
+        missing -= len(element)
+        count += 1
+    return data[: match.end()] + b"".join(elements) + data[match.end() :]
+
+
+def prepare_corpus(
+    corpus_dir: typing.Union[str, pathlib.Path],
+    work_dir: typing.Union[str, pathlib.Path],
+    large_size: int = DEFAULT_LARGE_SIZE,
+) -> typing.List[BenchmarkFolder]:
+    """Create the run folders of the benchmark in ``work_dir`` and return them.
+
+    Each run folder contains ``RunInfo.xml``, ``RunParameters.xml``, and the done markers of
+    its instrument type.
+    """
+    result = []
+    for instrument, (_, run_info, run_parameters) in CORPUS.items():
+        for variant in ("representative", "large"):
+            path = pathlib.Path(work_dir) / ("%s-%s" % (instrument, variant))
+            path.mkdir(parents=True, exist_ok=True)
+            for name, source in (("RunInfo.xml", run_info), ("RunParameters.xml", run_parameters)):
+                data = (pathlib.Path(corpus_dir) / source).read_bytes()
+                if variant == "large":
+                    data = pad_xml(data, PADDING[name], large_size)
+                (path / name).write_bytes(data)
+            markers = runparameters_to_marker_file(
+                parse_runparameters_xml(path / "RunParameters.xml"), path / "RunParameters.xml"
+            )
+            for marker in markers:
+                (path / marker).touch()
+            result.append(BenchmarkFolder(instrument, variant, path))
+    return result
+
+
+def run_benchmarks(
+    folders: typing.Iterable[BenchmarkFolder], repeat: int = 5, number: int = 0
+) -> typing.Dict[str, float]:
+    """Return the best seconds per call by case ``<instrument>/<variant>/<operation>``.
+
+    Each case is timed ``repeat`` times with ``number`` calls, ``0`` to pick ``number`` such
+    that a timing takes at least 0.2 seconds.
+    """
+    result = {}
+    for folder in folders:
+        for name, operation in OPERATIONS.items():
+            timer = timeit.Timer(lambda: operation(folder.path))
+            calls = number or timer.autorange()[0]
+            best = min(timer.repeat(repeat=repeat, number=calls))
+            result["%s/%s/%s" % (folder.instrument, folder.variant, name)] = best / calls
+    return result
+
+
+def read_history(
+    path: typing.Union[str, pathlib.Path],
+) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Return the entries of the history file at ``path``, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rt") as inputf:
+        return [json.loads(line) for line in inputf if line.strip()]
+
+
+def append_history(
+    path: typing.Union[str, pathlib.Path], results: typing.Dict[str, float], label: str = ""
+) -> None:
+    """Append ``results`` with time stamp, ``label``, and platform to the history at ``path``."""
+    entry = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "label": label,
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "results": results,
+    }
+    with open(path, "at") as outputf:
+        print(json.dumps(entry, sort_keys=True), file=outputf)
+
+
+def find_regressions(
+    previous: typing.Dict[str, float], current: typing.Dict[str, float], max_regression: float
+) -> typing.List[typing.Tuple[str, float, float]]:
+    """Return case, previous and current time of cases slower by more than ``max_regression``."""
+    return [
+        (case, previous[case], seconds)
+        for case, seconds in sorted(current.items())
+        if case in previous and seconds > previous[case] * (1.0 + max_regression)
+    ]
+
+
+def format_results(
+    results: typing.Dict[str, float], previous: typing.Optional[typing.Dict[str, float]] = None
+) -> str:
+    """Return table of ``results`` in microseconds per call, with change to ``previous``."""
+    previous = previous or {}
+    lines = ["case\tus_per_call\tchange"]
+    for case, seconds in sorted(results.items()):
+        if previous.get(case):
+            change = "%+.1f%%" % ((seconds / previous[case] - 1.0) * 100)
+        else:
+            change = "-"
+        lines.append("%s\t%.1f\t%s" % (case, seconds * 1e6, change))
+    return "\n".join(lines)
+
+
+def main(argv=None):  # pragma: no cover
+    """Entry point for ``rodeos-ingest-benchmark-xml``."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing of RunInfo.xml and runParameters.xml per instrument type"
+    )
+    parser.add_argument(
+        "--corpus", default=DEFAULT_CORPUS_DIR, help="directory with the files from CORPUS"
+    )
+    parser.add_argument(
+        "--large-size",
+        type=int,
+        default=DEFAULT_LARGE_SIZE,
+        help="size of the synthetic large files in bytes",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timings per case, best is used")
+    parser.add_argument(
+        "--number", type=int, default=0, help="calls per timing, 0 for at least 0.2 seconds"
+    )
+    parser.add_argument("--history", help="JSON lines file to compare with and append results to")
+    parser.add_argument("--label", default="", help="label of the history entry, e.g., a commit")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="fail if a case is slower than in the last history entry by this fraction, e.g., 0.2",
+    )
+    args = parser.parse_args(argv)
+
+    history = read_history(args.history) if args.history else []
+    previous = history[-1]["results"] if history else {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folders = prepare_corpus(args.corpus, tmp_dir, args.large_size)
+        results = run_benchmarks(folders, args.repeat, args.number)
+    print(format_results(results, previous))
+
+    regressions = []
+    if args.max_regression is not None:
+        regressions = find_regressions(previous, results, args.max_regression)
+        for case, before, after in regressions:
+            print(
+                "regression: %s %.1f -> %.1f us per call" % (case, before * 1e6, after * 1e6),
+                file=sys.stderr,
+            )
+    if args.history and not regressions:
+        append_history(args.history, results, args.label)
+    return 1 if regressions else 0
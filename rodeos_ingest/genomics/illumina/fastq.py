@@ -6,24 +6,38 @@
 - If the marker file for being done has been written out and ``rodeos::ingest::last_update``
   is longer than ``DELAY_UNTIL_AT_REST`` (e.g., 15 minutes) in the past then move away the
   run folder into the ingested part of the landing zone.
+- Files larger than ``RODEOS_ILLUMINA_FASTQ_CHUNKED_HASHING_THRESHOLD`` (if set) are hashed in
+  parallel chunks for the local manifest.
+- Files are uploaded with a strategy depending on their size, see ``rodeos_ingest.upload``.
+- The done marker is routed to a separate queue, see ``rodeos_ingest.routing``.
+- Files of at least ``RODEOS_ILLUMINA_FASTQ_SERVER_COPY_MIN_SIZE`` bytes (if set) that are
+  identical to data objects ingested before are copied on the server, see
+  ``rodeos_ingest.server_copy``.
 """
 
 import datetime
 import pathlib
 import typing
 
-from irods_capability_automated_ingest.core import Core
-from irods_capability_automated_ingest.utils import Operation
-
 from rodeos_ingest.common import (
+    open_hash_cache,
     pre_job as common_pre_job,
     post_job as common_post_job,
     refresh_last_update_metadata,
     run_ichksum,
 )
+from rodeos_ingest.digest import get_algorithm
+from rodeos_ingest.profiling import profiled
+from rodeos_ingest.routing import dispatch_metadata_files, is_rerouted, reroute
+from rodeos_ingest.server_copy import copy_on_server
+from rodeos_ingest.trace import traced
+from rodeos_ingest.upload import TieredUpload, checksum_deferred
 from rodeos_ingest.settings import (
     RODEOS_DELAY_UNTIL_AT_REST_SECONDS,
+    RODEOS_HASHDEEP_ALGO as HASHDEEP_ALGO,
+    RODEOS_ILLUMINA_FASTQ_CHUNKED_HASHING_THRESHOLD as CHUNKED_HASHING_THRESHOLD,
     RODEOS_ILLUMINA_FASTQ_DONE_MARKER_FILE as DONE_MARKER_FILE,
+    RODEOS_ILLUMINA_FASTQ_SERVER_COPY_MIN_SIZE as SERVER_COPY_MIN_SIZE,
 )
 
 #: This time should pass after the previous update and the existance of the output marker file
@@ -31,41 +45,82 @@ from rodeos_ingest.settings import (
 DELAY_UNTIL_AT_REST = datetime.timedelta(seconds=RODEOS_DELAY_UNTIL_AT_REST_SECONDS)
 
 
+def is_metadata_file(name: str) -> bool:
+    """Return whether the file ``name`` is the done marker."""
+    return name == DONE_MARKER_FILE
+
+
 def is_demuxfolder_done(path: typing.Union[str, pathlib.Path]) -> bool:
     path = pathlib.Path(path)
     return (path / DONE_MARKER_FILE).exists()
 
 
-class event_handler(Core):
+@traced
+@profiled
+class event_handler(TieredUpload):
     @staticmethod
     def pre_job(hdlr_mod, logger, meta):
         """Set the ``first_seen`` meta data value."""
         common_pre_job(hdlr_mod, logger, meta)
-        common_post_job(hdlr_mod, logger, meta, is_demuxfolder_done, DELAY_UNTIL_AT_REST)
+        dispatch_metadata_files(logger, meta, is_metadata_file)
+        common_post_job(
+            hdlr_mod,
+            logger,
+            meta,
+            is_demuxfolder_done,
+            DELAY_UNTIL_AT_REST,
+            CHUNKED_HASHING_THRESHOLD,
+        )
 
     @staticmethod
     def post_job(hdlr_mod, logger, meta):
         """Move completed and at rest run folders into the "ingested" area."""
         _, _, _ = hdlr_mod, logger, meta
-        common_post_job(hdlr_mod, logger, meta, is_demuxfolder_done, DELAY_UNTIL_AT_REST)
+        common_post_job(
+            hdlr_mod,
+            logger,
+            meta,
+            is_demuxfolder_done,
+            DELAY_UNTIL_AT_REST,
+            CHUNKED_HASHING_THRESHOLD,
+        )
 
     @staticmethod
     def operation(session, meta, **options):
-        """Return ``Operation.PUT_APPEND`` to only upload new data."""
+        """Return ``Operation.PUT_APPEND`` to only upload new data, ``NO_OP`` if rerouted."""
+        from irods_capability_automated_ingest.utils import Operation
+
         _, _, _ = session, meta, options
+        if reroute(meta, is_metadata_file):
+            return Operation.NO_OP
         return Operation.PUT_APPEND
 
+    @staticmethod
+    def copy_on_server(logger, session, meta) -> bool:
+        """Copy identical data objects ingested before on the server instead of uploading."""
+        if not SERVER_COPY_MIN_SIZE:
+            return False
+        algorithm = get_algorithm(HASHDEEP_ALGO.split(",")[0])
+        cache = open_hash_cache()
+        return copy_on_server(logger, session, meta, algorithm, SERVER_COPY_MIN_SIZE, cache)
+
     @staticmethod
     def post_data_obj_create(hdlr_mod, logger, session, meta, **options):
         _, _ = hdlr_mod, options
+        if is_rerouted(meta, is_metadata_file):
+            return
         refresh_last_update_metadata(logger, session, meta)
-        run_ichksum(meta["target"])
+        if not checksum_deferred(meta):
+            run_ichksum(meta["target"])
 
     @staticmethod
     def post_data_obj_update(hdlr_mod, logger, session, meta, **options):
         _, _ = hdlr_mod, options
+        if is_rerouted(meta, is_metadata_file):
+            return
         refresh_last_update_metadata(logger, session, meta)
-        run_ichksum(meta["target"])
+        if not checksum_deferred(meta):
+            run_ichksum(meta["target"])
 
     @staticmethod
     def delay(hdlr_mod, logger, meta, retries):
@@ -2,7 +2,6 @@
 
 import pathlib
 import typing
-import defusedxml.ElementTree as ET  # noqa
 
 import attr
 
@@ -37,6 +36,8 @@ class RunInfo:
 
 def parse_runinfo_xml(path: str) -> RunInfo:
     """Parse information from ``RunInfo.xml`` and return ``RunInfo`` object."""
+    import defusedxml.ElementTree as ET  # noqa
+
     tree = ET.parse(path)
     tag_run = tree.find(".//Run")
     return RunInfo(
@@ -85,6 +86,8 @@ RUN_PARAMETERS_XPATH_MAP = {
 
 def parse_runparameters_xml(path):
     """Parse ``runParameters.xml`` file and return dict of key/value mappings for AVU."""
+    import defusedxml.ElementTree as ET  # noqa
+
     tree = ET.parse(path)
     result = {}
     for xpath, key in RUN_PARAMETERS_XPATH_MAP.items():
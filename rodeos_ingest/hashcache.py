@@ -0,0 +1,83 @@
+"""Persistent cache of local file digests.
+
+Large files are read more than once during ingest, e.g., for server-side copies before the
+upload (see ``rodeos_ingest.server_copy``), for the local manifest, and for the sequential pass
+that verifies tree digests.  The ``HashCache`` keeps the digests in an SQLite database
+(``RODEOS_HASH_CACHE``) keyed by the real path and algorithm.  Entries are only used while size
+and modification time of the file are unchanged.  The database can be shared by several processes.
+"""
+
+from contextlib import closing, contextmanager
+import os
+import sqlite3
+import typing
+
+from rodeos_ingest.digest import DigestAlgorithm, hash_file
+from rodeos_ingest.throttle import IOGovernor
+
+#: Statement for creating the table.
+_CREATE = (
+    "CREATE TABLE IF NOT EXISTS digests (path TEXT, algorithm TEXT, size INTEGER, "
+    "mtime_ns INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))"
+)
+
+
+class HashCache:
+    """Digests of local files in an SQLite database."""
+
+    def __init__(self, path: typing.Union[str, os.PathLike], timeout: float = 60.0):
+        #: Path to the database file.
+        self.path = path
+        #: Seconds to wait for the database lock.
+        self.timeout = timeout
+        with self._connect() as conn:
+            conn.execute(_CREATE)
+
+    @contextmanager
+    def _connect(self) -> typing.Iterator[sqlite3.Connection]:
+        """Yield a new connection in a transaction, connections are not shared by threads."""
+        with closing(sqlite3.connect(str(self.path), timeout=self.timeout)) as conn:
+            with conn:
+                yield conn
+
+    def get(self, path: typing.Union[str, os.PathLike], algorithm: str) -> typing.Optional[str]:
+        """Return cached hex digest of ``path`` or ``None`` if missing or outdated."""
+        stat = os.stat(path)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT digest FROM digests WHERE path = ? AND algorithm = ? AND size = ? "
+                "AND mtime_ns = ?",
+                (os.path.realpath(path), algorithm, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(
+        self,
+        path: typing.Union[str, os.PathLike],
+        algorithm: str,
+        digest: str,
+        stat: typing.Optional[os.stat_result] = None,
+    ) -> None:
+        """Store hex ``digest`` of ``path`` for the file's ``stat`` (taken now if not given)."""
+        stat = stat or os.stat(path)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)",
+                (os.path.realpath(path), algorithm, stat.st_size, stat.st_mtime_ns, digest),
+            )
+
+    def hash_file(
+        self,
+        path: typing.Union[str, os.PathLike],
+        algorithms: typing.Sequence[DigestAlgorithm],
+        governor: typing.Optional[IOGovernor] = None,
+    ) -> typing.List[str]:
+        """Return hex digests of ``path`` like ``hash_file()``, reading the file only if needed."""
+        cached = [self.get(path, algorithm.name) for algorithm in algorithms]
+        if all(cached):
+            return cached
+        stat = os.stat(path)
+        digests = hash_file(path, algorithms, governor)
+        for algorithm, digest in zip(algorithms, digests):
+            self.put(path, algorithm.name, digest, stat)
+        return digests
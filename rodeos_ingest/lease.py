@@ -0,0 +1,239 @@
+"""Leases for finalizing run folders in one worker only.
+
+``pre_job`` and ``post_job`` of the handlers finalize run folders and several scans can overlap,
+so without coordination two workers could hash the same folder, run ``ichksum -r``, and race on
+moving it.  Before finalizing, a worker takes a lease named after the destination collection:
+
+``redis`` (default, ``RODEOS_LEASE_BACKEND``)
+    a ``redis_lock`` lock in the Redis configured for the automated ingest job, or the one in
+    ``CELERY_BROKER_URL`` outside of jobs
+``file``
+    a lease file in ``RODEOS_LEASE_DIR`` for setups with all workers on one host
+
+A lease expires after ``RODEOS_LEASE_TTL_SECONDS`` unless it is renewed.  While a lease is held,
+a heartbeat thread renews it every third of that time, so the lease of a crashed worker becomes
+stale and is taken over by the next worker.  A worker that lost its lease (e.g., because the
+heartbeat was delayed past the time to live) must not continue, so the finalization calls
+``Lease.check()`` before each irreversible step and stops with ``LeaseLost`` otherwise.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import pathlib
+import socket
+import tempfile
+import threading
+import time
+import typing
+import uuid
+
+from rodeos_ingest.settings import (
+    RODEOS_LEASE_BACKEND as LEASE_BACKEND,
+    RODEOS_LEASE_DIR as LEASE_DIR,
+    RODEOS_LEASE_TTL_SECONDS as LEASE_TTL_SECONDS,
+)
+
+#: Prefix of the lease keys in Redis.
+REDIS_KEY_PREFIX = "rodeos::lease::"
+
+
+def _owner_id() -> str:
+    """Return a new owner identifier that names host and process for debugging."""
+    return "%s:%d:%s" % (socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+
+
+class LeaseLost(RuntimeError):
+    """Raised by ``Lease.check()`` when the lease is no longer held."""
+
+
+class Lease:
+    """Base class for leases with heartbeat, subclasses implement acquiring and renewal."""
+
+    def __init__(self, name: str, ttl: float = LEASE_TTL_SECONDS):
+        #: Name of the leased resource.
+        self.name = name
+        #: Seconds until the lease expires if not renewed.
+        self.ttl = ttl
+        #: Identifier of this owner.
+        self.owner = _owner_id()
+        #: Whether a renewal failed while the lease was held.
+        self.lost = False
+        #: Event for stopping the heartbeat thread.
+        self._stop = threading.Event()
+
+    def acquire(self) -> bool:
+        """Try to take the lease without blocking and return whether it was taken."""
+        raise NotImplementedError  # pragma: no cover
+
+    def renew(self) -> bool:
+        """Extend the lease and return whether it is still held."""
+        raise NotImplementedError  # pragma: no cover
+
+    def release(self) -> None:
+        """Give up the lease if still held."""
+        raise NotImplementedError  # pragma: no cover
+
+    def check(self) -> None:
+        """Renew the lease now and raise ``LeaseLost`` if it is no longer held."""
+        if not self.lost:
+            try:
+                self.lost = not self.renew()
+            except Exception:  # pragma: no cover
+                self.lost = True
+        if self.lost:
+            raise LeaseLost("lost lease %s" % self.name)
+
+    def _heartbeat(self, logger) -> None:
+        """Renew the lease every third of its time to live until stopped."""
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                renewed = self.renew()
+            except Exception as e:  # pragma: no cover
+                logger.warning("renewing lease %s failed: %s" % (self.name, e))
+                renewed = False
+            if not renewed:
+                logger.warning("lost lease %s" % self.name)
+                self.lost = True
+                return
+
+    @contextmanager
+    def held(self, logger) -> typing.Iterator[bool]:
+        """Yield whether the lease was acquired and renew it in the background while held."""
+        if not self.acquire():
+            yield False
+            return
+        self._stop.clear()
+        thread = threading.Thread(target=self._heartbeat, args=(logger,), daemon=True)
+        thread.start()
+        try:
+            yield True
+        finally:
+            self._stop.set()
+            thread.join()
+            self.release()
+
+
+class RedisLease(Lease):
+    """Lease backed by a ``redis_lock`` lock."""
+
+    def __init__(self, client, name: str, ttl: float = LEASE_TTL_SECONDS):
+        import redis_lock
+
+        super().__init__(name, ttl)
+        #: The underlying lock, its owner identifier is ours.
+        self.lock = redis_lock.Lock(
+            client, REDIS_KEY_PREFIX + name, expire=max(1, int(ttl)), id=self.owner
+        )
+
+    def acquire(self) -> bool:
+        return self.lock.acquire(blocking=False)
+
+    def renew(self) -> bool:
+        import redis_lock
+
+        try:
+            self.lock.extend()
+        except redis_lock.NotAcquired:
+            return False
+        return True
+
+    def release(self) -> None:
+        import redis_lock
+
+        try:
+            self.lock.release()
+        except redis_lock.NotAcquired:
+            pass
+
+
+class FileLease(Lease):
+    """Lease stored in a file in ``directory``, for workers on a single host.
+
+    The file holds owner and expiry time.  It is only read and written while holding an
+    exclusive ``flock`` on it, so checking for a stale lease and taking it over is atomic.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Union[str, pathlib.Path],
+        name: str,
+        ttl: float = LEASE_TTL_SECONDS,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        super().__init__(name, ttl)
+        #: Path to the lease file.
+        self.path = pathlib.Path(directory) / (
+            "%s.lease" % hashlib.sha256(name.encode("utf-8")).hexdigest()
+        )
+        #: Clock function, replaceable for testing.
+        self.clock = clock
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self) -> typing.Iterator[typing.Tuple[typing.Dict[str, typing.Any], typing.IO]]:
+        """Yield the current lease record and the locked lease file."""
+        with open(self.path, "a+t") as leasef:
+            fcntl.flock(leasef, fcntl.LOCK_EX)
+            leasef.seek(0)
+            content = leasef.read()
+            yield (json.loads(content) if content.strip() else {}), leasef
+
+    def _write(self, leasef, record: typing.Dict[str, typing.Any]) -> None:
+        leasef.seek(0)
+        leasef.truncate()
+        leasef.write(json.dumps(record))
+        leasef.flush()
+
+    def _take(self, leasef) -> None:
+        record = {"name": self.name, "owner": self.owner, "expires": self.clock() + self.ttl}
+        self._write(leasef, record)
+
+    def acquire(self) -> bool:
+        with self._locked() as (record, leasef):
+            if record.get("owner") not in (None, self.owner) and record["expires"] > self.clock():
+                return False
+            self._take(leasef)
+            return True
+
+    def renew(self) -> bool:
+        with self._locked() as (record, leasef):
+            if record.get("owner") != self.owner:
+                return False
+            self._take(leasef)
+            return True
+
+    def release(self) -> None:
+        with self._locked() as (record, leasef):
+            if record.get("owner") == self.owner:
+                self._write(leasef, {})
+
+
+def get_redis(config: typing.Dict[str, typing.Any]):
+    """Return the Redis client of the automated ingest for ``config``."""
+    from irods_capability_automated_ingest.redis_utils import get_redis as _get_redis
+
+    return _get_redis(config)
+
+
+def open_lease(meta: typing.Dict[str, typing.Any], name: str) -> typing.Optional[Lease]:
+    """Return the lease for ``name`` for the job in ``meta``, ``None`` if leases are disabled.
+
+    Pass an empty ``meta`` outside of automated ingest jobs.
+    """
+    if LEASE_BACKEND == "redis":
+        if "config" in meta:
+            client = get_redis(meta["config"])
+        else:
+            import redis
+
+            client = redis.StrictRedis.from_url(
+                os.environ.get("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+            )
+        return RedisLease(client, name)
+    elif LEASE_BACKEND == "file":
+        return FileLease(LEASE_DIR or os.path.join(tempfile.gettempdir(), "rodeos-leases"), name)
+    else:
+        return None
@@ -0,0 +1,445 @@
+"""Reading of manifest files.
+
+Manifest files (``hashdeep`` output for the local side and the ``iquest`` based one for the iRODS
+side) can have millions of lines for large run folders.  The functions in this module memory-map
+the files and parse the records directly from the byte buffer such that no text decoding and only
+minimal allocation is necessary.
+
+- ``iter_manifest()`` lazily yields the records of a manifest file.
+- ``load_manifest()`` loads all records in bulk into a compact ``ManifestTable``.
+- ``write_manifest()`` computes a ``hashdeep`` compatible manifest in Python, for digest
+  algorithms that ``hashdeep`` does not support.
+
+The digest algorithms are taken from the ``%%%% size,<algorithm>[,<algorithm>...],filename``
+header line that both ``hashdeep`` and ``compute_irods_manifest()`` write.  There is one checksum
+column per algorithm.
+
+Files hashed in chunks have a ``tree:<digest>`` checksum in their record and an additional
+``## chunks,<algorithm>,<chunk size>,<digest>;<digest>...,<path>`` line with the chunk digests;
+being a comment line, it is ignored by ``hashdeep`` and the record parsing.  Use
+``iter_chunks()`` to read these lines.
+
+The ``#`` and ``%`` header lines written by ``hashdeep``, the ``CAT_NO_ROWS_FOUND`` output of
+``iquest``, and empty lines are skipped.  Any other line that does not look like a
+``size,checksum,path`` record raises ``ValueError``, such that truncated or corrupted manifests
+are not taken for manifests with fewer files.
+
+Manifests can be compressed with ``compress_manifest()`` using ``gzip`` or ``zstd`` (the latter
+requires the optional ``zstandard`` module).  The records are sorted by path and each path is
+written as ``<n>:<suffix>`` where ``n`` is the length of the prefix shared with the previous path
+(announced by a ``## prefix-coded`` line).  ``mapped()`` recognizes compressed files by their
+magic bytes and decodes them on the fly into a temporary file, such that all readers work with
+compressed manifests transparently.
+"""
+
+import array
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import gzip
+import io
+import mmap
+import os
+import re
+import tempfile
+import typing
+
+import attr
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from rodeos_ingest.digest import (
+    DigestAlgorithm,
+    hash_file,
+    hash_file_chunked,
+    TREE_PREFIX,
+)
+from rodeos_ingest.hashcache import HashCache
+from rodeos_ingest.throttle import IOGovernor
+from rodeos_ingest.tuning import ConcurrencyController
+
+#: Regular expression for matching the header line with the column names.
+COLUMNS_RE = re.compile(rb"^%%%% size,([^\r\n]*),filename\r?$", re.MULTILINE)
+#: Regular expression for matching the lines with the chunk digests.
+CHUNKS_RE = re.compile(rb"^## chunks,([^,\r\n]+),(\d+),([0-9a-f;]*),([^\r\n]*)\r?$", re.MULTILINE)
+#: Algorithm to assume for manifests without header (the ``hashdeep`` default).
+DEFAULT_ALGORITHM = "md5"
+#: Default chunk size for hashing files in chunks.
+DEFAULT_CHUNK_SIZE = 256 * 1024 * 1024
+#: Regular expression for matching header and comment lines.
+COMMENT_RE = re.compile(rb"^[#%][^\r\n]*", re.MULTILINE)
+#: Line announcing prefix-coded paths in the following records.
+PREFIX_CODED_LINE = b"## prefix-coded\n"
+#: File name suffixes of compressed manifests by codec.
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+#: Maximal number of files per worker that are queued for hashing in ``write_manifest()``.
+PENDING_PER_WORKER = 4
+#: Magic bytes of compressed files.
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def record_re(columns: int = 1) -> typing.Pattern:
+    """Return regular expression matching ``size,checksum[,checksum...],path`` records."""
+    return re.compile(
+        rb"^(\d+),((?:[^,\r\n]*,){%d}[^,\r\n]*),([^\r\n]*)\r?$" % (columns - 1), re.MULTILINE
+    )
+
+
+#: Regular expression for matching a ``size,checksum,path`` record in a manifest buffer.
+RECORD_RE = record_re(1)
+
+
+def malformed_re(columns: int = 1) -> typing.Pattern:
+    """Return regular expression matching lines that are neither records nor skipped."""
+    return re.compile(
+        rb"^(?!\d+,(?:[^,\r\n]*,){%d}[^,\r\n]*,[^\r\n]*\r?$|[#%%]|CAT_NO_ROWS_FOUND|\r?$)"
+        rb"[^\r\n]+" % (columns - 1),
+        re.MULTILINE,
+    )
+
+
+#: Regular expression for matching the line ends.
+_LINE_END_RE = re.compile(rb"\n")
+#: Regular expression for matching the line ends before skipped lines.
+_SKIPPED_RE = re.compile(rb"\n(?=[#%\r\n]|CAT_NO_ROWS_FOUND)")
+#: Regular expression for matching a skipped first line.
+_SKIPPED_FIRST_RE = re.compile(rb"[#%\r\n]|CAT_NO_ROWS_FOUND")
+
+
+def check_records(buf, columns: int, records: int) -> None:
+    """Raise ``ValueError`` if ``buf`` has lines other than ``records`` records and skipped ones.
+
+    Only the lines are counted, the malformed line is searched for the message only.
+    """
+    if not buf:
+        return
+    lines = len(_LINE_END_RE.findall(buf)) + (buf[-1:] != b"\n")
+    skipped = len(_SKIPPED_RE.findall(buf)) + bool(_SKIPPED_FIRST_RE.match(buf))
+    if lines != records + skipped:
+        match = malformed_re(columns).search(buf)
+        raise ValueError(
+            "Malformed manifest line: %r" % (match.group(0)[:200] if match else b"<unknown>")
+        )
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ManifestRecord:
+    """One record from a manifest file, all values are kept as raw ``bytes``."""
+
+    #: The file size.
+    size: bytes
+    #: The checksums as written in the manifest file, one per digest column.
+    checksums: typing.Tuple[bytes, ...]
+    #: The path relative to the run folder.
+    path: bytes
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ChunksRecord:
+    """The chunk digests of a file hashed in chunks."""
+
+    #: The digest algorithm name.
+    algorithm: str
+    #: The chunk size.
+    chunk_size: int
+    #: The hex digests of the chunks.
+    digests: typing.Tuple[bytes, ...]
+    #: The path relative to the run folder.
+    path: bytes
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ManifestTable:
+    """Column-wise storage of the records of a manifest file."""
+
+    #: File sizes.
+    sizes: array.array
+    #: Checksums as written in the manifest file, by digest algorithm name.
+    checksums: typing.Dict[str, typing.List[bytes]]
+    #: Paths relative to the run folder.
+    paths: typing.List[bytes]
+
+    def __len__(self):
+        return len(self.paths)
+
+    @property
+    def algorithms(self) -> typing.List[str]:
+        """Names of the digest algorithms in column order."""
+        return list(self.checksums)
+
+    def index(self) -> typing.Dict[bytes, int]:
+        """Return mapping from path to row number."""
+        return {path: i for i, path in enumerate(self.paths)}
+
+
+def _decompressing_reader(inputf: typing.BinaryIO) -> typing.Optional[typing.BinaryIO]:
+    """Return decompressing reader for ``inputf`` if it is compressed, else ``None``."""
+    magic = inputf.read(4)
+    inputf.seek(0)
+    if magic.startswith(_GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=inputf, mode="rb")
+    elif magic == _ZSTD_MAGIC:
+        if zstandard is None:  # pragma: no cover
+            raise RuntimeError("reading zstd compressed manifests requires the zstandard module")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(inputf))
+    else:
+        return None
+
+
+def _decode_lines(lines: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+    """Yield ``lines`` with prefix-coded paths expanded."""
+    pattern = RECORD_RE
+    coded = False
+    previous = b""
+    for line in lines:
+        if line.rstrip(b"\r\n") == PREFIX_CODED_LINE.rstrip(b"\n"):
+            coded = True
+            continue
+        match = COLUMNS_RE.match(line)
+        if match:
+            pattern = record_re(len(match.group(1).split(b",")))
+        match = pattern.match(line) if coded else None
+        if match:
+            size, checksums, coded_path = match.groups()
+            length, _, suffix = coded_path.partition(b":")
+            previous = previous[: int(length)] + suffix
+            yield b"%s,%s,%s\n" % (size, checksums, previous)
+        else:
+            yield line
+
+
+@contextmanager
+def mapped(path: typing.Union[str, os.PathLike]):
+    """Memory-map the file at ``path`` read-only and yield the buffer.
+
+    Empty files cannot be memory-mapped, an empty ``bytes`` object is yielded for them.
+    Compressed files are decoded into a temporary file first.
+    """
+    with open(path, "rb") as inputf:
+        reader = _decompressing_reader(inputf)
+        if reader is not None:
+            with reader, tempfile.TemporaryFile() as tmpf:
+                tmpf.writelines(_decode_lines(iter(reader.readline, b"")))
+                tmpf.flush()
+                if tmpf.tell() == 0:
+                    yield b""
+                else:
+                    with mmap.mmap(tmpf.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                        yield buf
+        elif os.fstat(inputf.fileno()).st_size == 0:
+            yield b""
+        else:
+            with mmap.mmap(inputf.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                yield buf
+
+
+def read_algorithms(buf) -> typing.List[str]:
+    """Return the digest algorithm names from the header line in ``buf``.
+
+    Defaults to ``[DEFAULT_ALGORITHM]`` if there is no header line.
+    """
+    match = COLUMNS_RE.search(buf)
+    if match:
+        return match.group(1).decode("ascii").lower().split(",")
+    else:
+        return [DEFAULT_ALGORITHM]
+
+
+def iter_records(buf, columns: int = 1) -> typing.Iterator[typing.Tuple[bytes, bytes, bytes]]:
+    """Yield ``(size, checksums, path)`` tuples from the records in ``buf``.
+
+    With more than one digest column, ``checksums`` contains the comma-separated values.
+    Raises ``ValueError`` after the last record if there are malformed lines, see
+    ``check_records()``.
+    """
+    records = 0
+    for match in (RECORD_RE if columns == 1 else record_re(columns)).finditer(buf):
+        records += 1
+        yield match.groups()
+    check_records(buf, columns, records)
+
+
+def iter_manifest(path: typing.Union[str, os.PathLike]) -> typing.Iterator[ManifestRecord]:
+    """Lazily yield the ``ManifestRecord`` objects from the manifest file at ``path``."""
+    with mapped(path) as buf:
+        columns = len(read_algorithms(buf))
+        for size, checksums, rel_path in iter_records(buf, columns):
+            yield ManifestRecord(size, tuple(checksums.split(b",")), rel_path)
+
+
+def iter_chunks(path: typing.Union[str, os.PathLike]) -> typing.Iterator[ChunksRecord]:
+    """Lazily yield the ``ChunksRecord`` objects from the manifest file at ``path``."""
+    with mapped(path) as buf:
+        for algorithm, chunk_size, digests, rel_path in CHUNKS_RE.findall(buf):
+            yield ChunksRecord(
+                algorithm.decode("ascii"), int(chunk_size), tuple(digests.split(b";")), rel_path
+            )
+
+
+def load_manifest(path: typing.Union[str, os.PathLike]) -> ManifestTable:
+    """Load all records from the manifest file at ``path`` into a ``ManifestTable``."""
+    with mapped(path) as buf:
+        algorithms = read_algorithms(buf)
+        records = (RECORD_RE if len(algorithms) == 1 else record_re(len(algorithms))).findall(buf)
+        check_records(buf, len(algorithms), len(records))
+    if records:
+        sizes, checksums, paths = zip(*records)
+    else:
+        sizes, checksums, paths = (), (), ()
+    if len(algorithms) == 1:
+        columns = [list(checksums)]
+    else:
+        columns = [list(c) for c in zip(*(value.split(b",") for value in checksums))]
+        columns = columns or [[] for _ in algorithms]
+    return ManifestTable(
+        sizes=array.array("Q", map(int, sizes)),
+        checksums=dict(zip(algorithms, columns)),
+        paths=list(paths),
+    )
+
+
+def _list_files(src_folder, exclude: typing.Container[str]) -> typing.Iterator[str]:
+    """Yield paths of regular files below ``src_folder`` as ``./``-prefixed relative paths.
+
+    As with ``find -type f`` for ``hashdeep``, symbolic links, FIFOs, sockets, and device nodes
+    are skipped and symbolic links to directories are not followed.
+    """
+
+    def _walk(rel_root):
+        with os.scandir(os.path.join(src_folder, rel_root)) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        dirs = []
+        for entry in entries:
+            rel_path = os.path.join(rel_root, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(rel_path)
+            elif entry.is_file(follow_symlinks=False) and rel_path not in exclude:
+                yield "./%s" % rel_path
+        for rel_dir in dirs:
+            yield from _walk(rel_dir)
+
+    return _walk("")
+
+
+def write_manifest(
+    src_folder,
+    outf: typing.BinaryIO,
+    algorithms: typing.Sequence[DigestAlgorithm],
+    threads: int,
+    exclude: typing.Container[str] = (),
+    chunk_threshold: int = 0,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    governor: typing.Optional[IOGovernor] = None,
+    controller: typing.Optional[ConcurrencyController] = None,
+    cache: typing.Optional[HashCache] = None,
+) -> None:
+    """Write ``hashdeep`` compatible manifest of files below ``src_folder`` to ``outf``.
+
+    Each file is read only once, also when more than one of ``algorithms`` is given.  Paths
+    relative to ``src_folder`` given in ``exclude`` are skipped.  Files of at least
+    ``chunk_threshold`` bytes (if non-zero) are hashed in chunks of ``chunk_size`` in parallel.
+    All reads are limited by ``governor`` if given.  With ``controller``, the number of files
+    hashed concurrently is adjusted by the controller instead of being fixed to ``threads``.
+    Digests of files that are not hashed in chunks are looked up in and stored to ``cache``.
+    At most ``PENDING_PER_WORKER`` files per worker are queued at any time.
+    """
+    names = ",".join(algorithm.name for algorithm in algorithms).encode("ascii")
+    outf.write(b"%%%% HASHDEEP-1.0\n")
+    outf.write(b"%%%%%%%% size,%s,filename\n" % names)
+    outf.write(b"## Invoked from: %s\n" % os.fsencode(os.path.abspath(src_folder)))
+    outf.write(b"## $ rodeos_ingest -c %s -j %d\n" % (names, threads))
+    outf.write(b"## \n")
+
+    def _hash_file(rel_path):
+        path = os.path.join(src_folder, rel_path)
+        size = os.path.getsize(path)
+        if chunk_threshold and size >= chunk_threshold:
+            trees = hash_file_chunked(path, algorithms, chunk_size, chunk_executor, governor)
+            digests = [TREE_PREFIX + tree for tree, _ in trees]
+            return size, digests, rel_path, [chunk_digests for _, chunk_digests in trees]
+        elif cache:
+            return size, cache.hash_file(path, algorithms, governor), rel_path, None
+        else:
+            return size, hash_file(path, algorithms, governor), rel_path, None
+
+    def _hash(rel_path):
+        if controller is None:
+            return _hash_file(rel_path)
+        with controller.slot():
+            result = _hash_file(rel_path)
+        controller.record(result[0])
+        return result
+
+    def _write(size, digests, rel_path, chunks):
+        for algorithm, chunk_digests in zip(algorithms, chunks or ()):
+            outf.write(
+                b"## chunks,%s,%d,%s,%s\n"
+                % (
+                    algorithm.name.encode("ascii"),
+                    chunk_size,
+                    ";".join(chunk_digests).encode("ascii"),
+                    os.fsencode(rel_path),
+                )
+            )
+        outf.write(b"%d,%s,%s\n" % (size, ",".join(digests).encode("ascii"), os.fsencode(rel_path)))
+
+    # Submit the files in a bounded window instead of all at once, such that memory does not
+    # grow with the number of files.
+    workers = max(1, controller.maximum if controller else threads)
+    pending: typing.Deque = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(
+        max_workers=max(1, threads)
+    ) as chunk_executor:
+        for rel_path in _list_files(src_folder, exclude):
+            pending.append(executor.submit(_hash, rel_path))
+            if len(pending) >= workers * PENDING_PER_WORKER:
+                _write(*pending.popleft().result())
+        while pending:
+            _write(*pending.popleft().result())
+
+
+def _compressing_writer(outf: typing.BinaryIO, codec: str):
+    """Return compressing writer for ``codec`` around ``outf``."""
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=outf, mode="wb")
+    elif codec == "zstd":
+        if zstandard is None:  # pragma: no cover
+            raise RuntimeError("writing zstd compressed manifests requires the zstandard module")
+        return zstandard.ZstdCompressor().stream_writer(outf)
+    else:
+        raise ValueError("Unknown manifest compression %s" % codec)
+
+
+def compress_manifest(
+    src_path: typing.Union[str, os.PathLike], dst_path: typing.Union[str, os.PathLike], codec: str
+) -> None:
+    """Write manifest at ``src_path`` compressed with ``codec`` and prefix-coded to ``dst_path``.
+
+    Header and comment lines are kept, ``CAT_NO_ROWS_FOUND`` lines are dropped, and the records
+    are sorted by path.  Raises ``ValueError`` on malformed lines, see ``check_records()``.
+    """
+    with mapped(src_path) as buf, memoryview(buf) as view:
+        columns = len(read_algorithms(buf))
+        # Keep only the spans of the records and write the values from the mapped buffer.
+        records = sorted(
+            (match.group(3), match.start(1), match.end(2), match.start(3), match.end(3))
+            for match in (RECORD_RE if columns == 1 else record_re(columns)).finditer(buf)
+        )
+        check_records(buf, columns, len(records))
+        with open(dst_path, "wb") as outf, _compressing_writer(outf, codec) as writer:
+            for match in COMMENT_RE.finditer(buf):
+                writer.write(view[match.start() : match.end()])
+                writer.write(b"\n")
+            writer.write(PREFIX_CODED_LINE)
+            previous = b""
+            for path, start, end, path_start, path_end in records:
+                length = len(os.path.commonprefix([previous, path]))
+                writer.write(view[start:end])
+                writer.write(b",%d:" % length)
+                writer.write(view[path_start + length : path_end])
+                writer.write(b"\n")
+                previous = path
@@ -0,0 +1,255 @@
+"""Memory accounting and memory-bounded comparison for the finalization of run folders.
+
+Comparing the manifests of a run folder with millions of files needs several GB when both are
+held in dicts.  Before comparing, the memory needed is estimated from the size of the manifest
+files.  If it exceeds ``RODEOS_FINALIZE_MEMORY_BUDGET`` bytes, the records are kept in a
+temporary SQLite database (``DiskRecordStore``) instead of dicts (``RecordStore``) and compared
+with ordered queries.  The database is created in ``RODEOS_FINALIZE_SPILL_DIR`` (by default the
+system's temporary directory), never next to the manifests in the run folder that is compared.
+
+During finalization, ``MemoryMonitor`` samples the resident set size of the process and records
+its peak as the ``rodeos::ingest::metrics::finalize::peak_rss`` AVU.  With
+``RODEOS_FINALIZE_TRACEMALLOC``, Python allocations are traced as well: the peak is recorded as
+``finalize::peak_traced`` and the top allocation sites are logged.
+"""
+
+from contextlib import closing
+import os
+import sqlite3
+import tempfile
+import threading
+import tracemalloc
+import typing
+
+from rodeos_ingest.settings import (
+    RODEOS_FINALIZE_MEMORY_BUDGET as FINALIZE_MEMORY_BUDGET,
+    RODEOS_FINALIZE_SPILL_DIR as FINALIZE_SPILL_DIR,
+    RODEOS_FINALIZE_TRACEMALLOC as FINALIZE_TRACEMALLOC,
+)
+
+#: Estimated bytes of memory per byte of an uncompressed manifest file when loaded into dicts.
+MEMORY_PER_MANIFEST_BYTE = 4
+#: Assumed compression ratio of compressed manifest files for the estimate.
+COMPRESSION_RATIO = 5
+
+#: Sides of a comparison.
+SIDES = ("local", "irods")
+
+#: Type of stored records, size and checksum.
+Record = typing.Tuple[int, bytes]
+
+
+def current_rss() -> int:
+    """Return the resident set size of this process in bytes, ``0`` if unknown."""
+    try:
+        with open("/proc/self/statm", "rt") as inputf:
+            return int(inputf.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):  # pragma: no cover
+        return 0
+
+
+def estimate_memory(*paths: typing.Union[str, os.PathLike]) -> int:
+    """Return estimated bytes needed for loading the manifest files at ``paths`` into dicts."""
+    total = 0
+    for path in paths:
+        size = os.path.getsize(path)
+        if str(path).endswith((".gz", ".zst")):
+            size *= COMPRESSION_RATIO
+        total += size * MEMORY_PER_MANIFEST_BYTE
+    return total
+
+
+def over_budget(estimate: int, budget: typing.Optional[int] = None) -> bool:
+    """Return whether ``estimate`` exceeds ``budget``, a budget of ``0`` is unlimited.
+
+    Defaults to ``RODEOS_FINALIZE_MEMORY_BUDGET``.
+    """
+    budget = FINALIZE_MEMORY_BUDGET if budget is None else budget
+    return bool(budget) and estimate > budget
+
+
+class MemoryMonitor:
+    """Context manager that tracks the peak memory use of the process while active."""
+
+    def __init__(self, interval: float = 0.2, trace: bool = FINALIZE_TRACEMALLOC):
+        #: Seconds between samples of the resident set size.
+        self.interval = interval
+        #: Whether to trace Python allocations with ``tracemalloc``.
+        self.trace = trace
+        #: Peak resident set size in bytes.
+        self.peak_rss = 0
+        #: Peak of traced Python allocations in bytes, if tracing.
+        self.peak_traced: typing.Optional[int] = None
+        #: Snapshot of the traced allocations at exit, if tracing.
+        self.snapshot: typing.Optional[tracemalloc.Snapshot] = None
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+        self._started_tracing = False
+
+    def _sample(self) -> None:
+        self.peak_rss = max(self.peak_rss, current_rss())
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "MemoryMonitor":
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            tracemalloc.reset_peak()
+        self._sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+        if self.trace:
+            _, self.peak_traced = tracemalloc.get_traced_memory()
+            self.snapshot = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def metrics(self, prefix: str = "finalize") -> typing.Dict[str, int]:
+        """Return the peaks as metrics for ``apply_metrics()``."""
+        result = {"%s::peak_rss" % prefix: self.peak_rss}
+        if self.peak_traced is not None:
+            result["%s::peak_traced" % prefix] = self.peak_traced
+        return result
+
+    def top(self, limit: int = 10) -> typing.List[str]:
+        """Return the ``limit`` allocation sites with the most memory at exit, if tracing."""
+        if self.snapshot is None:
+            return []
+        return [str(stat) for stat in self.snapshot.statistics("lineno")[:limit]]
+
+
+class RecordStore:
+    """Size and checksum by path for the ``local`` and ``irods`` side of a comparison in dicts."""
+
+    def __init__(self):
+        self._records: typing.Dict[str, typing.Dict[bytes, Record]] = {side: {} for side in SIDES}
+
+    def add(self, side: str, path: bytes, size: int, checksum: bytes) -> None:
+        """Store the record for ``path`` on ``side``."""
+        self._records[side][path] = (size, checksum)
+
+    def get(self, side: str, path: bytes) -> typing.Optional[Record]:
+        """Return the record for ``path`` on ``side``, if any."""
+        return self._records[side].get(path)
+
+    def set_checksum(self, side: str, path: bytes, checksum: bytes) -> None:
+        """Replace the checksum of the record for ``path`` on ``side``."""
+        self._records[side][path] = (self._records[side][path][0], checksum)
+
+    def paths_with_checksum_prefix(self, side: str, prefix: bytes) -> typing.List[bytes]:
+        """Return the paths on ``side`` whose checksum starts with ``prefix``."""
+        records = self._records[side]
+        return [path for path, (_, chksum) in records.items() if chksum.startswith(prefix)]
+
+    def common(self) -> typing.Iterator[typing.Tuple[bytes, Record, Record]]:
+        """Yield path, local, and iRODS record for paths on both sides, ordered by path."""
+        local, irods = self._records["local"], self._records["irods"]
+        for path in sorted(local.keys() & irods.keys()):
+            yield path, local[path], irods[path]
+
+    def extra(self, side: str, limit: int = 10) -> typing.Tuple[int, typing.List[bytes]]:
+        """Return number and the first ``limit`` (ordered) of the paths only on ``side``."""
+        other = self._records[SIDES[1 - SIDES.index(side)]]
+        paths = sorted(self._records[side].keys() - other.keys())
+        return len(paths), paths[:limit]
+
+    def close(self) -> None:
+        """Release the stored records."""
+        for records in self._records.values():
+            records.clear()
+
+
+class DiskRecordStore(RecordStore):
+    """``RecordStore`` in a temporary SQLite database, only the page cache is held in memory."""
+
+    def __init__(self, directory: typing.Optional[str] = None, batch_size: int = 10_000):
+        super().__init__()
+        #: Number of records to insert at once.
+        self.batch_size = batch_size
+        self._tmp = tempfile.NamedTemporaryFile(suffix=".sqlite", dir=directory)
+        self._conn = sqlite3.connect(self._tmp.name)
+        for side in SIDES:
+            self._conn.execute(
+                "CREATE TABLE %s (path BLOB PRIMARY KEY, size INTEGER, checksum BLOB)" % side
+            )
+        self._pending: typing.Dict[str, typing.List[typing.Tuple[bytes, int, bytes]]] = {
+            side: [] for side in SIDES
+        }
+
+    def _flush(self) -> None:
+        for side, rows in self._pending.items():
+            if rows:
+                self._conn.executemany("INSERT OR REPLACE INTO %s VALUES (?, ?, ?)" % side, rows)
+                rows.clear()
+        self._conn.commit()
+
+    def add(self, side: str, path: bytes, size: int, checksum: bytes) -> None:
+        self._pending[side].append((path, size, checksum))
+        if len(self._pending[side]) >= self.batch_size:
+            self._flush()
+
+    def get(self, side: str, path: bytes) -> typing.Optional[Record]:
+        self._flush()
+        row = self._conn.execute(
+            "SELECT size, checksum FROM %s WHERE path = ?" % side, (path,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_checksum(self, side: str, path: bytes, checksum: bytes) -> None:
+        self._flush()
+        self._conn.execute("UPDATE %s SET checksum = ? WHERE path = ?" % side, (checksum, path))
+
+    def paths_with_checksum_prefix(self, side: str, prefix: bytes) -> typing.List[bytes]:
+        self._flush()
+        query = "SELECT path FROM %s WHERE substr(checksum, 1, ?) = ?" % side
+        return [row[0] for row in self._conn.execute(query, (len(prefix), prefix))]
+
+    def common(self) -> typing.Iterator[typing.Tuple[bytes, Record, Record]]:
+        self._flush()
+        query = (
+            "SELECT local.path, local.size, local.checksum, irods.size, irods.checksum "
+            "FROM local JOIN irods ON local.path = irods.path ORDER BY local.path"
+        )
+        with closing(self._conn.cursor()) as cursor:
+            for path, size_local, chksum_local, size_irods, chksum_irods in cursor.execute(query):
+                yield path, (size_local, chksum_local), (size_irods, chksum_irods)
+
+    def extra(self, side: str, limit: int = 10) -> typing.Tuple[int, typing.List[bytes]]:
+        self._flush()
+        other = SIDES[1 - SIDES.index(side)]
+        where = "FROM %s WHERE path NOT IN (SELECT path FROM %s)" % (side, other)
+        count = self._conn.execute("SELECT COUNT(*) " + where).fetchone()[0]
+        paths = self._conn.execute("SELECT path %s ORDER BY path LIMIT ?" % where, (limit,))
+        return count, [row[0] for row in paths]
+
+    def close(self) -> None:
+        self._conn.close()
+        self._tmp.close()
+
+
+def open_record_store(logger, *paths: typing.Union[str, os.PathLike]) -> RecordStore:
+    """Return the record store for comparing the manifest files at ``paths``.
+
+    A ``DiskRecordStore`` in ``RODEOS_FINALIZE_SPILL_DIR`` is used if their estimated memory
+    exceeds the budget.
+    """
+    estimate = estimate_memory(*paths)
+    if over_budget(estimate):
+        logger.info(
+            "comparing manifests on disk as they need about %d bytes (budget %d bytes)"
+            % (estimate, FINALIZE_MEMORY_BUDGET)
+        )
+        return DiskRecordStore(FINALIZE_SPILL_DIR or None)
+    return RecordStore()
@@ -0,0 +1,25 @@
+"""Ingest metrics that are stored as AVUs on the run folder collections.
+
+Each metric is written as ``rodeos::ingest::metrics::<name>`` with the unit in the AVU unit
+field, e.g., the duration of the finalization stages in seconds.
+"""
+
+import typing
+
+#: AVU key prefix for ingest metrics.
+KEY_METRICS_PREFIX = "rodeos::ingest::metrics"
+
+
+def metric_key(name: str) -> str:
+    """Return AVU key for metric ``name``."""
+    return "%s::%s" % (KEY_METRICS_PREFIX, name)
+
+
+def apply_metrics(coll, values: typing.Dict[str, typing.Union[int, float]], unit: str = "") -> None:
+    """Write metrics ``values`` as AVUs with ``unit`` to the iRODS collection ``coll``."""
+    from irods.meta import iRODSMeta
+
+    for name, value in values.items():
+        key = metric_key(name)
+        text = ("%.3f" % value) if isinstance(value, float) else str(value)
+        coll.metadata[key] = iRODSMeta(key, text, unit)
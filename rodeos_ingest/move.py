@@ -0,0 +1,181 @@
+"""Moving run folders to the ingested area, also across file systems.
+
+``move_tree()`` renames the run folder when source and destination are on the same file system.
+Otherwise, the files are copied in parallel, preferring a reflink (``FICLONE``) and falling back
+to ``os.copy_file_range()`` and plain copying.  Each copy is verified against the local manifest
+computed during finalization (the files are not hashed again on the source side), the source is
+removed only after all files have been verified.
+
+Copied and verified files are recorded in a progress file in the destination folder such that a
+move that was interrupted, e.g., by a crash, continues where it stopped when run again.  The
+finalization resumes such a move directly, without computing the manifests again.  The progress
+file is removed when the move is complete.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import errno
+import fcntl
+import os
+import shutil
+import typing
+
+from rodeos_ingest.digest import TREE_PREFIX, get_algorithm, hash_file, hash_file_chunked
+from rodeos_ingest.manifest import iter_chunks, load_manifest
+from rodeos_ingest.progress import Progress, STATUS_OK
+
+#: ``ioctl`` request for cloning a file on Linux (``FICLONE``).
+FICLONE = 0x40049409
+#: Name of the progress file in the destination folder.
+PROGRESS_NAME = ".rodeos-move.progress"
+#: Bytes to copy per ``copy_file_range()`` call.
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+class MoveVerificationError(RuntimeError):
+    """Raised when a copied file does not match the manifest."""
+
+
+def _reflink(src_fd: int, dst_fd: int) -> bool:
+    """Try to clone ``src_fd`` into ``dst_fd`` and return success."""
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError:
+        return False
+
+
+def copy_file(src: str, dst: str) -> bool:
+    """Copy file ``src`` to ``dst`` preserving mode and times, return whether reflinked."""
+    with open(src, "rb") as inputf, open(dst, "wb") as outputf:
+        reflinked = _reflink(inputf.fileno(), outputf.fileno())
+        if not reflinked:
+            try:
+                remaining = os.fstat(inputf.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(
+                        inputf.fileno(), outputf.fileno(), min(COPY_CHUNK, remaining)
+                    )
+                    if not copied:  # pragma: no cover
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):  # pragma: no cover
+                inputf.seek(0)
+                outputf.seek(0)
+                outputf.truncate()
+                shutil.copyfileobj(inputf, outputf, COPY_CHUNK)
+    shutil.copystat(src, dst)
+    return reflinked
+
+
+class _Expected(typing.NamedTuple):
+    """Expected size and digest of a file from the manifest."""
+
+    size: int
+    digest: bytes
+    chunk_size: int
+
+
+def _load_expected(
+    manifest_path: typing.Optional[str],
+) -> typing.Tuple[str, typing.Dict[str, _Expected]]:
+    """Return algorithm name and expected values by relative path from the manifest."""
+    if not manifest_path or not os.path.exists(manifest_path):
+        return "", {}
+    table = load_manifest(manifest_path)
+    algorithm = table.algorithms[0]
+    chunk_sizes = {
+        os.fsdecode(chunks.path): chunks.chunk_size
+        for chunks in iter_chunks(manifest_path)
+        if chunks.algorithm == algorithm
+    }
+    expected = {}
+    for path, size, digest in zip(table.paths, table.sizes, table.checksums[algorithm]):
+        rel_path = os.path.normpath(os.fsdecode(path))
+        expected[rel_path] = _Expected(size, digest.lower(), chunk_sizes.get(os.fsdecode(path), 0))
+    return algorithm, expected
+
+
+def _verify(path: str, algorithm: str, expected: _Expected, executor, check_digest: bool):
+    """Verify the file at ``path`` against ``expected``."""
+    size = os.path.getsize(path)
+    if size != expected.size:
+        raise MoveVerificationError("size mismatch %s vs %s for %s" % (expected.size, size, path))
+    if not check_digest:
+        return
+    algorithms = [get_algorithm(algorithm)]
+    tree_prefix = TREE_PREFIX.encode("ascii")
+    if expected.digest.startswith(tree_prefix):
+        tree, _ = hash_file_chunked(path, algorithms, expected.chunk_size, executor)[0]
+        digest = (TREE_PREFIX + tree).encode("ascii")
+    else:
+        digest = hash_file(path, algorithms)[0].encode("ascii")
+    if digest != expected.digest:
+        raise MoveVerificationError(
+            "checksum mismatch %s vs %s for %s" % (expected.digest.decode(), digest.decode(), path)
+        )
+
+
+def move_tree(
+    logger, src: str, dst: str, manifest_path: typing.Optional[str], threads: int = 4
+) -> None:
+    """Move directory ``src`` to ``dst``, copying and verifying when crossing file systems.
+
+    Files listed in the manifest at ``manifest_path`` are verified by their digest unless they
+    were reflinked (and thus share the data with the source), other files by their size.
+    """
+    if not os.path.exists(os.path.join(dst, PROGRESS_NAME)):
+        try:
+            os.rename(src, dst)
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+    logger.info("copying %s => %s across file systems" % (src, dst))
+    os.makedirs(dst, exist_ok=True)
+    progress = Progress(os.path.join(dst, PROGRESS_NAME))
+    done = progress.succeeded()
+    algorithm, expected = _load_expected(manifest_path)
+
+    jobs = []
+    for root, dirs, files in os.walk(src):
+        rel_root = os.path.relpath(root, src)
+        for name in sorted(dirs):
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            if not os.path.islink(os.path.join(root, name)):
+                os.makedirs(os.path.join(dst, rel_path), exist_ok=True)
+            else:
+                files.append(name)
+        for name in sorted(files):
+            rel_path = os.path.normpath(os.path.join(rel_root, name))
+            if rel_path not in done:
+                jobs.append(rel_path)
+
+    def _move_file(rel_path: str) -> None:
+        src_path, dst_path = os.path.join(src, rel_path), os.path.join(dst, rel_path)
+        if os.path.islink(src_path):
+            if os.path.lexists(dst_path):
+                os.remove(dst_path)
+            os.symlink(os.readlink(src_path), dst_path)
+        else:
+            reflinked = copy_file(src_path, dst_path)
+            file_expected = expected.get(rel_path)
+            if file_expected is None:
+                file_expected = _Expected(os.path.getsize(src_path), b"", 0)
+            check_digest = bool(file_expected.digest) and not reflinked
+            _verify(dst_path, algorithm, file_expected, chunk_executor, check_digest)
+        progress.record(rel_path, STATUS_OK)
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor, ThreadPoolExecutor(
+        max_workers=max(1, threads)
+    ) as chunk_executor:
+        list(executor.map(_move_file, jobs))
+
+    missing = sorted(set(expected) - set(progress.succeeded()))
+    if missing:
+        raise MoveVerificationError(
+            "%d files from manifest missing, e.g., %s" % (len(missing), missing[0])
+        )
+    logger.info("copied and verified %d files, removing %s" % (len(jobs), src))
+    if os.path.exists(src):
+        shutil.rmtree(src)
+    os.remove(os.path.join(dst, PROGRESS_NAME))
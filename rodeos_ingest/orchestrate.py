@@ -0,0 +1,225 @@
+"""Concurrent ingest of multiple landing zone paths.
+
+The ``rodeos-ingest-orchestrate`` entry point replaces the sequential loop of the Docker entry
+point.  It discovers the ingest paths below a root directory, creates all destination
+collections with a single ``imkdir -p`` call, and runs ``irods_sync start --synchronous`` for all
+paths concurrently with a bounded parallelism.  Each path is scanned again ``interval`` seconds
+after its previous scan finished, such that one slow sequencer directory does not block the
+others.  The duration of each scan is logged and summarised after each round.
+
+Destination collections are laid out as in the Docker image, i.e., the ingest path ``$DIR``
+goes to ``$TARGET/20${DIR::2}/$DIR``.
+"""
+
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import logging
+import os
+import subprocess  # nosec
+import sys
+import time
+import typing
+
+import attr
+
+from rodeos_ingest.settings import (
+    RODEOS_ORCHESTRATE_INTERVAL_SECONDS as ORCHESTRATE_INTERVAL_SECONDS,
+    RODEOS_ORCHESTRATE_PARALLELISM as ORCHESTRATE_PARALLELISM,
+)
+
+#: Module to sync tool.
+IRODS_SYNC_PY = "irods_capability_automated_ingest.irods_sync"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class IngestPath:
+    """A landing zone path and its destination collection."""
+
+    #: The source directory.
+    source: str
+    #: The destination collection.
+    target: str
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ScanResult:
+    """Result of scanning one ``IngestPath``."""
+
+    #: The scanned path.
+    path: IngestPath
+    #: Return code of ``irods_sync``.
+    returncode: int
+    #: Duration in seconds.
+    duration: float
+
+
+def target_collection(target_base: str, name: str) -> str:
+    """Return destination collection for ingest path ``name`` (``$TARGET/20${DIR::2}/$DIR``)."""
+    return "%s/20%s/%s" % (target_base.rstrip("/"), name[:2], name)
+
+
+def discover_paths(ingest_root: str, target_base: str) -> typing.List[IngestPath]:
+    """Return ``IngestPath`` objects for the directories in ``ingest_root``."""
+    return [
+        IngestPath(entry.path, target_collection(target_base, entry.name))
+        for entry in sorted(os.scandir(ingest_root), key=lambda e: e.name)
+        if entry.is_dir()
+    ]
+
+
+def create_collections(paths: typing.Iterable[IngestPath]) -> None:
+    """Create the destination collections of all ``paths`` with one ``imkdir -p`` call."""
+    targets = sorted({path.target for path in paths})
+    if targets:
+        subprocess.run(["imkdir", "-p"] + targets, check=True)  # nosec
+
+
+def run_scan(
+    logger, path: IngestPath, event_handler: str, extra_args: typing.Sequence[str] = ()
+) -> ScanResult:
+    """Run ``irods_sync start --synchronous`` for ``path`` and return ``ScanResult``."""
+    cmd = [
+        sys.executable,
+        "-m",
+        IRODS_SYNC_PY,
+        "start",
+        "--event_handler",
+        event_handler,
+        "--synchronous",
+        "--job_name",
+        "rodeos-ingest-%s" % os.path.basename(path.source),
+        *extra_args,
+        path.source,
+        path.target,
+    ]
+    logger.info("starting scan of %s => %s" % (path.source, path.target))
+    start = time.monotonic()
+    returncode = subprocess.run(cmd).returncode  # nosec
+    result = ScanResult(path, returncode, time.monotonic() - start)
+    logger.info(
+        "scan of %s finished with code %d after %.1f seconds"
+        % (path.source, result.returncode, result.duration)
+    )
+    return result
+
+
+def format_report(results: typing.Iterable[ScanResult]) -> str:
+    """Return report with scan durations, slowest first."""
+    lines = ["duration_s\treturncode\tsource"]
+    for result in sorted(results, key=lambda r: -r.duration):
+        lines.append("%.1f\t%d\t%s" % (result.duration, result.returncode, result.path.source))
+    return "\n".join(lines)
+
+
+class Orchestrator:
+    """Schedule scans of several ``IngestPath`` objects concurrently."""
+
+    def __init__(
+        self,
+        logger,
+        paths: typing.Sequence[IngestPath],
+        event_handler: str,
+        parallelism: int = ORCHESTRATE_PARALLELISM,
+        interval: float = ORCHESTRATE_INTERVAL_SECONDS,
+        extra_args: typing.Sequence[str] = (),
+        scan: typing.Callable[..., ScanResult] = run_scan,
+    ):
+        #: Logger to use.
+        self.logger = logger
+        #: The paths to scan.
+        self.paths = list(paths)
+        #: Event handler module passed to ``irods_sync``.
+        self.event_handler = event_handler
+        #: Number of concurrent scans.
+        self.parallelism = max(1, parallelism)
+        #: Seconds between the end of a path's scan and its next scan.
+        self.interval = interval
+        #: Additional arguments for ``irods_sync start``.
+        self.extra_args = list(extra_args)
+        #: Callable performing the scan, replaceable for testing.
+        self.scan = scan
+
+    def run(self, rounds: typing.Optional[int] = None) -> typing.List[ScanResult]:
+        """Scan all paths ``rounds`` times (forever if ``None``) and return the results.
+
+        Only the last result per path is kept when running forever.
+        """
+        results: typing.List[ScanResult] = []
+        latest: typing.Dict[IngestPath, ScanResult] = {}
+        due = {path: 0.0 for path in self.paths}
+        counts = {path: 0 for path in self.paths}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            while running or any(rounds is None or c < rounds for c in counts.values()):
+                now = time.monotonic()
+                for path in sorted(due, key=due.get):
+                    if len(running) >= self.parallelism or due[path] > now:
+                        break
+                    del due[path]
+                    future = executor.submit(
+                        self.scan, self.logger, path, self.event_handler, self.extra_args
+                    )
+                    running[future] = path
+                # Block until a scan finishes while all slots are busy, otherwise wake up when
+                # the next path is due.
+                if len(running) < self.parallelism and due:
+                    timeout: typing.Optional[float] = max(0.0, min(due.values()) - now)
+                else:
+                    timeout = None
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = running.pop(future)
+                    result = future.result()
+                    latest[path] = result
+                    if rounds is not None:
+                        results.append(result)
+                    counts[path] += 1
+                    if rounds is None or counts[path] < rounds:
+                        due[path] = time.monotonic() + self.interval
+                    if all(c >= counts[path] for c in counts.values()):
+                        report = format_report(latest.values())
+                        self.logger.info("scan durations:\n%s" % report)
+        return results
+
+
+def main(argv=None):  # pragma: no cover
+    """Entry point for ``rodeos-ingest-orchestrate``."""
+    parser = argparse.ArgumentParser(description="Run ingest scans of several paths concurrently")
+    parser.add_argument(
+        "--ingest-root",
+        default=os.environ.get("RODEOS_INGEST_PATH"),
+        help="directory with ingest paths (default: $RODEOS_INGEST_PATH)",
+    )
+    parser.add_argument(
+        "--target",
+        default=None,
+        help="destination base collection "
+        "(default: /$IRODS_ZONE_NAME/home/$IRODS_USER/$RODEOS_TARGET_COLLECTION)",
+    )
+    parser.add_argument(
+        "--event-handler",
+        default=os.environ.get("RODEOS_EVENT_HANDLER"),
+        help="event handler module (default: $RODEOS_EVENT_HANDLER)",
+    )
+    parser.add_argument("--parallelism", type=int, default=ORCHESTRATE_PARALLELISM)
+    parser.add_argument("--interval", type=float, default=ORCHESTRATE_INTERVAL_SECONDS)
+    parser.add_argument("--once", action="store_true", help="scan each path only once")
+    parser.add_argument("extra_args", nargs="*", help="additional arguments for irods_sync")
+    args = parser.parse_args(argv)
+    if not args.ingest_root or not args.event_handler:
+        parser.error("--ingest-root and --event-handler are required")
+    target = args.target or "/%s/home/%s/%s" % (
+        os.environ.get("IRODS_ZONE_NAME", ""),
+        os.environ.get("IRODS_USER", ""),
+        os.environ.get("RODEOS_TARGET_COLLECTION", ""),
+    )
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("rodeos_ingest.orchestrate")
+    paths = discover_paths(args.ingest_root, target)
+    create_collections(paths)
+    orchestrator = Orchestrator(
+        logger, paths, args.event_handler, args.parallelism, args.interval, args.extra_args
+    )
+    results = orchestrator.run(1 if args.once else None)
+    return int(any(result.returncode for result in results))
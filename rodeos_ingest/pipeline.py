@@ -0,0 +1,107 @@
+"""Running blocking steps as an ``asyncio`` pipeline.
+
+Finalization of a run folder consists of steps that are bound by different resources, e.g.,
+hashing the local files is bound by the disk while ``ichksum`` and ``iquest`` are bound by the
+network and the iCAT.  ``Pipeline`` runs such blocking steps ("stages") in a thread pool such
+that independent stages can be awaited together, enforces per-stage timeouts, and records the
+duration of each stage.
+
+The ``asyncio`` module is imported on first use only, as the handler modules import this module.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import time
+import typing
+
+
+class StageTimeout(RuntimeError):
+    """Raised when a stage of a ``Pipeline`` exceeds its timeout."""
+
+
+def parse_timeouts(spec: str) -> typing.Dict[str, float]:
+    """Parse per-stage timeouts given as ``name=seconds[,name=seconds...]``."""
+    result = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        name, _, value = entry.partition("=")
+        result[name.strip()] = float(value)
+    return result
+
+
+class Pipeline:
+    """Run blocking callables as awaitable stages in a thread pool.
+
+    A timeout of ``0`` or ``None`` disables the timeout.  Note that a thread that runs a stage
+    cannot be interrupted; on timeout or cancellation the stage's result is abandoned.
+    """
+
+    def __init__(
+        self,
+        logger,
+        timeouts: typing.Optional[typing.Dict[str, float]] = None,
+        default_timeout: typing.Optional[float] = None,
+        max_workers: int = 4,
+    ):
+        #: Logger to use.
+        self.logger = logger
+        #: Timeouts by stage name.
+        self.timeouts = dict(timeouts or {})
+        #: Timeout for stages not in ``timeouts``.
+        self.default_timeout = default_timeout
+        #: Maximal number of stages running at the same time.
+        self.max_workers = max_workers
+        #: Durations of the completed stages in seconds.
+        self.durations: typing.Dict[str, float] = {}
+        #: The executor, only set while ``run()`` is active.
+        self._executor: typing.Optional[ThreadPoolExecutor] = None
+
+    async def stage(self, name: str, func: typing.Callable, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` as stage ``name`` and return its result."""
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        timeout = self.timeouts.get(name, self.default_timeout) or None
+        start = time.monotonic()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.logger.error("stage %s timed out after %s seconds" % (name, timeout))
+            raise StageTimeout("stage %s timed out after %s seconds" % (name, timeout))
+        self.durations[name] = time.monotonic() - start
+        self.logger.info("stage %s took %.2f seconds" % (name, self.durations[name]))
+        return result
+
+    async def gather(self, *awaitables) -> typing.List:
+        """Await all ``awaitables`` concurrently and return their results in order.
+
+        When one of them fails, the others are cancelled and the exception is raised.
+        """
+        import asyncio
+
+        futures = [asyncio.ensure_future(aw) for aw in awaitables]
+        _, pending = await asyncio.wait(futures, return_when=asyncio.FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
+
+    def run(self, coro):
+        """Run the coroutine ``coro`` in a new event loop and return its result."""
+        import asyncio
+
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        start = time.monotonic()
+        try:
+            loop.set_default_executor(self._executor)
+            return loop.run_until_complete(coro)
+        finally:
+            self.durations["total"] = time.monotonic() - start
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            loop.close()
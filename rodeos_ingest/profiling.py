@@ -0,0 +1,210 @@
+"""Sampling profiler for the event handlers.
+
+The handlers decorated with ``profiled`` and the finalization of run folders are profiled in
+sections: ``<handler>.pre_job``, ``<handler>.post_job``, ``<handler>.on_data_obj_create``,
+``<handler>.on_data_obj_modify`` (transfer and post hook of a file), and ``finalize``.  Job hooks
+and finalization are always profiled while profiling is enabled, file hooks only with the
+probability ``RODEOS_PROFILE_RATIO``.
+
+While a section is profiled, a thread samples the stacks of all threads of the process every
+``RODEOS_PROFILE_INTERVAL_MS`` milliseconds, so stages of the finalization pipeline that run in
+a thread pool are included.  The samples are aggregated per section and process and written in
+the folded format of ``flamegraph.pl`` (and other flame graph tools) to
+``<section>-<host>-<pid>.folded`` in ``RODEOS_PROFILE_DIR``.
+
+Profiling is enabled on start with ``RODEOS_PROFILE``.  It can be toggled in running workers by
+sending ``RODEOS_PROFILE_SIGNAL`` (default ``SIGUSR2``) to the worker processes, e.g.,
+``pkill -USR2 -f 'celery.*worker'``.
+"""
+
+from collections import Counter
+from contextlib import contextmanager
+import functools
+import os
+import pathlib
+import random
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import typing
+
+from rodeos_ingest.settings import (
+    RODEOS_PROFILE as PROFILE,
+    RODEOS_PROFILE_DIR as PROFILE_DIR,
+    RODEOS_PROFILE_INTERVAL_MS as PROFILE_INTERVAL_MS,
+    RODEOS_PROFILE_RATIO as PROFILE_RATIO,
+    RODEOS_PROFILE_SIGNAL as PROFILE_SIGNAL,
+)
+
+#: Profiled hooks and their sampling ratio, ``None`` for ``RODEOS_PROFILE_RATIO``.
+PROFILED_HOOKS = {
+    "pre_job": 1.0,
+    "post_job": 1.0,
+    "on_data_obj_create": None,
+    "on_data_obj_modify": None,
+}
+
+
+def fold_stack(frame) -> str:
+    """Return the stack of ``frame`` as ``module:function`` entries separated by ``;``."""
+    entries = []
+    while frame is not None:
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        entries.append("%s:%s" % (module, code.co_name))
+        frame = frame.f_back
+    return ";".join(reversed(entries))
+
+
+class StackSampler:
+    """Sample the stacks of all other threads in the background while active."""
+
+    def __init__(self, interval: float):
+        #: Seconds between samples.
+        self.interval = interval
+        #: Number of samples per folded stack.
+        self.stacks: typing.Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.stacks[fold_stack(frame)] += 1
+
+    def __enter__(self) -> "StackSampler":
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+class Profiler:
+    """Aggregated profiles of sections for one process."""
+
+    def __init__(
+        self,
+        directory: typing.Union[str, pathlib.Path],
+        ratio: float = PROFILE_RATIO,
+        interval: float = PROFILE_INTERVAL_MS / 1000.0,
+        enabled: bool = PROFILE,
+        random_func: typing.Callable[[], float] = random.random,
+    ):
+        #: Directory for the folded stack files.
+        self.directory = pathlib.Path(directory)
+        #: Probability of profiling sections without their own ratio.
+        self.ratio = ratio
+        #: Seconds between samples.
+        self.interval = interval
+        #: Whether profiling is enabled.
+        self.enabled = enabled
+        #: Random function, replaceable for testing.
+        self.random_func = random_func
+        #: Process that the profiler belongs to.
+        self.pid = os.getpid()
+        #: Aggregated samples by section.
+        self.stacks: typing.Dict[str, typing.Counter[str]] = {}
+        #: Lock for aggregating samples.
+        self._lock = threading.Lock()
+        #: Whether the current thread is in a profiled section, nested sections are not sampled.
+        self._local = threading.local()
+
+    def toggle(self) -> bool:
+        """Enable or disable profiling and return whether it is enabled now."""
+        self.enabled = not self.enabled
+        return self.enabled
+
+    @contextmanager
+    def section(self, name: str, ratio: typing.Optional[float] = None) -> typing.Iterator[bool]:
+        """Profile the body as section ``name`` if selected and yield whether so."""
+        ratio = self.ratio if ratio is None else ratio
+        if not self.enabled or getattr(self._local, "active", False) or self.random_func() >= ratio:
+            yield False
+            return
+        self._local.active = True
+        try:
+            with StackSampler(self.interval) as sampler:
+                yield True
+        finally:
+            self._local.active = False
+            with self._lock:
+                self.stacks.setdefault(name, Counter()).update(sampler.stacks)
+                self._write(name)
+
+    def path(self, name: str) -> pathlib.Path:
+        """Return path of the folded stack file for section ``name``."""
+        return self.directory / ("%s-%s-%d.folded" % (name, socket.gethostname(), self.pid))
+
+    def _write(self, name: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path(name).with_suffix(".tmp")
+        with tmp_path.open("wt") as outputf:
+            for stack, count in sorted(self.stacks[name].items()):
+                print("%s %d" % (stack, count), file=outputf)
+        os.replace(tmp_path, self.path(name))
+
+
+#: Profiler of this process, created on first use.
+_profiler: typing.Optional[Profiler] = None
+#: Lock for creating the profiler.
+_profiler_lock = threading.Lock()
+
+
+def _install_signal_handler(profiler: Profiler) -> None:
+    """Toggle ``profiler`` on ``RODEOS_PROFILE_SIGNAL``, only possible in the main thread."""
+    if not PROFILE_SIGNAL:
+        return
+    try:
+        signal.signal(getattr(signal, PROFILE_SIGNAL), lambda *_: profiler.toggle())
+    except ValueError:  # pragma: no cover
+        pass
+
+
+def get_profiler() -> Profiler:
+    """Return the profiler of this process."""
+    global _profiler
+    with _profiler_lock:
+        # Celery workers fork after importing the handlers, so there is one profiler per process.
+        if _profiler is None or _profiler.pid != os.getpid():
+            directory = PROFILE_DIR or os.path.join(tempfile.gettempdir(), "rodeos-profiles")
+            _profiler = Profiler(directory)
+            _install_signal_handler(_profiler)
+        return _profiler
+
+
+@contextmanager
+def profile_section(name: str, ratio: typing.Optional[float] = None) -> typing.Iterator[bool]:
+    """Profile the body as section ``name`` with the process's profiler, see ``Profiler``."""
+    with get_profiler().section(name, ratio) as selected:
+        yield selected
+
+
+def _profiled_hook(name: str, ratio: typing.Optional[float], func: typing.Callable):
+    """Return ``func`` wrapped for profiling its calls as section ``name``."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **options):
+        with profile_section(name, ratio):
+            return func(*args, **options)
+
+    return wrapper
+
+
+def profiled(cls):
+    """Class decorator for event handlers that profiles the ``PROFILED_HOOKS``."""
+    handler = cls.__module__.rsplit(".", 1)[-1]
+    for hook, ratio in PROFILED_HOOKS.items():
+        func = getattr(cls, hook, None)
+        if func is not None:
+            name = "%s.%s" % (handler, hook)
+            setattr(cls, hook, staticmethod(_profiled_hook(name, ratio, func)))
+    return cls
@@ -0,0 +1,41 @@
+"""Append-only progress files for resuming interrupted work.
+
+Used by the ``rodeos-ingest`` command line interface, the fixity audit, and the move engine.
+The last recorded status of an item wins, so items can be retried by appending a new line.
+"""
+
+import pathlib
+import threading
+import typing
+
+#: Status of successfully processed items.
+STATUS_OK = "ok"
+#: Status of items that were skipped, e.g., as they are not at rest yet.
+STATUS_SKIPPED = "skipped"
+#: Status of items for which processing failed.
+STATUS_FAILED = "failed"
+
+
+class Progress:
+    """Progress file with one ``status<TAB>item`` line per processed item."""
+
+    def __init__(self, path: typing.Union[str, pathlib.Path]):
+        #: Path to the progress file.
+        self.path = pathlib.Path(path)
+        #: Lock for appending from several threads.
+        self._lock = threading.Lock()
+
+    def succeeded(self) -> typing.Set[str]:
+        """Return items whose last recorded status is ``ok``."""
+        status: typing.Dict[str, str] = {}
+        if self.path.exists():
+            with self.path.open("rt") as inputf:
+                for line in inputf:
+                    value, _, item = line.rstrip("\n").partition("\t")
+                    status[item] = value
+        return {item for item, value in status.items() if value == STATUS_OK}
+
+    def record(self, item: str, status: str) -> None:
+        """Append ``status`` of ``item``."""
+        with self._lock, self.path.open("at") as outputf:
+            outputf.write("%s\t%s\n" % (status, item))
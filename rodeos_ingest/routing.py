@@ -0,0 +1,113 @@
+"""Routing of files to separate Celery queues.
+
+The automated ingest puts all files found by a scan into tasks on one file queue, so files that
+carry run-level meta data (e.g., ``RunInfo.xml``) and done markers wait behind thousands of bulk
+uploads.  The handlers can route files to dedicated queues that are served by their own worker
+pools (see ``utils/start-celery.sh``).  Routing is opt-in, a queue is only used if its name is
+set, and workers must consume it before, as rerouted files are not handled on the file queue:
+
+``RODEOS_QUEUE_METADATA``
+    meta data bearing files and done markers; these are also dispatched directly by the
+    ``pre_job`` hook for the top level of each folder, such that they are ingested within
+    seconds after a job starts instead of after the scan reaches them
+``RODEOS_QUEUE_LARGE``
+    files of the ``large`` upload strategy (see ``rodeos_ingest.upload``)
+
+All other files stay on the queue given to the scan.  When a file task finds a file that belongs
+to another queue, it enqueues a task for this file on that queue and handles the file as
+``NO_OP`` itself.
+"""
+
+import os
+import pathlib
+import typing
+
+from rodeos_ingest.server_copy import destination_root
+from rodeos_ingest.settings import (
+    RODEOS_QUEUE_LARGE as QUEUE_LARGE,
+    RODEOS_QUEUE_METADATA as QUEUE_METADATA,
+)
+from rodeos_ingest.upload import STRATEGY_LARGE, strategy_for
+
+#: Type of predicates deciding whether a file name is a meta data bearing file.
+MetadataPredicate = typing.Callable[[str], bool]
+
+
+def target_queue(
+    meta: typing.Dict[str, typing.Any], is_metadata: MetadataPredicate
+) -> typing.Optional[str]:
+    """Return the queue for the file in ``meta`` or ``None`` for the scan's file queue."""
+    if not isinstance(meta, dict) or "path" not in meta:
+        return None
+    if QUEUE_METADATA and is_metadata(os.path.basename(meta["path"])):
+        return QUEUE_METADATA
+    elif QUEUE_LARGE and strategy_for(meta) == STRATEGY_LARGE:
+        return QUEUE_LARGE
+    else:
+        return None
+
+
+def is_rerouted(meta: typing.Dict[str, typing.Any], is_metadata: MetadataPredicate) -> bool:
+    """Return whether the file in ``meta`` is handled by a task on another queue."""
+    queue = target_queue(meta, is_metadata)
+    return queue is not None and meta.get("queue_name") != queue
+
+
+def _enqueue(meta: typing.Dict[str, typing.Any], target: str, path: str, stats, queue: str) -> None:
+    """Enqueue a file task for ``path`` with ``stats`` on ``queue``, ``target`` is the root's."""
+    from irods_capability_automated_ingest import utils
+    from irods_capability_automated_ingest.tasks.filesystem_tasks import filesystem_sync_files
+
+    task_meta = {
+        **meta,
+        "path": path,
+        "target": target,
+        "task": "sync_files",
+        "chunk": {path: stats},
+        "queue_name": queue,
+        # The task on the original queue marks the file as synchronized before this one runs.
+        "ignore_cache": True,
+    }
+    utils.enqueue_task(filesystem_sync_files, task_meta)
+
+
+def _stats(path: str) -> typing.Dict[str, typing.Any]:
+    """Return file stats in the form used by the scanner."""
+    stat = os.lstat(path)
+    return {
+        "is_link": os.path.islink(path),
+        "is_socket": False,
+        "mtime": stat.st_mtime,
+        "ctime": stat.st_ctime,
+        "size": stat.st_size,
+    }
+
+
+def reroute(meta: typing.Dict[str, typing.Any], is_metadata: MetadataPredicate) -> bool:
+    """Enqueue the file in ``meta`` on its queue if it is another one and return whether so."""
+    if not is_rerouted(meta, is_metadata):
+        return False
+    queue = target_queue(meta, is_metadata)
+    _enqueue(meta, destination_root(meta), meta["path"], _stats(meta["path"]), queue)
+    return True
+
+
+def dispatch_metadata_files(
+    logger, meta: typing.Dict[str, typing.Any], is_metadata: MetadataPredicate
+) -> int:
+    """Enqueue the meta data files at the top level of the folders in ``meta["root"]``.
+
+    Return the number of enqueued files.
+    """
+    if not QUEUE_METADATA:
+        return 0
+    count = 0
+    for folder in sorted(pathlib.Path(meta["root"]).iterdir()):
+        if not folder.is_dir():
+            continue
+        for path in sorted(folder.iterdir()):
+            if path.is_file() and is_metadata(path.name):
+                _enqueue(meta, meta["target"], str(path), _stats(str(path)), QUEUE_METADATA)
+                count += 1
+    logger.info("dispatched %d meta data files to queue %s" % (count, QUEUE_METADATA))
+    return count
@@ -0,0 +1,125 @@
+"""Server-side copies of files identical to data objects ingested before.
+
+When a flowcell is demultiplexed again, many files of the new output folder (e.g., undetermined
+reads, unchanged lanes, reports) are byte-identical to data objects ingested before.  Before
+uploading a file of at least ``RODEOS_ILLUMINA_FASTQ_SERVER_COPY_MIN_SIZE`` bytes, the FASTQ
+handler looks up the data objects with the same size below the destination root.  If there are
+any, it hashes the file with the algorithms of their iRODS checksums (through the ``HashCache``,
+such that the local manifest and the comparison do not read it again) and compares the digests.
+If one matches, the data object is created by a server-side copy instead of a transfer and the
+source is recorded in the ``rodeos::ingest::copy_source`` AVU.
+
+This saves the transfer from the landing zone only, not storage: the copy is a separate data
+object with its own replica in the resource.  It gets its own iRODS checksum which is compared to
+the local manifest like for any other data object.
+"""
+
+import pathlib
+import re
+import typing
+
+from rodeos_ingest.common import _iquest
+from rodeos_ingest.digest import (
+    DigestAlgorithm,
+    UnknownDigestAlgorithm,
+    get_algorithm,
+    hash_file,
+    parse_irods_checksum,
+)
+from rodeos_ingest.hashcache import HashCache
+
+#: AVU key with the path of the data object that a data object was copied from on the server.
+KEY_COPY_SOURCE = "rodeos::ingest::copy_source"
+
+
+def destination_root(meta: typing.Dict[str, typing.Any]) -> str:
+    """Return the destination collection of the ingest root for the file in ``meta``."""
+    rel_path = pathlib.Path(meta["path"]).relative_to(meta["root"])
+    return meta["target"][: -(len(str(rel_path)) + 1)]
+
+
+def escape_like(value: str) -> str:
+    """Return ``value`` with the wildcards of a GenQuery ``like`` pattern escaped."""
+    return re.sub(r"([\\%_])", r"\\\1", value)
+
+
+def find_candidates(size: int, root: str, exclude: str = "") -> typing.Dict[str, typing.List[str]]:
+    """Return paths of data objects below ``root`` with ``size`` by their iRODS checksum.
+
+    Data objects without checksum and ``exclude`` are skipped, the paths are sorted.
+    """
+    lines = _iquest(
+        "%s\t%s/%s",
+        "SELECT DATA_CHECKSUM, COLL_NAME, DATA_NAME WHERE DATA_SIZE = '%d' "
+        "AND COLL_NAME like '%s/%%'" % (size, escape_like(root.rstrip("/"))),
+    )
+    result: typing.Dict[str, typing.List[str]] = {}
+    for line in sorted(lines):
+        checksum, _, path = line.partition("\t")
+        if checksum and path != exclude:
+            result.setdefault(checksum, []).append(path)
+    return result
+
+
+def find_duplicate(
+    path: str,
+    candidates: typing.Dict[str, typing.List[str]],
+    algorithm: DigestAlgorithm,
+    cache: typing.Optional[HashCache] = None,
+) -> typing.Optional[str]:
+    """Return the first of ``candidates`` (see ``find_candidates()``) identical to ``path``.
+
+    The file is read once and hashed with the algorithms of the candidates' checksums, whatever
+    iRODS checksum scheme they use, and with ``algorithm`` such that its digest is cached for the
+    local manifest.
+    """
+    parsed = {}
+    for checksum in candidates:
+        try:
+            parsed[checksum] = parse_irods_checksum(checksum.encode("ascii"))
+        except UnknownDigestAlgorithm:
+            continue
+    if not parsed:
+        return None
+    names = [algorithm.name] + sorted({name for name, _ in parsed.values()} - {algorithm.name})
+    algorithms = [get_algorithm(name) for name in names]
+    if cache:
+        digests = dict(zip(names, cache.hash_file(path, algorithms)))
+    else:
+        digests = dict(zip(names, hash_file(path, algorithms)))
+    matches = [
+        candidates[checksum][0]
+        for checksum, (name, digest) in parsed.items()
+        if digests[name].encode("ascii") == digest
+    ]
+    return min(matches) if matches else None
+
+
+def copy_on_server(
+    logger,
+    session,
+    meta: typing.Dict[str, typing.Any],
+    algorithm: DigestAlgorithm,
+    min_size: int,
+    cache: typing.Optional[HashCache] = None,
+) -> bool:
+    """Copy an identical data object to ``meta["target"]`` on the server, return whether done.
+
+    The file is only hashed if there are data objects of the same size, see ``find_duplicate()``.
+    """
+    size = int(meta.get("size") or 0)
+    if not min_size or size < min_size:
+        return False
+    candidates = find_candidates(size, destination_root(meta), meta["target"])
+    if not candidates:
+        return False
+    source = find_duplicate(meta["path"], candidates, algorithm, cache)
+    if source is None:
+        return False
+    logger.info("%s is identical to %s, copying on server" % (meta["path"], source))
+    session.data_objects.copy(source, meta["target"])
+    obj = session.data_objects.get(meta["target"])
+    from irods.meta import iRODSMeta
+
+    obj.metadata[KEY_COPY_SOURCE] = iRODSMeta(KEY_COPY_SOURCE, source, "")
+    return True
@@ -24,24 +24,196 @@ RODEOS_DELAY_UNTIL_AT_REST_SECONDS: int = int(
 
 #: Number of threads to use in ``hashdeep```.
 RODEOS_HASHDEEP_THREADS: int = int(os.environ.get("RODEOS_HASHDEEP_THREADS", "8"))
-#: Algorithm to use for hashing in ``hashdeep```.
+#: Algorithm to use for hashing in ``hashdeep```.  One of ``md5``, ``sha1``, ``sha256``,
+#: ``sha512``, ``blake2b``, or ``xxh64`` (requires the ``xxhash`` module).  Use the algorithm that
+#: matches the iRODS ``default_hash_scheme`` (e.g., ``sha256`` for ``SHA256``) so the local and
+#: iRODS manifests can be compared without computing a second digest.  Give a comma-separated
+#: list (e.g., ``md5,sha256``) to compute several digests from a single read of each file.
 RODEOS_HASHDEEP_ALGO: str = os.environ.get("RODEOS_HASHDEEP_ALGO", "md5")
+#: Engine for computing the local manifest, ``hashdeep`` or ``python``.  The ``python`` engine is
+#: always used for algorithms not supported by ``hashdeep``.
+RODEOS_MANIFEST_ENGINE: str = os.environ.get("RODEOS_MANIFEST_ENGINE", "hashdeep")
+
+#: Timeout in seconds for each stage of run folder finalization (e.g., local hashing, building
+#: the iRODS manifest, uploading the manifests), ``0`` for no timeout.
+RODEOS_FINALIZE_STAGE_TIMEOUT_SECONDS: int = int(
+    os.environ.get("RODEOS_FINALIZE_STAGE_TIMEOUT_SECONDS", "0")
+)
+#: Per-stage timeouts overriding ``RODEOS_FINALIZE_STAGE_TIMEOUT_SECONDS``, given as
+#: ``stage=seconds`` pairs separated by commas, e.g., ``local_manifest=86400,ichksum=3600``.
+#: The stages are ``bundle``, ``ichksum``, ``local_manifest``, ``irods_manifest``, ``compare``,
+#: ``put_local_manifest``, ``put_irods_manifest``, and ``move``.
+RODEOS_FINALIZE_STAGE_TIMEOUTS: str = os.environ.get("RODEOS_FINALIZE_STAGE_TIMEOUTS", "")
+#: Memory budget in bytes for comparing the manifests of a run folder, the records are held in
+#: a temporary SQLite database in ``RODEOS_FINALIZE_SPILL_DIR`` if they are estimated to need
+#: more, ``0`` for no budget.
+RODEOS_FINALIZE_MEMORY_BUDGET: int = int(
+    os.environ.get("RODEOS_FINALIZE_MEMORY_BUDGET", str(1024**3))
+)
+#: Directory for the temporary SQLite database of manifest comparisons over the memory budget,
+#: empty for the system's temporary directory.  Never a directory in the landing zone.
+RODEOS_FINALIZE_SPILL_DIR: str = os.environ.get("RODEOS_FINALIZE_SPILL_DIR", "")
+#: Whether to trace Python allocations with ``tracemalloc`` during finalization, recording their
+#: peak as a metric and logging the top allocation sites.
+RODEOS_FINALIZE_TRACEMALLOC: bool = (
+    os.environ.get("RODEOS_FINALIZE_TRACEMALLOC", "false").lower() in _TRUTHY
+)
+
+#: Chunk size in bytes for hashing large files in chunks in parallel.
+RODEOS_CHUNKED_HASHING_CHUNK_SIZE: int = int(
+    os.environ.get("RODEOS_CHUNKED_HASHING_CHUNK_SIZE", str(256 * 1024 * 1024))
+)
+
+#: Limit of bytes per second read when hashing local files, ``0`` for unlimited.  Setting any of
+#: the ``RODEOS_HASHING_*`` limits switches to the ``python`` manifest engine.
+RODEOS_HASHING_BYTES_PER_SECOND: float = float(
+    os.environ.get("RODEOS_HASHING_BYTES_PER_SECOND", "0")
+)
+#: Limit of read operations per second when hashing local files, ``0`` for unlimited.
+RODEOS_HASHING_IOPS: float = float(os.environ.get("RODEOS_HASHING_IOPS", "0"))
+#: Target read latency in milliseconds when hashing local files, ``0`` to disable.  When the
+#: observed latency is higher, the hashing limits above are lowered to yield to other writers.
+RODEOS_HASHING_TARGET_LATENCY_MS: float = float(
+    os.environ.get("RODEOS_HASHING_TARGET_LATENCY_MS", "0")
+)
+
+#: JSON file with the hashing thread counts per mount point written by ``rodeos-ingest
+#: calibrate``, empty to always use ``RODEOS_HASHDEEP_THREADS``.
+RODEOS_HASHING_TUNING_FILE: str = os.environ.get("RODEOS_HASHING_TUNING_FILE", "")
+#: Whether to adjust the number of hashing threads to the observed throughput while computing
+#: the local manifest (uses the ``python`` manifest engine).
+RODEOS_HASHING_AUTOTUNE: bool = (
+    os.environ.get("RODEOS_HASHING_AUTOTUNE", "false").lower() in _TRUTHY
+)
+#: Maximal number of hashing threads with ``RODEOS_HASHING_AUTOTUNE``.
+RODEOS_HASHING_MAX_THREADS: int = int(os.environ.get("RODEOS_HASHING_MAX_THREADS", "64"))
+
+#: SQLite database for caching digests of local files between server-side copies, local manifest,
+#: and comparison, empty to disable.  Setting it switches to the ``python`` manifest engine.
+RODEOS_HASH_CACHE: str = os.environ.get("RODEOS_HASH_CACHE", "")
+
+#: Directory for the change journals written by ``rodeos-ingest-watch``, empty to disable.  When
+#: set, run folders are only considered for finalization when the journal marks them as done.
+RODEOS_CHANGE_JOURNAL_DIR: str = os.environ.get("RODEOS_CHANGE_JOURNAL_DIR", "")
+
+#: Backend of the leases that keep workers from finalizing the same run folder at the same time,
+#: ``redis`` (the Redis of the automated ingest), ``file`` (single host), or empty to disable.
+RODEOS_LEASE_BACKEND: str = os.environ.get("RODEOS_LEASE_BACKEND", "redis")
+#: Directory for the lease files of the ``file`` backend, empty for a temporary directory.
+RODEOS_LEASE_DIR: str = os.environ.get("RODEOS_LEASE_DIR", "")
+#: Seconds until a lease expires unless renewed by the heartbeat of its holder.
+RODEOS_LEASE_TTL_SECONDS: float = float(os.environ.get("RODEOS_LEASE_TTL_SECONDS", "300"))
+
+#: Whether the handlers are profiled from the start, see ``rodeos_ingest.profiling``.
+RODEOS_PROFILE: bool = os.environ.get("RODEOS_PROFILE", "false").lower() in _TRUTHY
+#: Probability that a file hook call is profiled while profiling is enabled.
+RODEOS_PROFILE_RATIO: float = float(os.environ.get("RODEOS_PROFILE_RATIO", "0.01"))
+#: Milliseconds between stack samples of profiled calls.
+RODEOS_PROFILE_INTERVAL_MS: float = float(os.environ.get("RODEOS_PROFILE_INTERVAL_MS", "5"))
+#: Directory for the folded stack files, empty for a temporary directory.
+RODEOS_PROFILE_DIR: str = os.environ.get("RODEOS_PROFILE_DIR", "")
+#: Name of the signal that toggles profiling in a running worker process, empty for none.
+RODEOS_PROFILE_SIGNAL: str = os.environ.get("RODEOS_PROFILE_SIGNAL", "SIGUSR2")
+
+#: Directory for the traces of handler calls replayed by ``rodeos-ingest-replay``, empty to not
+#: record traces.
+RODEOS_TRACE_DIR: str = os.environ.get("RODEOS_TRACE_DIR", "")
+
+#: Celery queue for files with run-level meta data and done markers (e.g., ``rodeos-metadata``),
+#: empty to not route them.  Workers must consume the queue before routing is enabled.
+RODEOS_QUEUE_METADATA: str = os.environ.get("RODEOS_QUEUE_METADATA", "")
+#: Celery queue for files uploaded with the ``large`` strategy (e.g., ``rodeos-large``), empty to
+#: not route them.  Workers must consume the queue before routing is enabled.
+RODEOS_QUEUE_LARGE: str = os.environ.get("RODEOS_QUEUE_LARGE", "")
+
+#: Number of ingest paths that ``rodeos-ingest-orchestrate`` scans at the same time.
+RODEOS_ORCHESTRATE_PARALLELISM: int = int(os.environ.get("RODEOS_ORCHESTRATE_PARALLELISM", "4"))
+
+#: Seconds between the end of an ingest path's scan and the start of its next scan.
+RODEOS_ORCHESTRATE_INTERVAL_SECONDS: float = float(
+    os.environ.get("RODEOS_ORCHESTRATE_INTERVAL_SECONDS", "300")
+)
+
+#: Number of data objects that ``rodeos-ingest-audit`` verifies at the same time.
+RODEOS_AUDIT_JOBS: int = int(os.environ.get("RODEOS_AUDIT_JOBS", "4"))
+#: Budget of bytes per second verified by ``rodeos-ingest-audit``, ``0`` for unlimited.
+RODEOS_AUDIT_BYTES_PER_SECOND: float = float(
+    os.environ.get("RODEOS_AUDIT_BYTES_PER_SECOND", str(100 * 1024 * 1024))
+)
+#: Budget of iRODS operations per second of ``rodeos-ingest-audit``, ``0`` for unlimited.
+RODEOS_AUDIT_OPS_PER_SECOND: float = float(os.environ.get("RODEOS_AUDIT_OPS_PER_SECOND", "10"))
+#: Collections are audited again after this number of days.
+RODEOS_AUDIT_MIN_AGE_DAYS: float = float(os.environ.get("RODEOS_AUDIT_MIN_AGE_DAYS", "90"))
 
 #: Whether or not to look for external dependency.
 RODEOS_LOOK_FOR_EXECUTABLES: bool = (
     os.environ.get("RODEOS_LOOK_FOR_EXECUTABLES", "true").lower() in _TRUTHY
 )
+#: Timeout in seconds for each external tool to print its version in the startup check.
+RODEOS_TOOLS_CHECK_TIMEOUT_SECONDS: float = float(
+    os.environ.get("RODEOS_TOOLS_CHECK_TIMEOUT_SECONDS", "10")
+)
 
 #: Whether or not to move directories in ingest after completing item.
 RODEOS_MOVE_AFTER_INGEST: bool = os.environ.get(
     "RODEOS_MOVE_AFTER_INGEST", "true"
 ).lower() in _TRUTHY
 
+#: Number of threads for copying run folders when the ingested area is on another file system.
+RODEOS_MOVE_THREADS: int = int(os.environ.get("RODEOS_MOVE_THREADS", "4"))
+
+#: Files smaller than this number of bytes are uploaded single-stream and their checksums are
+#: computed by the recursive ``ichksum`` when the folder is finalized, ``0`` (the default) to
+#: disable, such that every file gets its checksum when it is uploaded.
+RODEOS_UPLOAD_SMALL_THRESHOLD: int = int(os.environ.get("RODEOS_UPLOAD_SMALL_THRESHOLD", "0"))
+#: Files of at least this number of bytes are uploaded with ``RODEOS_UPLOAD_THREADS`` parallel
+#: transfer threads, ``0`` to disable.
+RODEOS_UPLOAD_LARGE_THRESHOLD: int = int(
+    os.environ.get("RODEOS_UPLOAD_LARGE_THRESHOLD", str(1024 * 1024 * 1024))
+)
+#: Number of parallel transfer threads for large files.
+RODEOS_UPLOAD_THREADS: int = int(os.environ.get("RODEOS_UPLOAD_THREADS", "16"))
+
+#: Compression of the manifest files uploaded to iRODS, ``gzip``, ``zstd`` (requires the
+#: ``zstandard`` module, installed with the ``zstd`` extra), or empty for none.  Compressed manifests get a ``.gz`` or ``.zst``
+#: suffix and store the paths sorted and prefix-coded.
+RODEOS_MANIFEST_COMPRESSION: str = os.environ.get("RODEOS_MANIFEST_COMPRESSION", "")
+
 #: File name for local manifest file.
 RODEOS_MANIFEST_LOCAL: str = os.environ.get("RODEOS_MANIFEST_LOCAL", "_MANIFEST_LOCAL.txt")
 #: File name for iRODS manifest file.
 RODEOS_MANIFEST_IRODS: str = os.environ.get("RODEOS_MANIFEST_IRODS", "_MANIFEST_IRODS.txt")
 
+#: Comma-separated directories of Illumina run folders to bundle into one ``tar`` archive each
+#: (e.g., ``InterOp,Thumbnail_Images,Logs``) instead of uploading their files, empty to disable.
+#: The files are bundled when the run folder is finalized.
+RODEOS_ILLUMINA_BCL_BUNDLE_DIRS: str = os.environ.get("RODEOS_ILLUMINA_BCL_BUNDLE_DIRS", "")
+
+#: Directory to build the bundle archives in, outside of the scanned source tree, empty for the
+#: system's temporary directory.  The archives are removed after the upload.
+RODEOS_BUNDLE_STAGING_DIR: str = os.environ.get("RODEOS_BUNDLE_STAGING_DIR", "")
+
+#: Whether small files (see ``RODEOS_UPLOAD_SMALL_THRESHOLD``) in one file task of the Illumina
+#: BCL handler are handled as a batch: the run folder meta data is refreshed once for the batch
+#: over the shared session and the checksums are computed by one ``ichksum`` call at its end.
+RODEOS_ILLUMINA_BCL_BATCH_SMALL_FILES: bool = (
+    os.environ.get("RODEOS_ILLUMINA_BCL_BATCH_SMALL_FILES", "false").lower() in _TRUTHY
+)
+
+#: Files of at least this size in bytes in Illumina demultiplexing output are hashed in parallel
+#: chunks of ``RODEOS_CHUNKED_HASHING_CHUNK_SIZE`` (tree digest) for the local manifest, ``0`` to
+#: disable.  Such files are hashed again sequentially for comparison with iRODS checksums.
+RODEOS_ILLUMINA_FASTQ_CHUNKED_HASHING_THRESHOLD: int = int(
+    os.environ.get("RODEOS_ILLUMINA_FASTQ_CHUNKED_HASHING_THRESHOLD", "0")
+)
+
+#: Files of at least this size in bytes in Illumina demultiplexing output are hashed before the
+#: upload and copied on the server from an identical data object below the destination root if
+#: there is one, ``0`` to disable.  This saves the transfer only, the copy uses its own storage.
+RODEOS_ILLUMINA_FASTQ_SERVER_COPY_MIN_SIZE: int = int(
+    os.environ.get("RODEOS_ILLUMINA_FASTQ_SERVER_COPY_MIN_SIZE", "0")
+)
+
 #: Name of the "done" marker file for Illumina demultiplexing ingest.
 RODEOS_ILLUMINA_FASTQ_DONE_MARKER_FILE: str = os.environ.get(
     "RODEOS_ILLUMINA_FASTQ_DONE_MARKER_FILE", "DIGESTIFLOW_DEMUX_DONE.txt"
@@ -0,0 +1,133 @@
+"""Rate limiting with token buckets.
+
+A ``TokenBucket`` is filled with ``rate`` tokens per second up to ``capacity`` tokens.  Callers
+take tokens with ``acquire()`` and block until enough tokens are available.  Requests larger
+than the capacity are allowed but put the bucket into debt, such that, e.g., a large file that
+is hashed or verified in one go is paid for by the following callers.  A rate of ``0`` disables
+the limit.
+
+``IOGovernor`` combines a bucket for bytes and one for read operations and can adapt the limits
+to the observed read latency.
+"""
+
+import threading
+import time
+import typing
+
+
+class TokenBucket:
+    """Thread-safe token bucket."""
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: typing.Optional[float] = None,
+        clock: typing.Callable[[], float] = time.monotonic,
+        sleep: typing.Callable[[float], None] = time.sleep,
+    ):
+        #: Tokens added per second, ``0`` for unlimited.
+        self.rate = rate
+        #: Maximal number of tokens, defaults to one second worth of tokens.
+        self.capacity = capacity or rate
+        #: Clock function, replaceable for testing.
+        self.clock = clock
+        #: Sleep function, replaceable for testing.
+        self.sleep = sleep
+        #: Currently available tokens, negative when in debt.
+        self.tokens = self.capacity
+        #: Time of last refill.
+        self._last = clock()
+        #: Lock for updating the tokens.
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate: float, capacity: typing.Optional[float] = None) -> None:
+        """Change the rate (and capacity) of the bucket."""
+        with self._lock:
+            self._refill(self.clock())
+            self.rate = rate
+            self.capacity = capacity or rate
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Take ``amount`` tokens, block until they are available, and return the seconds waited."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(self.clock())
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self.sleep(wait)
+        return wait
+
+
+class IOGovernor:
+    """Limit bytes per second and I/O operations per second of reads.
+
+    With ``target_latency`` set, the observed read latency (exponentially weighted moving
+    average) is compared to the target after each read.  When it is exceeded the limits are
+    reduced multiplicatively down to ``min_fraction`` of the configured values, otherwise they are
+    raised additively again (AIMD).  Thus, readers back off when other processes, e.g.,
+    sequencers, are writing to the same storage.  Adaptation scales the configured limits, so at
+    least one of ``bytes_per_second`` and ``iops`` must be set for it to have an effect.
+    """
+
+    def __init__(
+        self,
+        bytes_per_second: float = 0,
+        iops: float = 0,
+        target_latency: float = 0,
+        min_fraction: float = 0.1,
+        clock: typing.Callable[[], float] = time.monotonic,
+        sleep: typing.Callable[[float], None] = time.sleep,
+    ):
+        #: Configured maximal bytes per second, ``0`` for unlimited.
+        self.bytes_per_second = bytes_per_second
+        #: Configured maximal read operations per second, ``0`` for unlimited.
+        self.iops = iops
+        #: Target read latency in seconds, ``0`` to disable adaptation.
+        self.target_latency = target_latency
+        #: Lower bound for the fraction of the configured limits.
+        self.min_fraction = min_fraction
+        #: Current fraction of the configured limits.
+        self.fraction = 1.0
+        #: Moving average of the read latency in seconds.
+        self.latency: typing.Optional[float] = None
+        #: Clock function, replaceable for testing.
+        self.clock = clock
+        #: Bucket for bytes.
+        self.bytes = TokenBucket(bytes_per_second, clock=clock, sleep=sleep)
+        #: Bucket for read operations.
+        self.ops = TokenBucket(iops, clock=clock, sleep=sleep)
+        #: Lock for adaptation.
+        self._lock = threading.Lock()
+
+    def read(self, fileobj: typing.BinaryIO, size: int) -> bytes:
+        """Read up to ``size`` bytes from ``fileobj`` within the limits."""
+        self.bytes.acquire(size)
+        self.ops.acquire()
+        start = self.clock()
+        data = fileobj.read(size)
+        self.observe(self.clock() - start)
+        return data
+
+    def observe(self, latency: float) -> None:
+        """Record read ``latency`` in seconds and adapt the limits."""
+        if not self.target_latency:
+            return
+        with self._lock:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            if self.latency > self.target_latency:
+                fraction = max(self.min_fraction, self.fraction * 0.9)
+            else:
+                fraction = min(1.0, self.fraction + 0.01)
+            if fraction != self.fraction:
+                self.fraction = fraction
+                if self.bytes_per_second:
+                    self.bytes.set_rate(self.bytes_per_second * fraction)
+                if self.iops:
+                    self.ops.set_rate(self.iops * fraction)
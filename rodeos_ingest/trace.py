@@ -0,0 +1,532 @@
+"""Recording and replay of event handler calls for benchmarking.
+
+When ``RODEOS_TRACE_DIR`` is set, the handlers decorated with ``traced`` record each call of
+``pre_job``, ``post_job``, ``post_data_obj_create``, and ``post_data_obj_update`` with start
+time, duration, and the relevant part of ``meta`` into a trace file per worker process
+(``trace-<host>-<pid>.jsonl.gz``).  Records are buffered and appended as gzip members, so the
+files stay compact and can be read while workers are still writing.
+
+The ``rodeos-ingest-replay`` entry point drives the recorded calls against a handler at the
+original speed (or accelerated by ``--speed``) with an in-memory fake of iRODS: sessions,
+``ichksum``, ``iquest``, leases, and task routing are replaced for the duration of the replay.
+The report lists throughput and latency percentiles per call type next to the recorded
+latencies, so handler changes can be benchmarked against traces from production scans.  Local
+files are still read, so use ``--map-path`` to point the trace at a copy of the run folders.
+"""
+
+import argparse
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import functools
+import gzip
+import importlib
+import json
+import logging
+import math
+import os
+import pathlib
+import socket
+import threading
+import time
+import typing
+
+import attr
+
+from rodeos_ingest import common, routing
+from rodeos_ingest.settings import RODEOS_TRACE_DIR as TRACE_DIR
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from irods.meta import iRODSMeta
+
+#: Traced hooks and the position of ``meta`` in their arguments.
+TRACED_HOOKS = {
+    "pre_job": 2,
+    "post_job": 2,
+    "post_data_obj_create": 3,
+    "post_data_obj_update": 3,
+}
+
+#: Keys of ``meta`` that are recorded.
+TRACE_META_KEYS = ("root", "target", "path", "size", "mtime", "ctime", "queue_name", "job_name")
+
+
+class TraceRecorder:
+    """Buffered writer of trace records to a gzip file."""
+
+    def __init__(self, path: typing.Union[str, pathlib.Path], buffer_size: int = 1000):
+        #: Path to the trace file.
+        self.path = pathlib.Path(path)
+        #: Number of records to buffer before appending them.
+        self.buffer_size = buffer_size
+        #: Process that the recorder belongs to.
+        self.pid = os.getpid()
+        #: Buffered records as JSON lines.
+        self._records: typing.List[str] = []
+        #: Lock for recording from several threads.
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        event: str,
+        start: float,
+        duration: float,
+        meta: typing.Any,
+        error: typing.Optional[str] = None,
+    ) -> None:
+        """Record call of ``event`` at ``start`` (epoch seconds) that took ``duration``."""
+        meta = meta if isinstance(meta, dict) else {}
+        record = {
+            "t": round(start, 6),
+            "d": round(duration, 6),
+            "e": event,
+            "m": {key: meta[key] for key in TRACE_META_KEYS if key in meta},
+        }
+        if error:
+            record["x"] = error
+        with self._lock:
+            self._records.append(json.dumps(record, separators=(",", ":")))
+            if len(self._records) >= self.buffer_size:
+                self._flush()
+
+    def flush(self) -> None:
+        """Append the buffered records to the trace file."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._records:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "ab") as outputf:
+            with gzip.GzipFile(fileobj=outputf, mode="wb") as gzipf:
+                gzipf.write(("\n".join(self._records) + "\n").encode("utf-8"))
+        self._records.clear()
+
+
+#: Recorder of this process, created on first use.
+_recorder: typing.Optional[TraceRecorder] = None
+#: Lock for creating the recorder.
+_recorder_lock = threading.Lock()
+#: Whether a replay is running in this process, calls are not recorded then.
+_replaying = False
+
+
+def get_recorder() -> typing.Optional[TraceRecorder]:
+    """Return the recorder of this process, ``None`` if tracing is disabled."""
+    global _recorder
+    if not TRACE_DIR or _replaying:
+        return None
+    with _recorder_lock:
+        # Celery workers fork after importing the handlers, so there is one file per process.
+        if _recorder is None or _recorder.pid != os.getpid():
+            name = "trace-%s-%d.jsonl.gz" % (socket.gethostname(), os.getpid())
+            _recorder = TraceRecorder(pathlib.Path(TRACE_DIR) / name)
+            atexit.register(_recorder.flush)
+        return _recorder
+
+
+def _traced_hook(event: str, meta_index: int, func: typing.Callable) -> typing.Callable:
+    """Return ``func`` wrapped for recording its calls as ``event``."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **options):
+        recorder = get_recorder()
+        if recorder is None:
+            return func(*args, **options)
+        start_time, start = time.time(), time.perf_counter()
+        error = None
+        try:
+            return func(*args, **options)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+            raise
+        finally:
+            recorder.record(event, start_time, time.perf_counter() - start, args[meta_index], error)
+            if event == "post_job":
+                recorder.flush()
+
+    return wrapper
+
+
+def traced(cls):
+    """Class decorator for event handlers that records calls of the ``TRACED_HOOKS``."""
+    for event, meta_index in TRACED_HOOKS.items():
+        func = getattr(cls, event, None)
+        if func is not None:
+            setattr(cls, event, staticmethod(_traced_hook(event, meta_index, func)))
+    return cls
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class TraceEvent:
+    """One recorded handler call."""
+
+    #: Start time in seconds since the epoch.
+    time: float
+    #: Duration in seconds.
+    duration: float
+    #: Name of the hook.
+    event: str
+    #: Recorded part of ``meta``.
+    meta: typing.Dict[str, typing.Any]
+    #: Error raised by the call, if any.
+    error: typing.Optional[str] = None
+
+
+def read_trace(paths: typing.Iterable[typing.Union[str, pathlib.Path]]) -> typing.List[TraceEvent]:
+    """Return the events of the trace files at ``paths`` ordered by time."""
+    events = []
+    for path in paths:
+        with gzip.open(path, "rt") as inputf:
+            for line in inputf:
+                if line.strip():
+                    record = json.loads(line)
+                    events.append(
+                        TraceEvent(
+                            record["t"], record["d"], record["e"], record["m"], record.get("x")
+                        )
+                    )
+    return sorted(events, key=lambda event: event.time)
+
+
+class _FakeMetadata:
+    """AVUs of a fake collection or data object."""
+
+    def __init__(self, backend: "FakeIrods"):
+        self._backend = backend
+        self._avus: typing.Dict[str, typing.List["iRODSMeta"]] = {}
+
+    def __setitem__(self, key: str, avu: "iRODSMeta") -> None:
+        self._backend.operation()
+        self._avus[key] = [avu]
+
+    def add(self, key: str, value: str, units: typing.Optional[str] = None) -> None:
+        from irods.meta import iRODSMeta
+
+        self._backend.operation()
+        self._avus.setdefault(key, []).append(iRODSMeta(key, value, units))
+
+    def get_all(self, key: str) -> typing.List["iRODSMeta"]:
+        self._backend.operation()
+        return list(self._avus.get(key, []))
+
+    def get_one(self, key: str) -> "iRODSMeta":
+        values = self.get_all(key)
+        if len(values) != 1:
+            raise KeyError(key)
+        return values[0]
+
+
+class _FakeEntry:
+    """Fake collection or data object."""
+
+    def __init__(self, backend: "FakeIrods", path: str):
+        #: Logical path.
+        self.path = path
+        #: Last path component.
+        self.name = path.rsplit("/", 1)[-1]
+        #: AVUs of the entry.
+        self.metadata = _FakeMetadata(backend)
+        self._backend = backend
+
+    @property
+    def subcollections(self) -> typing.List["_FakeEntry"]:
+        return self._backend.children(self.path)
+
+
+class _FakeManager:
+    """Fake ``collections`` or ``data_objects`` manager of a session."""
+
+    def __init__(self, backend: "FakeIrods", entries: typing.Dict[str, _FakeEntry]):
+        self._backend = backend
+        self._entries = entries
+
+    def get(self, path: str) -> _FakeEntry:
+        self._backend.operation()
+        with self._backend.lock:
+            if path not in self._entries:
+                self._entries[path] = _FakeEntry(self._backend, path)
+            return self._entries[path]
+
+
+class FakeIrods:
+    """In-memory stand-in for iRODS sessions that counts operations.
+
+    Collections and data objects spring into existence when they are first accessed.  Each
+    operation sleeps for ``latency`` seconds to simulate the round trip to the server.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        #: Seconds to sleep per operation.
+        self.latency = latency
+        #: Number of operations so far.
+        self.operations = 0
+        #: Lock for the entries and counter.
+        self.lock = threading.Lock()
+        self._collections: typing.Dict[str, _FakeEntry] = {}
+        #: The ``collections`` manager.
+        self.collections = _FakeManager(self, self._collections)
+        #: The ``data_objects`` manager.
+        self.data_objects = _FakeManager(self, {})
+
+    def operation(self) -> None:
+        """Count an operation and wait for the simulated latency."""
+        with self.lock:
+            self.operations += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def register(self, path: str) -> None:
+        """Create the collection at ``path`` and its parents."""
+        with self.lock:
+            while path and path != "/" and path not in self._collections:
+                self._collections[path] = _FakeEntry(self, path)
+                path = path.rsplit("/", 1)[0]
+
+    def children(self, path: str) -> typing.List[_FakeEntry]:
+        """Return the collections directly below ``path``."""
+        with self.lock:
+            return [
+                coll
+                for coll_path, coll in sorted(self._collections.items())
+                if coll_path.rsplit("/", 1)[0] == path
+            ]
+
+    def cleanup(self) -> None:
+        """Sessions of the fake have nothing to clean up."""
+
+    def session(self, *args, **kwargs) -> "FakeIrods":
+        """Return a session, replacement for ``irods_session()``."""
+        _, _ = args, kwargs
+        return self
+
+    def run_ichksum(self, irods_path, recurse: bool = False) -> None:
+        """Replacement for ``run_ichksum()``."""
+        _, _ = irods_path, recurse
+        self.operation()
+
+    def iquest(self, *args) -> typing.List[str]:
+        """Replacement for ``_iquest()`` that finds nothing."""
+        _ = args
+        self.operation()
+        return []
+
+
+@contextmanager
+def fake_backend(handler_module, backend: FakeIrods) -> typing.Iterator[FakeIrods]:
+    """Replace iRODS access, leases, and task routing for the handlers by ``backend``."""
+    global _replaying
+    replacements = [
+        (common, "irods_session", backend.session),
+        (common, "run_ichksum", backend.run_ichksum),
+        (common, "_iquest", backend.iquest),
+        (common, "open_lease", lambda *args: None),
+        (routing, "_enqueue", lambda *args: None),
+        (handler_module, "run_ichksum", backend.run_ichksum),
+    ]
+    originals = [(obj, name, getattr(obj, name)) for obj, name, _ in replacements]
+    for obj, name, value in replacements:
+        setattr(obj, name, value)
+    _replaying = True
+    try:
+        yield backend
+    finally:
+        _replaying = False
+        for obj, name, value in originals:
+            setattr(obj, name, value)
+
+
+def percentile(values: typing.Sequence[float], q: float) -> float:
+    """Return the ``q``-th percentile (nearest rank) of ``values``, ``0`` if empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReplayResult:
+    """Outcome of replaying one ``TraceEvent``."""
+
+    #: The replayed event.
+    event: TraceEvent
+    #: Duration of the replayed call in seconds.
+    duration: float
+    #: Seconds that the call started after its scheduled time.
+    lag: float
+    #: Error raised by the replayed call, if any.
+    error: typing.Optional[str] = None
+
+
+def _map_path(
+    meta: typing.Dict[str, typing.Any], path_map: typing.Sequence[typing.Tuple[str, str]]
+):
+    """Return copy of ``meta`` with the prefixes in ``path_map`` replaced in local paths."""
+    meta = dict(meta)
+    for key in ("root", "path"):
+        for old, new in path_map:
+            if key in meta and meta[key].startswith(old):
+                meta[key] = new + meta[key][len(old) :]
+                break
+    return meta
+
+
+class Replayer:
+    """Replay ``TraceEvent`` objects against an event handler with a ``FakeIrods`` backend."""
+
+    def __init__(
+        self,
+        logger,
+        handler_module,
+        speed: float = 1.0,
+        workers: int = 1,
+        backend: typing.Optional[FakeIrods] = None,
+        path_map: typing.Sequence[typing.Tuple[str, str]] = (),
+    ):
+        #: Logger to use and to pass to the handler.
+        self.logger = logger
+        #: Module with the ``event_handler`` class.
+        self.handler_module = handler_module
+        #: Speed-up relative to the recording, ``0`` to replay as fast as possible.
+        self.speed = speed
+        #: Number of concurrent calls.
+        self.workers = workers
+        #: The fake iRODS.
+        self.backend = backend or FakeIrods()
+        #: Prefixes of local paths to replace.
+        self.path_map = list(path_map)
+
+    def _call(self, event: TraceEvent, scheduled: float) -> ReplayResult:
+        handler = self.handler_module.event_handler
+        meta = _map_path(event.meta, self.path_map)
+        start = time.monotonic()
+        error = None
+        try:
+            if event.event in ("pre_job", "post_job"):
+                getattr(handler, event.event)(handler, self.logger, meta)
+            else:
+                getattr(handler, event.event)(handler, self.logger, self.backend, meta)
+        except Exception as e:
+            error = "%s: %s" % (type(e).__name__, e)
+        return ReplayResult(event, time.monotonic() - start, max(0.0, start - scheduled), error)
+
+    def run(self, events: typing.Sequence[TraceEvent]) -> "ReplayReport":
+        """Replay ``events`` and return the report."""
+        for event in events:
+            if "target" in event.meta:
+                self.backend.register(event.meta["target"].rsplit("/", 1)[0])
+        results = []
+        with fake_backend(self.handler_module, self.backend):
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = []
+                for event in events:
+                    offset = (event.time - events[0].time) / self.speed if self.speed else 0.0
+                    scheduled = start + offset
+                    delay = scheduled - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    futures.append(executor.submit(self._call, event, scheduled))
+                results = [future.result() for future in futures]
+            wall = time.monotonic() - start
+        return ReplayReport(results, wall, self.backend.operations)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class ReplayReport:
+    """Results of a replay."""
+
+    #: Results of the replayed calls in trace order.
+    results: typing.List[ReplayResult]
+    #: Wall clock duration of the replay in seconds.
+    wall: float
+    #: Number of operations on the fake iRODS.
+    operations: int
+
+    @property
+    def throughput(self) -> float:
+        """Return replayed calls per second."""
+        return len(self.results) / self.wall if self.wall else 0.0
+
+    def format(self) -> str:
+        """Return report with latency percentiles in milliseconds per call type."""
+        lines = [
+            "calls: %d, wall: %.3fs, throughput: %.1f calls/s, irods operations: %d"
+            % (len(self.results), self.wall, self.throughput, self.operations),
+            "event\tcalls\terrors\tp50_ms\tp90_ms\tp99_ms\tmax_ms\trecorded_p50_ms\trecorded_p99_ms",
+        ]
+        by_event: typing.Dict[str, typing.List[ReplayResult]] = {}
+        for result in self.results:
+            by_event.setdefault(result.event.event, []).append(result)
+        for name, results in sorted(by_event.items()):
+            durations = [result.duration * 1000 for result in results]
+            recorded = [result.event.duration * 1000 for result in results]
+            lines.append(
+                "%s\t%d\t%d\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f\t%.2f"
+                % (
+                    name,
+                    len(results),
+                    sum(1 for result in results if result.error),
+                    percentile(durations, 50),
+                    percentile(durations, 90),
+                    percentile(durations, 99),
+                    max(durations),
+                    percentile(recorded, 50),
+                    percentile(recorded, 99),
+                )
+            )
+        return "\n".join(lines)
+
+
+def _parse_path_map(value: str) -> typing.Tuple[str, str]:
+    old, sep, new = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected OLD=NEW, got %r" % value)
+    return old, new
+
+
+def main(argv=None):  # pragma: no cover
+    """Entry point for ``rodeos-ingest-replay``."""
+    parser = argparse.ArgumentParser(
+        description="Replay recorded handler calls against a fake iRODS"
+    )
+    parser.add_argument("traces", nargs="+", help="trace files written with RODEOS_TRACE_DIR")
+    parser.add_argument(
+        "--handler",
+        default="rodeos_ingest.genomics.illumina.bcl",
+        help="module with the event handler to replay against",
+    )
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="speed-up factor, 0 for as fast as possible"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="number of concurrent calls")
+    parser.add_argument(
+        "--irods-latency", type=float, default=0.0, help="seconds per fake iRODS operation"
+    )
+    parser.add_argument(
+        "--map-path",
+        type=_parse_path_map,
+        action="append",
+        default=[],
+        help="replace local path prefix OLD by NEW, e.g., to use a copy of the run folders",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logger = logging.getLogger("rodeos_ingest.trace")
+    events = read_trace(args.traces)
+    if not events:
+        parser.error("no events in traces")
+    replayer = Replayer(
+        logger,
+        importlib.import_module(args.handler),
+        args.speed,
+        args.workers,
+        FakeIrods(args.irods_latency),
+        args.map_path,
+    )
+    report = replayer.run(events)
+    print(report.format())
+    return 0
@@ -0,0 +1,211 @@
+"""Tuning of the hashing concurrency to the storage.
+
+The best number of hashing threads depends on the storage, e.g., SSD scratch space profits from
+many concurrent reads while spinning disks get slower with more than a few.  This module provides:
+
+- ``calibrate()`` measures the hashing throughput below a directory at different concurrency
+  levels, ``optimal_threads()`` picks the smallest level that reaches nearly the best throughput,
+- ``TuningStore`` persists the result per mount point in a JSON file
+  (``RODEOS_HASHING_TUNING_FILE``) from which ``threads_for()`` looks up the thread count for a
+  run folder,
+- ``ConcurrencyController`` adjusts the number of concurrent hashing workers while a manifest is
+  computed, based on the throughput observed in the last interval (hill climbing).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import threading
+import time
+import typing
+
+from rodeos_ingest.digest import DigestAlgorithm, hash_file
+
+#: Default concurrency levels for calibration.
+DEFAULT_LEVELS = (1, 2, 4, 8, 16, 32)
+#: Fraction of the best throughput that is considered good enough.
+GOOD_ENOUGH = 0.95
+
+
+def mount_point(path: typing.Union[str, os.PathLike]) -> str:
+    """Return the mount point of the file system containing ``path``."""
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def _drop_cache(path: str) -> None:
+    """Advise the kernel to drop ``path`` from the page cache, if supported."""
+    if hasattr(os, "posix_fadvise"):  # pragma: no branch
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def _sample_files(src_folder, sample_bytes: int) -> typing.List[str]:
+    """Return paths of the largest files below ``src_folder`` up to ``sample_bytes`` in total."""
+    files = []
+    for root, _, names in os.walk(src_folder):
+        for name in names:
+            path = os.path.join(root, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                files.append((os.path.getsize(path), path))
+    result, total = [], 0
+    for size, path in sorted(files, reverse=True):
+        if total >= sample_bytes:
+            break
+        result.append(path)
+        total += size
+    return result
+
+
+def calibrate(
+    src_folder,
+    algorithms: typing.Sequence[DigestAlgorithm],
+    levels: typing.Sequence[int] = DEFAULT_LEVELS,
+    sample_bytes: int = 4 * 1024 * 1024 * 1024,
+) -> typing.Dict[int, float]:
+    """Return hashing throughput in bytes per second below ``src_folder`` by concurrency level.
+
+    The same sample of files is hashed once per level, the files are dropped from the page
+    cache before each pass where the operating system supports it.
+    """
+    files = _sample_files(src_folder, sample_bytes)
+    total = sum(os.path.getsize(path) for path in files)
+    result = {}
+    for level in levels:
+        for path in files:
+            _drop_cache(path)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=level) as executor:
+            list(executor.map(lambda path: hash_file(path, algorithms), files))
+        result[level] = total / max(time.monotonic() - start, 1e-9)
+    return result
+
+
+def optimal_threads(throughput: typing.Dict[int, float]) -> int:
+    """Return the smallest level reaching ``GOOD_ENOUGH`` of the best throughput."""
+    best = max(throughput.values())
+    return min(level for level, value in throughput.items() if value >= GOOD_ENOUGH * best)
+
+
+class TuningStore:
+    """JSON file with the calibration results by mount point."""
+
+    def __init__(self, path: typing.Union[str, os.PathLike]):
+        #: Path to the JSON file.
+        self.path = path
+
+    def load(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Return all entries by mount point."""
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "rt") as inputf:
+            return json.load(inputf)
+
+    def get(self, mount: str) -> typing.Optional[int]:
+        """Return stored thread count for ``mount``, if any."""
+        entry = self.load().get(mount)
+        return entry["threads"] if entry else None
+
+    def put(self, mount: str, throughput: typing.Dict[int, float]) -> int:
+        """Store calibration ``throughput`` for ``mount`` and return the optimal thread count."""
+        data = self.load()
+        threads = optimal_threads(throughput)
+        data[mount] = {
+            "threads": threads,
+            "throughput": {str(level): value for level, value in sorted(throughput.items())},
+            "calibrated": datetime.datetime.now().isoformat(),
+        }
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, "wt") as outputf:
+            json.dump(data, outputf, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        return threads
+
+
+def threads_for(src_folder, tuning_file: str, default: int) -> int:
+    """Return stored thread count for the mount point of ``src_folder`` or ``default``."""
+    if not tuning_file:
+        return default
+    return TuningStore(tuning_file).get(mount_point(src_folder)) or default
+
+
+class ConcurrencyController:
+    """Adjust the number of concurrent workers to the observed throughput.
+
+    Workers wrap their work in ``slot()`` and report processed bytes with ``record()``.  After
+    each ``interval`` seconds the throughput is compared to the one of the previous interval.
+    The limit keeps moving in the same direction (doubling or halving) while the throughput
+    improves by more than ``tolerance`` and reverses its direction otherwise.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 64,
+        interval: float = 10.0,
+        tolerance: float = 0.05,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        #: Bounds of the limit.
+        self.minimum, self.maximum = minimum, maximum
+        #: Current number of allowed concurrent workers.
+        self.limit = max(minimum, min(maximum, initial))
+        #: Seconds per measurement interval.
+        self.interval = interval
+        #: Relative improvement required to keep the direction.
+        self.tolerance = tolerance
+        #: Clock function, replaceable for testing.
+        self.clock = clock
+        #: Direction of the next change, ``1`` for up and ``-1`` for down.
+        self.direction = 1
+        #: Throughput of the previous interval.
+        self.last_throughput: typing.Optional[float] = None
+        #: Number of workers currently running.
+        self.active = 0
+        #: Bytes processed in the current interval.
+        self._bytes = 0
+        #: Start of the current interval.
+        self._start = clock()
+        #: Condition for waiting for a free slot.
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        """Wait for and occupy a worker slot."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self._cond.notify_all()
+
+    def record(self, nbytes: int) -> None:
+        """Record ``nbytes`` processed bytes and adjust the limit at the end of an interval."""
+        with self._cond:
+            self._bytes += nbytes
+            now = self.clock()
+            if now - self._start < self.interval:
+                return
+            throughput = self._bytes / (now - self._start)
+            self._bytes, self._start = 0, now
+            if self.last_throughput is not None and throughput < self.last_throughput * (
+                1 + self.tolerance
+            ):
+                self.direction = -self.direction
+            self.last_throughput = throughput
+            if self.direction > 0:
+                self.limit = min(self.maximum, self.limit * 2)
+            else:
+                self.limit = max(self.minimum, self.limit // 2)
+            self._cond.notify_all()
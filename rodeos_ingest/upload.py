@@ -0,0 +1,181 @@
+"""Size-tiered upload of files by the event handlers.
+
+The handlers pick one of three strategies per file from the size in ``meta``:
+
+``small`` (below ``RODEOS_UPLOAD_SMALL_THRESHOLD``, disabled by default)
+    single-stream put without the parallel transfer setup; the checksum is not computed per file
+    but by the batched ``ichksum -r`` when the run folder is finalized
+``standard``
+    default put and per-file ``ichksum``
+``large`` (at least ``RODEOS_UPLOAD_LARGE_THRESHOLD``)
+    parallel put with ``RODEOS_UPLOAD_THREADS`` transfer threads and per-file ``ichksum``
+
+The choice, the transfer duration, and the rate are logged for each file.  They are not written
+to AVUs, which would add an iCAT row and a connection per data object.
+
+The automated ingest puts up to ``--files_per_task`` files of one directory into each file task.
+``SmallFileBatches`` tracks the small files of a task, such that handlers can do per-folder work
+once per task instead of once per file.
+"""
+
+import time
+import typing
+
+from irods_capability_automated_ingest.core import Core
+
+from rodeos_ingest.settings import (
+    RODEOS_UPLOAD_LARGE_THRESHOLD as UPLOAD_LARGE_THRESHOLD,
+    RODEOS_UPLOAD_SMALL_THRESHOLD as UPLOAD_SMALL_THRESHOLD,
+    RODEOS_UPLOAD_THREADS as UPLOAD_THREADS,
+)
+
+#: Strategy for small files.
+STRATEGY_SMALL = "small"
+#: Strategy for files between the thresholds.
+STRATEGY_STANDARD = "standard"
+#: Strategy for large files.
+STRATEGY_LARGE = "large"
+
+
+def choose_strategy(
+    size: int,
+    small_threshold: int = UPLOAD_SMALL_THRESHOLD,
+    large_threshold: int = UPLOAD_LARGE_THRESHOLD,
+) -> str:
+    """Return the upload strategy for a file of ``size`` bytes, thresholds of ``0`` disable."""
+    if large_threshold and size >= large_threshold:
+        return STRATEGY_LARGE
+    elif small_threshold and size < small_threshold:
+        return STRATEGY_SMALL
+    else:
+        return STRATEGY_STANDARD
+
+
+def strategy_for(meta: typing.Dict[str, typing.Any]) -> str:
+    """Return the upload strategy for the file described by ``meta``, ``standard`` if unsized."""
+    if meta.get("size") is None:
+        return STRATEGY_STANDARD
+    return choose_strategy(int(meta["size"]), UPLOAD_SMALL_THRESHOLD, UPLOAD_LARGE_THRESHOLD)
+
+
+def transfer_options(
+    strategy: str, options: typing.Dict[str, typing.Any], threads: int = UPLOAD_THREADS
+) -> typing.Dict[str, typing.Any]:
+    """Return put ``options`` extended for ``strategy``."""
+    if strategy == STRATEGY_LARGE:
+        return {**options, "num_threads": threads}
+    elif strategy == STRATEGY_SMALL:
+        return {**options, "num_threads": 1}
+    else:
+        return options
+
+
+def checksum_deferred(meta: typing.Dict[str, typing.Any]) -> bool:
+    """Return whether the checksum of the file is left to the batched ``ichksum -r``."""
+    return strategy_for(meta) == STRATEGY_SMALL
+
+
+class SmallFileBatches:
+    """Small files of the file tasks handled by this worker process.
+
+    A batch is identified by the first path of the task's ``meta["chunk"]``.  Tasks of a worker
+    process run one after another, so when a file of a new batch is added, the batches of earlier
+    tasks are complete even if the last files of their chunks were unchanged and not handled.
+    """
+
+    def __init__(self):
+        #: Targets of the files added to each batch.
+        self.targets: typing.Dict[str, typing.List[str]] = {}
+
+    @staticmethod
+    def key(meta: typing.Dict[str, typing.Any]) -> typing.Optional[str]:
+        """Return the batch of the file in ``meta``, ``None`` if it is not small or alone."""
+        chunk = meta.get("chunk") or {}
+        if len(chunk) < 2 or strategy_for(meta) != STRATEGY_SMALL:
+            return None
+        return next(iter(chunk))
+
+    def add(
+        self, meta: typing.Dict[str, typing.Any], target: typing.Optional[str] = None
+    ) -> typing.Tuple[bool, typing.List[str]]:
+        """Add the file in ``meta`` to its batch, with ``target`` if given.
+
+        Return whether the file is the first of its batch and the targets of all batches that
+        are complete now.
+        """
+        key = self.key(meta)
+        first = key not in self.targets
+        complete = []
+        for other in [other for other in self.targets if other != key]:
+            complete += self.targets.pop(other)
+        targets = self.targets.setdefault(key, [])
+        if target:
+            targets.append(target)
+        if meta["path"] == next(reversed(meta["chunk"])):
+            complete += self.targets.pop(key)
+        return first, complete
+
+
+def _no_transfer(*args, **options) -> None:
+    """Replacement for the transfer of files copied on the server."""
+    _, _ = args, options
+
+
+class TieredUpload(Core):
+    """Base class for event handlers that upload files with a size-tiered strategy.
+
+    Before new files are uploaded, ``copy_on_server()`` is called and the transfer is skipped if
+    it returns ``True``.
+    """
+
+    @staticmethod
+    def copy_on_server(logger, session, meta) -> bool:
+        """Store the file in ``meta`` without transfer if possible and return whether done."""
+        _, _, _ = logger, session, meta
+        return False
+
+    @classmethod
+    def on_data_obj_create(cls, func, *args, **options):
+        cls._tiered(super().on_data_obj_create, func, args, options)
+
+    @classmethod
+    def on_data_obj_modify(cls, func, *args, **options):
+        cls._tiered(super().on_data_obj_modify, func, args, options)
+
+    @classmethod
+    def _tiered(cls, on_event, func, args, options):
+        """Call ``on_event`` with ``func`` timed and ``options`` adjusted to the file's strategy."""
+        # The automated ingest has imported these when calling the hooks.
+        from irods_capability_automated_ingest.sync_irods import sync_file, upload_file
+        from irods_capability_automated_ingest.utils import Operation
+
+        if func not in (upload_file, sync_file):
+            return on_event(func, *args, **options)
+        _, logger, session, meta = args[:4]
+        if func is upload_file and cls.copy_on_server(logger, session, meta):
+            logger.info("copied %s on the server (%s bytes)" % (meta["path"], meta.get("size")))
+            return on_event(_no_transfer, *args, **options)
+        strategy = strategy_for(meta)
+        durations = []
+
+        def _timed(*func_args, **func_options):
+            start = time.monotonic()
+            func(*func_args, **func_options)
+            durations.append(time.monotonic() - start)
+
+        if func is sync_file and args[5] == Operation.PUT_APPEND:
+            # Appending writes through an opened data object, there are no put options.
+            on_event(_timed, *args, **options)
+        else:
+            on_event(_timed, *args, **transfer_options(strategy, options))
+        size = int(meta.get("size") or 0)
+        logger.info(
+            "uploaded %s (%s bytes) with strategy %s in %.3fs (%.1f MB/s)"
+            % (
+                meta["path"],
+                meta.get("size"),
+                strategy,
+                durations[0],
+                size / 1e6 / durations[0] if durations[0] else 0.0,
+            )
+        )
@@ -0,0 +1,329 @@
+"""Incremental change feed for the landing zone based on Linux ``inotify``.
+
+The watcher service (``rodeos-ingest-watch``) watches all run folders below a landing zone root
+directory and keeps a ``ChangeJournal`` per run folder in ``RODEOS_CHANGE_JOURNAL_DIR``:
+
+- changed paths are appended to the journal,
+- the ``rodeos::ingest::last_update`` meta data of the destination collection is refreshed
+  through ``refresh_last_update_metadata()`` for folders with changes,
+- the done-marker detection of the handler (``is_runfolder_done``/``is_demuxfolder_done``) is
+  only run when a file is written to the top level of a run folder, and the result is stored in
+  the journal state.
+
+When ``RODEOS_CHANGE_JOURNAL_DIR`` is set, ``post_job()`` uses the journal state to skip run
+folders that are not done without touching the file system, such that the cost of a scan is
+proportional to the changes and not to the data at rest.
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import select
+import struct
+import time
+import typing
+
+from rodeos_ingest.settings import RODEOS_CHANGE_JOURNAL_DIR as CHANGE_JOURNAL_DIR
+
+#: ``inotify`` event mask bits, see ``inotify(7)``.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#: The events to watch for.
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_ATTRIB
+
+#: Layout of ``struct inotify_event`` without the trailing name.
+_EVENT_STRUCT = struct.Struct("iIII")
+
+
+class InotifyEvent(typing.NamedTuple):
+    """An event read from ``inotify``."""
+
+    #: Path of the file or directory that the event is for.
+    path: str
+    #: The event mask.
+    mask: int
+
+
+class Inotify:
+    """Thin ``ctypes`` wrapper around the Linux ``inotify`` API with recursive watches."""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:  # pragma: no cover
+            raise OSError("could not find libc for inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:  # pragma: no cover
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        #: Mapping from watch descriptor to directory path.
+        self.watches: typing.Dict[int, str] = {}
+
+    def add_watch(self, path: str, recursive: bool = True) -> None:
+        """Watch the directory ``path`` and (if ``recursive``) all directories below."""
+        for root, _, _ in os.walk(path) if recursive else [(path, [], [])]:
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:  # pragma: no cover
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, os.strerror(err), root)
+            self.watches[wd] = root
+
+    def read_events(self, timeout: typing.Optional[float] = None) -> typing.List[InotifyEvent]:
+        """Wait up to ``timeout`` seconds for events and return them.
+
+        Newly created directories are watched automatically.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:  # pragma: no cover
+            return []
+        result = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, _, length = _EVENT_STRUCT.unpack_from(buf, offset)
+            offset += _EVENT_STRUCT.size
+            name = os.fsdecode(buf[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            if wd not in self.watches:  # pragma: no cover
+                continue
+            path = os.path.join(self.watches[wd], name) if name else self.watches[wd]
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_watch(path)
+            result.append(InotifyEvent(path, mask))
+        return result
+
+    def close(self) -> None:
+        """Close the ``inotify`` file descriptor."""
+        os.close(self.fd)
+
+
+class ChangeJournal:
+    """Change journal of one run folder.
+
+    The changed paths are appended to ``<name>.journal`` and the summary state (time of the last
+    change, whether the folder is done) is kept in ``<name>.state.json`` in ``journal_dir``.
+    """
+
+    def __init__(self, journal_dir: str, name: str):
+        #: Directory with the journal files.
+        self.journal_dir = journal_dir
+        #: Name of the run folder.
+        self.name = name
+        #: Path to the journal file.
+        self.journal_path = os.path.join(journal_dir, "%s.journal" % name)
+        #: Path to the state file.
+        self.state_path = os.path.join(journal_dir, "%s.state.json" % name)
+
+    def read_state(self) -> typing.Dict[str, typing.Any]:
+        """Return the current state, an empty ``dict`` if there is none yet."""
+        try:
+            with open(self.state_path, "rt") as inputf:
+                return json.load(inputf)
+        except (OSError, ValueError):
+            return {}
+
+    def write_state(self, **values) -> None:
+        """Update the state with ``values`` atomically."""
+        state = {**self.read_state(), **values}
+        os.makedirs(self.journal_dir, exist_ok=True)
+        tmp_path = "%s.tmp" % self.state_path
+        with open(tmp_path, "wt") as outputf:
+            json.dump(state, outputf)
+        os.replace(tmp_path, self.state_path)
+
+    def record(self, rel_paths: typing.Iterable[str], now: typing.Optional[float] = None) -> None:
+        """Append changed ``rel_paths`` to the journal and update the time of last change."""
+        now = time.time() if now is None else now
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(self.journal_path, "at") as outputf:
+            for rel_path in rel_paths:
+                print("%.3f\t%s" % (now, rel_path), file=outputf)
+        self.write_state(last_change=now)
+
+    def changes_since(self, since: float) -> typing.List[str]:
+        """Return the paths changed since ``since`` (seconds since epoch)."""
+        result = []
+        try:
+            with open(self.journal_path, "rt") as inputf:
+                for line in inputf:
+                    timestamp, _, rel_path = line.rstrip("\n").partition("\t")
+                    if float(timestamp) >= since:
+                        result.append(rel_path)
+        except OSError:
+            pass
+        return result
+
+    def is_done(self) -> typing.Optional[bool]:
+        """Return whether the run folder has been detected as done, ``None`` if unknown."""
+        return self.read_state().get("done")
+
+
+def get_journal(src_folder) -> typing.Optional[ChangeJournal]:
+    """Return ``ChangeJournal`` for ``src_folder`` if ``RODEOS_CHANGE_JOURNAL_DIR`` is set."""
+    if not CHANGE_JOURNAL_DIR:
+        return None
+    src_folder = os.path.abspath(src_folder)
+    root_name = os.path.basename(os.path.dirname(src_folder))
+    return ChangeJournal(os.path.join(CHANGE_JOURNAL_DIR, root_name), os.path.basename(src_folder))
+
+
+class Watcher:
+    """Watch the run folders below ``root`` and maintain their change journals."""
+
+    def __init__(
+        self,
+        logger,
+        root: str,
+        is_folder_done: typing.Callable[[str], bool],
+        on_changes: typing.Optional[typing.Callable[[str, typing.List[str]], None]] = None,
+        journal_dir: typing.Optional[str] = None,
+    ):
+        #: Logger to use.
+        self.logger = logger
+        #: Root of the landing zone.
+        self.root = os.path.abspath(root)
+        #: Callable for detecting whether a run folder is done.
+        self.is_folder_done = is_folder_done
+        #: Callable that is called with run folder name and changed relative paths.
+        self.on_changes = on_changes
+        #: Directory with the journals of this root.
+        self.journal_dir = journal_dir or os.path.join(
+            CHANGE_JOURNAL_DIR, os.path.basename(self.root)
+        )
+        #: The ``Inotify`` instance, set in ``start()``.
+        self.inotify: typing.Optional[Inotify] = None
+
+    def journal(self, name: str) -> ChangeJournal:
+        """Return ``ChangeJournal`` for run folder ``name``."""
+        return ChangeJournal(self.journal_dir, name)
+
+    def start(self) -> None:
+        """Start watching and bring the done state of all run folders up to date."""
+        self.inotify = Inotify()
+        self.inotify.add_watch(self.root)
+        for entry in sorted(os.scandir(self.root), key=lambda e: e.name):
+            if entry.is_dir():
+                self._update_done(entry.name)
+
+    def _update_done(self, name: str) -> None:
+        journal = self.journal(name)
+        try:
+            done = bool(self.is_folder_done(os.path.join(self.root, name)))
+        except Exception as e:  # e.g., partially written XML file
+            self.logger.warning("could not check whether %s is done: %s" % (name, e))
+            done = False
+        if done is not journal.is_done():
+            self.logger.info("run folder %s done state is now %s" % (name, done))
+            journal.write_state(done=done)
+
+    def poll(self, timeout: typing.Optional[float] = None) -> typing.Dict[str, typing.List[str]]:
+        """Process pending events and return the changed relative paths by run folder."""
+        changes: typing.Dict[str, typing.List[str]] = {}
+        check_done = set()
+        for event in self.inotify.read_events(timeout):
+            if event.mask & IN_Q_OVERFLOW:  # pragma: no cover
+                self.logger.warning("inotify queue overflow, rescanning done state")
+                check_done.update(e.name for e in os.scandir(self.root) if e.is_dir())
+                continue
+            rel_path = os.path.relpath(event.path, self.root)
+            if rel_path == "." or event.mask & IN_ISDIR:
+                continue
+            name, _, rel_folder_path = rel_path.partition(os.sep)
+            if not rel_folder_path:
+                continue
+            changes.setdefault(name, []).append(rel_folder_path)
+            if os.sep not in rel_folder_path:
+                check_done.add(name)
+        for name, rel_paths in changes.items():
+            self.journal(name).record(sorted(set(rel_paths)))
+            if self.on_changes:
+                self.on_changes(name, rel_paths)
+        for name in sorted(check_done):
+            if os.path.isdir(os.path.join(self.root, name)):
+                self._update_done(name)
+        return changes
+
+    def run(self, interval: float = 5.0) -> None:  # pragma: no cover
+        """Run the watcher loop, collecting events for ``interval`` seconds each."""
+        self.start()
+        while True:
+            deadline = time.monotonic() + interval
+            while time.monotonic() < deadline:
+                self.poll(max(0.0, deadline - time.monotonic()))
+
+
+def _make_refresher(logger, root: str, target: str):  # pragma: no cover
+    """Return ``on_changes`` callback that refreshes the ``last_update`` meta data."""
+    from irods.session import iRODSSession
+
+    from rodeos_ingest.common import refresh_last_update_metadata
+
+    env_file = os.environ.get(
+        "IRODS_ENVIRONMENT_FILE", os.path.expanduser("~/.irods/irods_environment.json")
+    )
+
+    def on_changes(name, rel_paths):
+        rel_path = rel_paths[-1]
+        meta = {
+            "root": root,
+            "path": os.path.join(root, name, rel_path),
+            "target": "/".join((target, name, rel_path)),
+        }
+        try:
+            refresh_last_update_metadata(logger, iRODSSession(irods_env_file=env_file), meta)
+        except Exception as e:
+            logger.error("could not refresh last update of %s: %s" % (name, e))
+
+    return on_changes
+
+
+def main(argv=None):  # pragma: no cover
+    """Entry point for ``rodeos-ingest-watch``."""
+    parser = argparse.ArgumentParser(description="Watch landing zone and keep change journals")
+    parser.add_argument("--handler", choices=("bcl", "fastq"), required=True)
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between batches")
+    parser.add_argument("--journal-dir", default=CHANGE_JOURNAL_DIR)
+    parser.add_argument("root", help="landing zone directory with run folders")
+    parser.add_argument("target", nargs="?", help="destination collection for AVU refresh")
+    args = parser.parse_args(argv)
+    if not args.journal_dir:
+        parser.error("set --journal-dir or RODEOS_CHANGE_JOURNAL_DIR")
+
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger("rodeos_ingest.watch")
+    if args.handler == "bcl":
+        from rodeos_ingest.genomics.illumina.bcl import is_runfolder_done as is_folder_done
+    else:
+        from rodeos_ingest.genomics.illumina.fastq import is_demuxfolder_done as is_folder_done
+    root = os.path.abspath(args.root)
+    watcher = Watcher(
+        logger,
+        root,
+        is_folder_done,
+        _make_refresher(logger, root, args.target) if args.target else None,
+        os.path.join(args.journal_dir, os.path.basename(root)),
+    )
+    watcher.run(args.interval)
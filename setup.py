@@ -35,6 +35,7 @@ with open("HISTORY.md") as history_file:
 
 test_requirements = parse_requirements("requirements/test.txt")
 install_requirements = parse_requirements("requirements/base.txt")
+extras_requirements = {"zstd": parse_requirements("requirements/zstd.txt")}
 
 setup(
     author="Manuel Holtgrewe",
@@ -50,9 +51,19 @@ setup(
         # "Programming Language :: Python :: 3.7",
         # "Programming Language :: Python :: 3.8",
     ],
-    entry_points={},
+    entry_points={
+        "console_scripts": [
+            "rodeos-ingest=rodeos_ingest.cli:main",
+            "rodeos-ingest-audit=rodeos_ingest.audit:main",
+            "rodeos-ingest-benchmark-xml=rodeos_ingest.genomics.illumina.benchmark:main",
+            "rodeos-ingest-orchestrate=rodeos_ingest.orchestrate:main",
+            "rodeos-ingest-replay=rodeos_ingest.trace:main",
+            "rodeos-ingest-watch=rodeos_ingest.watch:main",
+        ],
+    },
     description="Implementation of omics data ingest using iRODS capabilities",
     install_requires=install_requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + "\n\n" + history,
     long_description_content_type="text/markdown",
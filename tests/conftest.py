@@ -15,6 +15,8 @@ from redis import StrictRedis, ConnectionPool
 from irods_capability_automated_ingest.sync_job import sync_job
 import pytest
 
+from rodeos_ingest.settings import RODEOS_QUEUE_LARGE, RODEOS_QUEUE_METADATA
+
 
 @pytest.fixture(scope="session")
 def celery_config():
@@ -168,7 +170,11 @@ def start_celery_worker(n=4, args=None, write_logs=False):
             "-l",
             "INFO",
             "-Q",
-            "restart,path,file",
+            # Also consume the queues that files are routed to, if enabled.
+            ",".join(
+                ["restart", "path", "file"]
+                + [queue for queue in (RODEOS_QUEUE_METADATA, RODEOS_QUEUE_LARGE) if queue]
+            ),
         ]
         + log_args
         + (args or []),
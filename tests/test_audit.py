@@ -0,0 +1,75 @@
+"""Tests for the ``rodeos_ingest.audit`` module."""
+
+import datetime
+import logging
+import subprocess
+
+import pytest
+
+from rodeos_ingest import _check_path
+from rodeos_ingest.audit import Auditor, find_completed_collections, select_due
+from rodeos_ingest.progress import Progress
+
+
+@pytest.fixture(autouse=True)
+def mocked_tools(mocker):
+    # The external tools are mocked, so do not check for them.
+    mocker.patch.object(_check_path, "RODEOS_LOOK_FOR_EXECUTABLES", False)
+
+
+def test_find_completed_collections(mocker):
+    mock_run = mocker.patch("rodeos_ingest.audit.subprocess.run")
+    mock_run.return_value.stdout = "/z/t/2021/b\n/z/t/2020/a\n"
+    assert find_completed_collections("/z/t/") == ["/z/t/2020/a", "/z/t/2021/b"]
+    assert "COLL_NAME like '/z/t/%'" in mock_run.call_args[0][0][2]
+
+
+def test_select_due():
+    now = datetime.datetime(2021, 6, 1)
+    last_audit = {
+        "/c/old": datetime.datetime(2021, 1, 1),
+        "/c/recent": datetime.datetime(2021, 5, 30),
+    }
+    collections = ["/c/recent", "/c/old", "/c/never"]
+    assert select_due(collections, last_audit, datetime.timedelta(days=30), now) == [
+        "/c/never",
+        "/c/old",
+    ]
+
+
+def test_verify_objects(tmp_path, mocker):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("%%%% IRODS-MANIFEST-1.0\n1,abc,./a.txt\n2,def,./sub/b.txt\n3,fff,./c\n")
+    progress = Progress(tmp_path / "progress.txt")
+    progress.record("/z/c/c", "ok")
+
+    def run(args, **kwargs):
+        if args[-1] == "/z/c/sub/b.txt":
+            raise subprocess.CalledProcessError(1, args)
+
+    mock_run = mocker.patch("rodeos_ingest.audit.subprocess.run", side_effect=run)
+    auditor = Auditor(logging.getLogger(), None, jobs=2, bytes_per_second=0, progress=progress)
+    assert auditor.verify_objects("/z/c", str(manifest)) == ["/z/c/sub/b.txt"]
+    assert sorted(call[0][0][-1] for call in mock_run.call_args_list) == [
+        "/z/c/a.txt",
+        "/z/c/sub/b.txt",
+    ]
+    assert progress.succeeded() == {"/z/c/a.txt", "/z/c/c"}
+
+
+def test_verify_objects_bundle(tmp_path, mocker):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text(
+        "%%%% IRODS-MANIFEST-1.0\n"
+        "1,abc,./a.txt\n"
+        "9,def,./InterOp.rodeos-bundle.tar\n"
+        "2,fff,./InterOp/x.bin\n"
+        "3,fff,./InterOp/sub/y.bin\n"
+    )
+    mock_run = mocker.patch("rodeos_ingest.audit.subprocess.run")
+    auditor = Auditor(logging.getLogger(), None, bytes_per_second=0)
+    assert auditor.verify_objects("/z/c", str(manifest)) == []
+    assert sorted(call[0][0][-1] for call in mock_run.call_args_list) == [
+        "/z/c/InterOp.rodeos-bundle.tar",
+        "/z/c/a.txt",
+    ]
@@ -10,6 +10,7 @@ runs through celery and an "integration" test that runs the handler code manuall
 internal workings of ``irods_capability_automated_ingest`` changes then the integration test code
 has to be adjusted accordingly.
 """
+
 from contextlib import closing
 import datetime
 import os
@@ -22,7 +23,8 @@ from irods.models import Collection
 from irods_capability_automated_ingest.utils import Operation
 import pytest
 from rodeos_ingest.genomics.illumina import bcl
-from rodeos_ingest import common
+from rodeos_ingest import common, routing, upload
+from rodeos_ingest.upload import SmallFileBatches
 
 from .conftest import (
     clear_redis,
@@ -34,7 +36,7 @@ from .conftest import (
 
 
 def prepare_run_folder(run_folder, tmp_path):
-    """"Helper function to copy a folder on the file system."""
+    """ "Helper function to copy a folder on the file system."""
     instrument = run_folder.split("_")[1]
     work_path = tmp_path / "work"
     input_path = work_path / instrument
@@ -110,6 +112,8 @@ def check_bcl_result(dest_coll, irods, input_path, run_folder, expect_moved: boo
     with closing(irods.session.data_objects.open(mf_path, "r")) as inputf:
         manifest_irods = inputf.read().decode("utf-8")
     assert list(sorted(manifest_irods.splitlines())) == [
+        "%%%% IRODS-MANIFEST-1.0",
+        "%%%% size,sha256,filename",
         "10137,sha2:UEDeL3kiG4NYlxyN7SlO5uMUgR8SL5bsnxFg6rLJ0Uk=,./RunInfo.xml",
         "11317,sha2:3yL/yNigL8SDvriXhwoeWbfrdaaWerIbGAwG1Z1UsZU=,./RunParameters.xml",
         "35,sha2:qr8N53yv3KtHVhk0/S24my9QlicHMd81+qZIaCSZ8uU=,./RTARead3Complete.txt",
@@ -203,3 +207,39 @@ def test_module():
     assert bcl.event_handler.operation(hdlr_mod, logger) == Operation.PUT_SYNC
     assert bcl.event_handler.delay(hdlr_mod, logger, meta, 1) == 5
     assert bcl.event_handler.max_retries(hdlr_mod, logger, meta) == 10
+
+
+def test_operation_bundled(mocker):
+    mocker.patch.object(bcl, "BUNDLE_DIRS", ("InterOp",))
+    mocker.patch.object(routing, "QUEUE_METADATA", "")
+    meta = {"root": "/data/novaseq", "path": "/data/novaseq/210101_A00123_0001_AXXX/InterOp/x.bin"}
+    assert bcl.event_handler.operation(None, meta) == Operation.NO_OP
+    meta["path"] = "/data/novaseq/210101_A00123_0001_AXXX/InterOp.rodeos-bundle.tar"
+    assert bcl.event_handler.operation(None, meta) == Operation.NO_OP
+    meta["path"] = "/data/novaseq/210101_A00123_0001_AXXX/RunInfo.xml"
+    assert bcl.event_handler.operation(None, meta) == Operation.PUT_SYNC
+
+
+def test_post_data_obj_create_batched(mocker):
+    mocker.patch.object(bcl, "BATCH_SMALL_FILES", True)
+    mocker.patch.object(bcl, "_BATCHES", SmallFileBatches())
+    mocker.patch.object(upload, "UPLOAD_SMALL_THRESHOLD", 1024**2)
+    refresh = mocker.patch.object(bcl, "refresh_last_update_metadata")
+    run_ichksum = mocker.patch.object(bcl, "run_ichksum")
+    run_folder = "/data/novaseq/210101_A00123_0001_AXXX"
+    chunk = {"%s/Data/%d.bcl" % (run_folder, i): {} for i in range(3)}
+    logger, session = Mock(), Mock()
+
+    for path in chunk:
+        meta = {
+            "root": "/data/novaseq",
+            "path": path,
+            "target": path.replace("/data", "/zone"),
+            "chunk": chunk,
+            "size": 10,
+        }
+        bcl.event_handler.post_data_obj_create(None, logger, session, meta)
+
+    assert refresh.call_count == 1
+    assert refresh.call_args.kwargs == {"cleanup": False}
+    run_ichksum.assert_called_once_with([path.replace("/data", "/zone") for path in chunk])
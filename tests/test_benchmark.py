@@ -0,0 +1,81 @@
+"""Tests for the ``rodeos_ingest.genomics.illumina.benchmark`` module."""
+
+import pytest
+
+from rodeos_ingest.genomics.illumina.benchmark import (
+    CORPUS,
+    OPERATIONS,
+    PADDING,
+    append_history,
+    find_regressions,
+    format_results,
+    pad_xml,
+    prepare_corpus,
+    read_history,
+    run_benchmarks,
+)
+from rodeos_ingest.genomics.illumina.run_folder import (
+    RUN_PARAMETERS_AVU_KEY_PREFIX,
+    parse_runinfo_xml,
+    parse_runparameters_xml,
+)
+
+
+def test_pad_xml():
+    data = b'<?xml version="1.0"?>\n<RunInfo Version="5"><Run Id="x"/></RunInfo>'
+    padded = pad_xml(data, PADDING["RunInfo.xml"], 1000)
+    assert len(padded) >= 1000
+    assert padded.startswith(b'<?xml version="1.0"?>\n<RunInfo Version="5"><Tile>1_0000</Tile>')
+    assert padded.endswith(b'<Run Id="x"/></RunInfo>')
+    with pytest.raises(ValueError):
+        pad_xml(b"<Other/>", PADDING["RunInfo.xml"], 1000)
+
+
+def test_prepare_corpus(tmp_path):
+    folders = prepare_corpus("tests/data/run_folder", tmp_path, large_size=64 * 1024)
+    assert len(folders) == 2 * len(CORPUS)
+    for folder in folders:
+        assert OPERATIONS["is_runfolder_done"](folder.path)
+        # The padding does not change the parsed values.
+        original = tmp_path / ("%s-representative" % folder.instrument)
+        assert parse_runinfo_xml(str(folder.path / "RunInfo.xml")) == parse_runinfo_xml(
+            str(original / "RunInfo.xml")
+        )
+        values = parse_runparameters_xml(folder.path / "RunParameters.xml")
+        assert values == parse_runparameters_xml(original / "RunParameters.xml")
+        if folder.variant == "large":
+            assert (folder.path / "RunParameters.xml").stat().st_size >= 64 * 1024
+    novaseq = parse_runparameters_xml(tmp_path / "A01077-large" / "RunParameters.xml")
+    assert novaseq["%s::run_number" % RUN_PARAMETERS_AVU_KEY_PREFIX] == "48"
+
+
+def test_run_benchmarks(tmp_path):
+    folders = prepare_corpus("tests/data/run_folder", tmp_path, large_size=4096)[:2]
+    results = run_benchmarks(folders, repeat=1, number=1)
+    assert sorted(results) == sorted(
+        "A01077/%s/%s" % (variant, name)
+        for variant in ("representative", "large")
+        for name in OPERATIONS
+    )
+    assert all(seconds > 0 for seconds in results.values())
+
+
+def test_history(tmp_path):
+    path = tmp_path / "history.jsonl"
+    assert read_history(path) == []
+    append_history(path, {"a": 1.0}, "v1")
+    append_history(path, {"a": 2.0}, "v2")
+    history = read_history(path)
+    assert [entry["label"] for entry in history] == ["v1", "v2"]
+    assert history[-1]["results"] == {"a": 2.0}
+
+
+def test_find_regressions():
+    previous = {"a": 1.0, "b": 1.0, "c": 1.0}
+    current = {"a": 1.1, "b": 1.5, "d": 9.0}
+    assert find_regressions(previous, current, 0.2) == [("b", 1.0, 1.5)]
+
+
+def test_format_results():
+    lines = format_results({"a": 2e-6, "b": 1e-6}, {"a": 1e-6}).splitlines()
+    assert lines == ["case\tus_per_call\tchange", "a\t2.0\t+100.0%", "b\t1.0\t-"]
@@ -0,0 +1,157 @@
+"""Tests for the ``rodeos_ingest.bundle`` module."""
+
+import hashlib
+import io
+import logging
+import os
+import tarfile
+from unittest.mock import MagicMock
+
+import pytest
+
+from rodeos_ingest import common
+from rodeos_ingest.bundle import (
+    BUNDLE_SUFFIX,
+    create_bundle,
+    expand_manifest,
+    is_bundled,
+    read_index,
+    read_member,
+)
+from rodeos_ingest.common import _bundle_run_folder, _compare_manifests
+from rodeos_ingest.digest import format_irods_checksum, get_algorithm, get_algorithms
+from rodeos_ingest.manifest import write_manifest
+
+
+def _make_run_folder(tmp_path):
+    src = tmp_path / "run"
+    (src / "InterOp" / "C1.1").mkdir(parents=True)
+    (src / "InterOp" / "ErrorMetricsOut.bin").write_bytes(b"x" * 1000)
+    (src / "InterOp" / "C1.1" / "metrics.bin").write_bytes(b"")
+    (src / "InterOp" / "QMetricsOut.bin").write_bytes(b"q" * 512)
+    (src / "RunInfo.xml").write_bytes(b"<RunInfo/>")
+    return src
+
+
+def test_is_bundled():
+    dirs = ("InterOp", "Logs")
+    assert is_bundled("InterOp/ErrorMetricsOut.bin", dirs)
+    assert is_bundled("./Logs/x/y.log", dirs)
+    assert is_bundled("InterOp" + BUNDLE_SUFFIX, dirs)
+    assert is_bundled("InterOp%s.tmp" % BUNDLE_SUFFIX, dirs)
+    assert not is_bundled("InterOp", dirs)
+    assert not is_bundled("RunInfo.xml", dirs)
+    assert not is_bundled("Data/InterOp/x.bin", dirs)
+    assert not is_bundled("InterOp/x.bin", ())
+
+
+def test_create_bundle(tmp_path):
+    src = _make_run_folder(tmp_path)
+    before = sorted(p.relative_to(src) for p in src.rglob("*"))
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    bundle = create_bundle(str(src), "InterOp", get_algorithm("md5"), str(staging))
+
+    # The archive is built outside of the run folder.
+    assert os.path.dirname(bundle.path) == str(staging)
+    assert bundle.path.endswith(BUNDLE_SUFFIX)
+    assert sorted(p.relative_to(src) for p in src.rglob("*")) == before
+    with open(bundle.path, "rb") as inputf:
+        assert bundle.digest == hashlib.md5(inputf.read()).hexdigest()  # nosec
+    assert [m.path for m in bundle.members] == [
+        "./InterOp/ErrorMetricsOut.bin",
+        "./InterOp/QMetricsOut.bin",
+        "./InterOp/C1.1/metrics.bin",
+    ]
+    with tarfile.open(bundle.path) as tar:
+        assert tar.getnames()[:3] == [m.path[2:] for m in bundle.members]
+        assert tar.getmember("InterOp/QMetricsOut.bin").uid == 0
+    with open(bundle.path, "rb") as inputf:
+        assert read_index(inputf) == bundle.members
+        assert read_index(inputf, bundle.index_offset, bundle.index_size) == bundle.members
+        for member in bundle.members:
+            data = read_member(inputf, member)
+            assert data == (src / member.path).read_bytes()
+            assert member.digest == hashlib.md5(data).hexdigest()  # nosec
+
+
+def test_expand_manifest_matches_local(tmp_path):
+    src = _make_run_folder(tmp_path)
+    bundle = create_bundle(str(src), "InterOp", get_algorithm("sha256"), str(tmp_path))
+    local_path = str(src / "_MANIFEST_LOCAL.txt")
+    with open(local_path, "wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("sha256"), 2, ("_MANIFEST_LOCAL.txt",))
+    # The iRODS manifest lists the archive and the unbundled files only.
+    irods_path = str(tmp_path / "_MANIFEST_IRODS.txt")
+    with open(irods_path, "wt") as outf:
+        outf.write("%% IRODS-MANIFEST-1.0\n%%%% size,sha256,filename\n")
+        for name, path in (("InterOp" + BUNDLE_SUFFIX, bundle.path), ("RunInfo.xml", None)):
+            data = open(path or str(src / name), "rb").read()
+            chksum = format_irods_checksum("sha256", hashlib.sha256(data).hexdigest())
+            outf.write("%d,%s,./%s\n" % (len(data), chksum, name))
+
+    def _read_bundle_index(rel_path):
+        assert rel_path == "./InterOp" + BUNDLE_SUFFIX
+        with open(bundle.path, "rb") as inputf:
+            return read_index(inputf, bundle.index_offset, bundle.index_size)
+
+    assert expand_manifest(irods_path, _read_bundle_index, "sha256") == 3
+    # The archive is not in the run folder, its record is skipped.
+    _compare_manifests(local_path, irods_path, logging.getLogger())
+
+
+def test_expand_manifest_no_bundles(tmp_path):
+    path = tmp_path / "_MANIFEST_IRODS.txt"
+    path.write_text("%% IRODS-MANIFEST-1.0\n1,abc,./a.txt\n")
+    assert expand_manifest(str(path), lambda _: [], "md5") == 0
+    assert path.read_text() == "%% IRODS-MANIFEST-1.0\n1,abc,./a.txt\n"
+
+
+def _bundle_session(mocker, tmp_path, algorithm="sha256", corrupt=False):
+    mocker.patch.object(common, "BUNDLE_STAGING_DIR", str(tmp_path / "staging"))
+    (tmp_path / "staging").mkdir()
+    mocker.patch.object(common, "run_ichksum")
+    session = MagicMock()
+    obj = session.data_objects.get.return_value
+    uploaded = []
+
+    def put(path, dest_path, **kwargs):
+        with open(path, "rb") as inputf:
+            data = inputf.read()
+        uploaded.append(data)
+        if corrupt:
+            data += b"x"
+        # The zone uses checksums of ``algorithm``.
+        digest = hashlib.new(algorithm, data).hexdigest()
+        obj.checksum = format_irods_checksum(algorithm, digest)
+
+    session.data_objects.put.side_effect = put
+    return session, uploaded
+
+
+def test_bundle_run_folder_irods_algorithm(mocker, tmp_path):
+    src = _make_run_folder(tmp_path)
+    before = sorted(p.relative_to(src) for p in src.rglob("*"))
+    mocker.patch.object(common, "HASHDEEP_ALGO", "md5,sha256")
+    session, uploaded = _bundle_session(mocker, tmp_path)
+    dst_collection = MagicMock(path="/zone/run")
+    _bundle_run_folder(logging.getLogger(), session, str(src), dst_collection, ["InterOp"])
+
+    # Bundled with the first configured algorithm, again with the one matching iRODS.
+    assert session.data_objects.put.call_count == 2
+    for member in read_index(io.BytesIO(uploaded[-1])):
+        data = (src / member.path).read_bytes()
+        assert member.digest == hashlib.sha256(data).hexdigest()
+    # Neither the run folder nor the staging directory keep archives.
+    assert sorted(p.relative_to(src) for p in src.rglob("*")) == before
+    assert list((tmp_path / "staging").iterdir()) == []
+
+
+def test_bundle_run_folder_checksum_mismatch(mocker, tmp_path):
+    src = _make_run_folder(tmp_path)
+    mocker.patch.object(common, "HASHDEEP_ALGO", "sha256")
+    session, _ = _bundle_session(mocker, tmp_path, corrupt=True)
+    dst_collection = MagicMock(path="/zone/run")
+    with pytest.raises(RuntimeError, match="checksum mismatch"):
+        _bundle_run_folder(logging.getLogger(), session, str(src), dst_collection, ["InterOp"])
+    assert list((tmp_path / "staging").iterdir()) == []
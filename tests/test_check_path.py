@@ -0,0 +1,113 @@
+"""Tests for the ``rodeos_ingest._check_path`` module."""
+
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from rodeos_ingest import _check_path
+from rodeos_ingest._check_path import (
+    ToolStatus,
+    _executable_in_path,
+    check_tool,
+    format_report,
+    require_tools,
+    startup_check,
+)
+from rodeos_ingest.common import run_ichksum
+
+
+def _make_tool(directory, name, output="", sleep=0, status=0):
+    path = directory / name
+    path.write_text(
+        "#!/bin/sh\nPATH=/usr/bin:/bin sleep %s\necho '%s'\nexit %d\n" % (sleep, output, status)
+    )
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def tools_path(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    monkeypatch.setattr(_check_path, "_checked", {})
+    return tmp_path
+
+
+def test_executable_in_path(mocker, tools_path):
+    path = _make_tool(tools_path, "ichksum")
+    which = mocker.spy(_check_path.shutil, "which")
+    assert _executable_in_path("ichksum") == path
+    assert _executable_in_path("ichksum") == path
+    assert which.call_count == 1
+    assert _executable_in_path("iquest") is False
+    # Missing executables are looked up again, the cache is dropped when $PATH changes.
+    assert _executable_in_path("iquest") is False
+    assert which.call_count == 3
+    os.environ["PATH"] = "%s%s/nonexisting" % (tools_path, os.pathsep)
+    assert _executable_in_path("ichksum") == path
+    assert which.call_count == 4
+
+
+def test_check_tool(tools_path):
+    path = _make_tool(tools_path, "ichksum", "Usage: ichksum ...\\niRODS Version 4.2.8    ichksum")
+    assert check_tool("ichksum").version == "4.2.8"
+    assert check_tool("ichksum").path == path
+    assert check_tool("iquest").error == "not found in PATH"
+    _make_tool(tools_path, "find", sleep=1)
+    status = check_tool("find", timeout=0.1)
+    assert status.error and status.version is None
+    _make_tool(tools_path, "hashdeep", "hashdeep: unknown option", status=2)
+    assert check_tool("hashdeep").error == "exited with status 2"
+
+
+def test_format_report():
+    report = format_report(
+        [
+            ToolStatus("find", "/usr/bin/find", "4.8.0", 0.0021),
+            ToolStatus("iquest", None, None, 0.0001, "not found in PATH"),
+        ]
+    )
+    assert report.splitlines() == [
+        "find 4.8.0 (/usr/bin/find) in 2.1 ms",
+        "iquest unknown version (-) in 0.1 ms -- not found in PATH",
+    ]
+
+
+def test_startup_check(mocker, tools_path):
+    mocker.patch.object(_check_path, "MANIFEST_ENGINE", "python")
+    logger = MagicMock()
+    _make_tool(tools_path, "ichksum", "iRODS Version 4.2.8")
+    _make_tool(tools_path, "find", "find (GNU findutils) 4.8.0")
+    with pytest.raises(RuntimeError, match="iquest"):
+        startup_check(logger)
+    assert logger.error.called
+
+    _make_tool(tools_path, "iquest", "iRODS Version 4.2.8")
+    check_tools = mocker.spy(_check_path, "check_tools")
+    startup_check(logger)
+    startup_check(logger)
+    assert check_tools.call_count == 1
+    assert "iquest 4.2.8" in logger.info.call_args[0][0]
+
+
+def test_require_tools(mocker, tools_path):
+    _make_tool(tools_path, "ichksum", "iRODS Version 4.2.8")
+    check_tools = mocker.spy(_check_path, "check_tools")
+    require_tools(["ichksum"])
+    require_tools(["ichksum"])
+    assert check_tools.call_count == 1
+    with pytest.raises(RuntimeError, match="iquest unknown version"):
+        require_tools(["ichksum", "iquest"])
+    assert check_tools.call_args.args == (["iquest"],)
+    # Checked again in another process, e.g., a forked worker.
+    mocker.patch.object(_check_path.os, "getpid", return_value=-1)
+    require_tools(["ichksum"])
+    assert check_tools.call_count == 3
+
+
+def test_run_ichksum_checks_tool(mocker, tools_path):
+    _make_tool(tools_path, "ichksum", "iRODS Version 4.2.8", status=1)
+    run = mocker.spy(_check_path.subprocess, "run")
+    with pytest.raises(RuntimeError, match="ichksum"):
+        run_ichksum("/zone/file")
+    assert run.call_count == 1
@@ -0,0 +1,60 @@
+"""Tests for the ``rodeos_ingest.cli`` module."""
+
+import logging
+
+from rodeos_ingest.cli import main, run_folders
+from rodeos_ingest.progress import Progress
+
+
+def test_run_folders(tmp_path):
+    progress = Progress(tmp_path / "progress.txt")
+
+    def func(folder):
+        if folder == "/fail":
+            raise RuntimeError("boom")
+        return folder != "/skip"
+
+    result = run_folders(
+        logging.getLogger(), ["/ok", "/skip", "/fail"], func, jobs=2, progress=progress
+    )
+    assert result == {"/ok": "ok", "/skip": "skipped", "/fail": "failed"}
+    assert progress.succeeded() == {"/ok"}
+
+
+def test_run_folders_resume(tmp_path):
+    progress = Progress(tmp_path / "progress.txt")
+    progress.record("/a", "ok")
+    called = []
+    result = run_folders(
+        logging.getLogger(), ["/a", "/b"], called.append, progress=progress, resume=True
+    )
+    assert called == ["/b"]
+    assert result == {"/b": "ok"}
+
+
+def test_run_folders_dry_run():
+    called = []
+    assert run_folders(logging.getLogger(), ["/a"], called.append, dry_run=True) == {}
+    assert called == []
+
+
+def test_main_manifest_local(tmp_path, mocker):
+    mock_compute = mocker.patch(
+        "rodeos_ingest.cli.compute_local_manifest", return_value="_MANIFEST_LOCAL.txt"
+    )
+    progress = tmp_path / "progress.txt"
+    folder = tmp_path / "run"
+    folder.mkdir()
+    args = ["--jobs", "2", "--progress", str(progress), "manifest-local", str(folder)]
+    assert main(args) == 0
+    mock_compute.assert_called_once_with(mocker.ANY, str(folder), 0)
+    assert progress.read_text() == "ok\t%s\n" % folder
+    assert main(["--resume"] + args) == 0
+    assert mock_compute.call_count == 1
+
+
+def test_main_verify_failed(tmp_path, mocker):
+    mocker.patch("rodeos_ingest.cli._compare_manifests", side_effect=RuntimeError("mismatch"))
+    progress = tmp_path / "progress.txt"
+    assert main(["--progress", str(progress), "verify", str(tmp_path)]) == 1
+    assert progress.read_text() == "failed\t%s\n" % tmp_path
@@ -1,11 +1,19 @@
 """Tests for code in ``rodeos_ingest.common`` that does not need irods."""
 
+import os
 import pathlib
 from unittest.mock import MagicMock
 
 import pytest
 
-from rodeos_ingest.common import cleanuping, to_ingested_path, _compare_manifests
+from rodeos_ingest.common import (
+    cleanuping,
+    manifest_names,
+    to_ingested_path,
+    _compare_manifests,
+)
+from rodeos_ingest import memory
+from rodeos_ingest.manifest import compress_manifest
 
 
 def test_cleanuping():
@@ -24,6 +32,13 @@ def test_to_ingested_path_pathlib():
     assert to_ingested_path(pathlib.Path("foo/bar")) == pathlib.Path("foo-INGESTED/bar")
 
 
+@pytest.fixture(params=[0, 1], ids=["memory", "disk"])
+def budget(mocker, request):
+    """Compare manifests in memory and, with a budget of one byte, on disk."""
+    mocker.patch.object(memory, "FINALIZE_MEMORY_BUDGET", request.param)
+    return request.param
+
+
 def _test_compare_manifests(tmp_path, lines_local, lines_irods):
     logger = MagicMock()
     p_local = tmp_path / "local.txt"
@@ -35,7 +50,28 @@ def _test_compare_manifests(tmp_path, lines_local, lines_irods):
     return _compare_manifests(str(p_local), str(p_irods), logger) is None
 
 
-def test_compare_manifests_equal(tmp_path):
+def test_compare_manifests_on_disk_outside_run_folder(mocker, tmp_path):
+    run_folder, spill_dir = tmp_path / "run", tmp_path / "spill"
+    run_folder.mkdir()
+    spill_dir.mkdir()
+    mocker.patch.object(memory, "FINALIZE_MEMORY_BUDGET", 1)
+    mocker.patch.object(memory, "FINALIZE_SPILL_DIR", str(spill_dir))
+    listings = []
+    common_records = memory.DiskRecordStore.common
+
+    def _common(self):
+        listings.append((sorted(os.listdir(run_folder)), len(os.listdir(spill_dir))))
+        return common_records(self)
+
+    mocker.patch.object(memory.DiskRecordStore, "common", _common)
+    lines = ["10,xyz,./name.txt", "20,abc,./name2.txt"]
+    assert _test_compare_manifests(run_folder, lines, lines) is True
+    # The database is in the spill directory while comparing, the run folder is unchanged.
+    assert listings == [(["irods.txt", "local.txt"], 1)]
+    assert os.listdir(spill_dir) == []
+
+
+def test_compare_manifests_equal(tmp_path, budget):
     assert (
         _test_compare_manifests(
             tmp_path,
@@ -46,7 +82,7 @@ def test_compare_manifests_equal(tmp_path):
     )
 
 
-def test_compare_manifests_diff_sizes(tmp_path):
+def test_compare_manifests_diff_sizes(tmp_path, budget):
     with pytest.raises(RuntimeError):
         _test_compare_manifests(
             tmp_path,
@@ -55,7 +91,7 @@ def test_compare_manifests_diff_sizes(tmp_path):
         )
 
 
-def test_compare_manifests_diff_checksum(tmp_path):
+def test_compare_manifests_diff_checksum(tmp_path, budget):
     with pytest.raises(RuntimeError):
         _test_compare_manifests(
             tmp_path,
@@ -64,15 +100,107 @@ def test_compare_manifests_diff_checksum(tmp_path):
         )
 
 
-def test_compare_manifests_diff_more_local(tmp_path):
+def test_compare_manifests_diff_more_local(tmp_path, budget):
     with pytest.raises(RuntimeError):
         _test_compare_manifests(
             tmp_path, ["#", "%", "10,xyz,./name.txt", "20,abc,./name2.txt"], ["20,abc,./name2.txt"],
         )
 
 
-def test_compare_manifests_diff_more_irods(tmp_path):
+def test_compare_manifests_diff_more_irods(tmp_path, budget):
     with pytest.raises(RuntimeError):
         _test_compare_manifests(
             tmp_path, ["#", "%", "10,xyz,./name.txt"], ["20,abc,./name2.txt", "10,xyz,./name.txt"],
         )
+
+
+def test_compare_manifests_sha2(tmp_path, budget):
+    assert (
+        _test_compare_manifests(
+            tmp_path,
+            [
+                "%%%% size,sha256,filename",
+                "0,e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855,./name.txt",
+            ],
+            ["0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./name.txt"],
+        )
+        is True
+    )
+
+
+def test_compare_manifests_algorithm_mismatch(tmp_path, budget):
+    with pytest.raises(RuntimeError, match="algorithm mismatch"):
+        _test_compare_manifests(
+            tmp_path,
+            ["%%%% size,md5,filename", "0,d41d8cd98f00b204e9800998ecf8427e,./name.txt"],
+            ["0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./name.txt"],
+        )
+
+
+def test_compare_manifests_multiple_digests(tmp_path, budget):
+    assert (
+        _test_compare_manifests(
+            tmp_path,
+            [
+                "%%%% size,md5,sha256,filename",
+                "0,d41d8cd98f00b204e9800998ecf8427e,"
+                "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855,./name.txt",
+            ],
+            ["0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./name.txt"],
+        )
+        is True
+    )
+
+
+def test_compare_manifests_tree_digest(tmp_path, budget):
+    (tmp_path / "name.txt").write_bytes(b"")
+    assert (
+        _test_compare_manifests(
+            tmp_path,
+            ["%%%% size,sha256,filename", "0,tree:0123,./name.txt"],
+            ["0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./name.txt"],
+        )
+        is True
+    )
+
+
+def test_compare_manifests_tree_digest_not_in_irods(mocker, tmp_path, budget):
+    # Files without a matching iRODS record are not hashed again, the comparison fails anyway.
+    hash_file = mocker.patch("rodeos_ingest.common.hash_file")
+    with pytest.raises(RuntimeError, match="extra file in local"):
+        _test_compare_manifests(
+            tmp_path,
+            ["%%%% size,sha256,filename", "0,tree:0123,./name.txt", "5,tree:4567,./other.txt"],
+            ["1,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./other.txt"],
+        )
+    assert not hash_file.called
+
+
+def test_compare_manifests_skip_tree_digests(tmp_path, budget):
+    p_local = tmp_path / "local.txt"
+    p_local.write_text("%%%% size,sha256,filename\n0,tree:0123,./missing.txt\n")
+    p_irods = tmp_path / "irods.txt"
+    p_irods.write_text("0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./missing.txt\n")
+    logger = MagicMock()
+    assert _compare_manifests(str(p_local), str(p_irods), logger, skip_tree_digests=True) is None
+
+
+def test_compare_manifests_compressed(tmp_path, budget):
+    p_plain = tmp_path / "plain.txt"
+    p_plain.write_text("%%%% size,md5,filename\n0,d41d8cd98f00b204e9800998ecf8427e,./name.txt\n")
+    p_local = tmp_path / "local.txt.gz"
+    compress_manifest(p_plain, p_local, "gzip")
+    p_irods = tmp_path / "irods.txt"
+    p_irods.write_text("0,d41d8cd98f00b204e9800998ecf8427e,./name.txt\n")
+    assert _compare_manifests(str(p_local), str(p_irods), MagicMock()) is None
+
+
+def test_manifest_names():
+    assert manifest_names() == (
+        "_MANIFEST_LOCAL.txt",
+        "_MANIFEST_LOCAL.txt.gz",
+        "_MANIFEST_LOCAL.txt.zst",
+        "_MANIFEST_IRODS.txt",
+        "_MANIFEST_IRODS.txt.gz",
+        "_MANIFEST_IRODS.txt.zst",
+    )
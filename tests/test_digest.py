@@ -0,0 +1,105 @@
+"""Tests for the ``rodeos_ingest.digest`` module."""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import time
+
+import pytest
+
+from rodeos_ingest.digest import (
+    format_irods_checksum,
+    get_algorithm,
+    get_algorithms,
+    hash_file,
+    hash_file_chunked,
+    parse_irods_checksum,
+    UnknownDigestAlgorithm,
+    xxhash,
+)
+
+
+def test_get_algorithm():
+    assert get_algorithm("SHA256").name == "sha256"
+    assert get_algorithm("sha256").hashdeep
+    assert not get_algorithm("blake2b").hashdeep
+    with pytest.raises(UnknownDigestAlgorithm):
+        get_algorithm("crc32")
+
+
+@pytest.mark.skipif(xxhash is None, reason="xxhash not installed")
+def test_get_algorithm_xxh64():
+    assert not get_algorithm("xxh64").cryptographic
+
+
+def test_parse_irods_checksum_md5():
+    assert parse_irods_checksum(b"D41D8CD98F00B204E9800998ECF8427E") == (
+        "md5",
+        b"d41d8cd98f00b204e9800998ecf8427e",
+    )
+
+
+def test_parse_irods_checksum_sha256():
+    assert parse_irods_checksum(b"sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=") == (
+        "sha256",
+        b"e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+    )
+
+
+def test_parse_irods_checksum_unknown():
+    with pytest.raises(UnknownDigestAlgorithm):
+        parse_irods_checksum(b"crc32:AAAA")
+
+
+def test_format_irods_checksum():
+    sha256 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    assert (
+        format_irods_checksum("sha256", sha256)
+        == "sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU="
+    )
+    assert format_irods_checksum("md5", "d41d8cd98f00b204e9800998ecf8427e") == (
+        "d41d8cd98f00b204e9800998ecf8427e"
+    )
+    with pytest.raises(UnknownDigestAlgorithm):
+        format_irods_checksum("blake2b", "00")
+
+
+def test_hash_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert hash_file(path, get_algorithms("md5,sha256")) == [
+        "d41d8cd98f00b204e9800998ecf8427e",
+        "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+    ]
+
+
+def test_hash_file_chunked(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abcdefghij")
+    algorithm = get_algorithm("sha256")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ((tree, chunks),) = hash_file_chunked(path, [algorithm], 4, executor)
+    expected_chunks = [hashlib.sha256(x).hexdigest() for x in (b"abcd", b"efgh", b"ij")]
+    assert chunks == expected_chunks
+    assert tree == hashlib.sha256(b"".join(map(bytes.fromhex, expected_chunks))).hexdigest()
+
+
+@pytest.mark.skipif(len(os.sched_getaffinity(0)) < 2, reason="needs more than one CPU")
+def test_hash_file_chunked_parallel(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(os.urandom(64 * 1024**2))
+    algorithms = [get_algorithm("sha256")]
+    workers = min(4, len(os.sched_getaffinity(0)))
+
+    def best(func):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    sequential = best(lambda: hash_file(path, algorithms))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        chunked = best(lambda: hash_file_chunked(path, algorithms, 8 * 1024**2, executor))
+    assert chunked < sequential
@@ -101,6 +101,8 @@ def check_fastq_result(dest_coll, irods, input_path, folder_name, configure_move
     with closing(irods.session.data_objects.open(mf_path, "r")) as inputf:
         manifest_irods = inputf.read().decode("utf-8")
     assert list(sorted(manifest_irods.splitlines())) == [
+        "%%%% IRODS-MANIFEST-1.0",
+        "%%%% size,sha256,filename",
         "0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./DIGESTIFLOW_DEMUX_DONE.txt",
         "0,sha2:47DEQpj8HBSa+/TImW+5JCeuQeRkm5NMpJWZG3hSuFU=,./example2.txt",
     ]
@@ -0,0 +1,38 @@
+"""Tests for the ``rodeos_ingest.hashcache`` module."""
+
+import hashlib
+import os
+
+from rodeos_ingest import hashcache
+from rodeos_ingest.digest import get_algorithms
+from rodeos_ingest.hashcache import HashCache
+
+
+def test_get_put(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"abc")
+    cache = HashCache(tmp_path / "cache.sqlite")
+    assert cache.get(path, "md5") is None
+    cache.put(path, "md5", "0123")
+    assert cache.get(path, "md5") == "0123"
+    assert cache.get(path, "sha256") is None
+    # Entries are keyed by the real path.
+    os.symlink("a.txt", str(tmp_path / "link"))
+    assert cache.get(tmp_path / "link", "md5") == "0123"
+    # Entries become invalid when the file changes.
+    path.write_bytes(b"abcd")
+    assert cache.get(path, "md5") is None
+
+
+def test_hash_file(tmp_path, mocker):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"abc")
+    cache = HashCache(tmp_path / "cache.sqlite")
+    spy = mocker.spy(hashcache, "hash_file")
+    algorithms = get_algorithms("md5,sha256")
+    expected = [hashlib.md5(b"abc").hexdigest(), hashlib.sha256(b"abc").hexdigest()]  # nosec
+    assert cache.hash_file(path, algorithms) == expected
+    assert spy.call_count == 1
+    # Second call and other instance on same database are served from the cache.
+    assert HashCache(tmp_path / "cache.sqlite").hash_file(path, algorithms) == expected
+    assert spy.call_count == 1
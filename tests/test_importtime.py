@@ -0,0 +1,76 @@
+"""Import-time budget of the handler modules, measured with ``python -X importtime``.
+
+Celery workers and the command line tools import the handler modules on start, so the
+dependencies that are only needed in some code paths must be imported on first use.
+"""
+
+import os
+import subprocess
+import sys
+import typing
+
+import pytest
+
+#: Modules that the automated ingest imports as event handlers.
+HANDLER_MODULES = ("rodeos_ingest.genomics.illumina.bcl", "rodeos_ingest.genomics.illumina.fastq")
+
+#: Modules (and their submodules) that importing a handler module must not import.
+LAZY_MODULES = (
+    "asyncio",
+    "celery",
+    "dateutil",
+    "defusedxml",
+    "irods",
+    "irods_capability_automated_ingest.sync_irods",
+    "irods_capability_automated_ingest.utils",
+    "redis",
+    "redis_lock",
+)
+
+#: Budget in milliseconds for executing the ``rodeos_ingest`` modules when importing a handler
+#: module, generous to avoid flakiness on loaded machines.
+BUDGET_MS = 150
+
+
+def importtime(module: str) -> typing.Dict[str, typing.Tuple[int, int]]:
+    """Return self and cumulative microseconds by imported module for importing ``module``."""
+    # Do not measure coverage in the child process.
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("COV_CORE_", "COVERAGE_"))}
+    res = subprocess.run(  # nosec
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        stderr=subprocess.PIPE,
+        env=env,
+        encoding="utf-8",
+        check=True,
+    )
+    result = {}
+    for line in res.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("| imported package"):
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            if self_us.strip().isdigit():
+                result[name.strip()] = (int(self_us), int(cumulative_us))
+    return result
+
+
+@pytest.mark.parametrize("module", HANDLER_MODULES)
+def test_handler_lazy_imports(module):
+    times = importtime(module)
+    assert module in times
+    eager = sorted(
+        name
+        for name in times
+        if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+    )
+    assert eager == []
+
+
+@pytest.mark.parametrize("module", HANDLER_MODULES)
+def test_handler_import_budget(module):
+    times = importtime(module)
+    own_us = sum(
+        self_us for name, (self_us, _) in times.items() if name.startswith("rodeos_ingest")
+    )
+    assert own_us < BUDGET_MS * 1000, "importing %s took %.1f ms in rodeos_ingest" % (
+        module,
+        own_us / 1000,
+    )
@@ -0,0 +1,168 @@
+"""Tests for the ``rodeos_ingest.lease`` module."""
+
+import datetime
+import time
+from unittest.mock import MagicMock, Mock
+
+import pytest
+import redis_lock
+
+from rodeos_ingest import common, lease
+from rodeos_ingest.lease import FileLease, LeaseLost, RedisLease, open_lease
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_file_lease(tmp_path):
+    clock = _Clock()
+    first = FileLease(tmp_path, "finalize:/zone/run", ttl=60, clock=clock)
+    second = FileLease(tmp_path, "finalize:/zone/run", ttl=60, clock=clock)
+    other = FileLease(tmp_path, "finalize:/zone/other", ttl=60, clock=clock)
+
+    assert first.acquire()
+    assert not second.acquire()
+    assert other.acquire()
+    clock.now += 59
+    assert first.renew()
+    clock.now += 59
+    assert not second.acquire()
+    assert not second.renew()
+
+    first.release()
+    assert second.acquire()
+    first.release()
+    assert not first.renew()
+    assert not first.acquire()
+
+
+def test_file_lease_stale_takeover(tmp_path):
+    clock = _Clock()
+    crashed = FileLease(tmp_path, "run", ttl=60, clock=clock)
+    assert crashed.acquire()
+    clock.now += 61
+    successor = FileLease(tmp_path, "run", ttl=60, clock=clock)
+    assert successor.acquire()
+    assert not crashed.renew()
+
+
+def test_held_heartbeat(tmp_path):
+    holder = FileLease(tmp_path, "run", ttl=0.15)
+    contender = FileLease(tmp_path, "run", ttl=0.15)
+    logger = Mock()
+    with holder.held(logger) as acquired:
+        assert acquired
+        time.sleep(0.4)
+        # The heartbeat kept the lease alive longer than its time to live.
+        with contender.held(logger) as contender_acquired:
+            assert not contender_acquired
+    assert not holder.lost
+    assert contender.acquire()
+
+
+def test_lease_check(tmp_path):
+    clock = _Clock()
+    holder = FileLease(tmp_path, "run", ttl=60, clock=clock)
+    assert holder.acquire()
+    holder.check()
+    clock.now += 61
+    assert FileLease(tmp_path, "run", ttl=60, clock=clock).acquire()
+    with pytest.raises(LeaseLost):
+        holder.check()
+    assert holder.lost
+
+
+def test_redis_lease(mocker):
+    lock = mocker.patch.object(redis_lock, "Lock").return_value
+    lock.acquire.return_value = True
+    client = Mock()
+    redis_lease = RedisLease(client, "run", ttl=30)
+
+    assert redis_lock.Lock.call_args.args == (client, "rodeos::lease::run")
+    assert redis_lock.Lock.call_args.kwargs == {"expire": 30, "id": redis_lease.owner}
+    assert redis_lease.acquire()
+    lock.acquire.assert_called_once_with(blocking=False)
+    assert redis_lease.renew()
+    lock.extend.side_effect = redis_lock.NotAcquired
+    assert not redis_lease.renew()
+    lock.release.side_effect = redis_lock.NotAcquired
+    redis_lease.release()
+
+
+def test_open_lease(mocker, tmp_path):
+    mocker.patch.object(lease, "LEASE_BACKEND", "file")
+    mocker.patch.object(lease, "LEASE_DIR", str(tmp_path))
+    assert isinstance(open_lease({}, "run"), FileLease)
+    mocker.patch.object(lease, "LEASE_BACKEND", "")
+    assert open_lease({}, "run") is None
+    mocker.patch.object(lease, "LEASE_BACKEND", "redis")
+    mocker.patch.object(redis_lock, "Lock")
+    get_redis = mocker.patch.object(lease, "get_redis")
+    assert isinstance(open_lease({"config": {"redis": {}}}, "run"), RedisLease)
+    get_redis.assert_called_once_with({"redis": {}})
+
+
+def test_post_job_run_folder_done_leased(tmp_path):
+    src_folder = tmp_path / "run"
+    src_folder.mkdir()
+    dst_collection = MagicMock()
+    dst_collection.path = "/zone/run"
+    dst_collection.metadata.get_all.return_value = []
+    other = FileLease(tmp_path / "leases", "finalize:/zone/run")
+    assert other.acquire()
+
+    assert not common._post_job_run_folder_done(
+        Mock(),
+        Mock(),
+        src_folder,
+        dst_collection,
+        lambda _: True,
+        datetime.timedelta(seconds=0),
+        lease=FileLease(tmp_path / "leases", "finalize:/zone/run"),
+    )
+    assert not dst_collection.metadata.__setitem__.called
+
+
+def test_post_job_run_folder_done_lease_lost(mocker, tmp_path):
+    src_folder = tmp_path / "run"
+    src_folder.mkdir()
+    dst_collection = MagicMock()
+    dst_collection.path = "/zone/run"
+    dst_collection.metadata.get_all.return_value = []
+    clock = _Clock()
+    holder = FileLease(tmp_path / "leases", "finalize:/zone/run", ttl=60, clock=clock)
+
+    def compute_local_manifest(*args, **kwargs):
+        # The heartbeat stalled and another worker took over the stale lease while hashing.
+        clock.now += 61
+        assert FileLease(tmp_path / "leases", "finalize:/zone/run", clock=clock).acquire()
+        return tmp_path / "local.txt"
+
+    mocker.patch.object(common, "compute_local_manifest", side_effect=compute_local_manifest)
+    mocker.patch.object(common, "run_ichksum")
+    mocker.patch.object(common, "compute_irods_manifest", return_value=tmp_path / "irods.txt")
+    mocker.patch.object(common, "_compare_manifests")
+    put_manifest = mocker.patch.object(common, "_put_manifest")
+    move_to_ingested = mocker.patch.object(common, "_move_to_ingested")
+    logger = Mock()
+
+    assert not common._post_job_run_folder_done(
+        logger,
+        Mock(),
+        src_folder,
+        dst_collection,
+        lambda _: True,
+        datetime.timedelta(seconds=0),
+        lease=holder,
+    )
+    assert holder.lost
+    # Neither manifest status, uploads, move, status, nor metrics.
+    assert not dst_collection.metadata.__setitem__.called
+    assert not put_manifest.called
+    assert not move_to_ingested.called
+    assert "lost lease" in logger.warning.call_args.args[0]
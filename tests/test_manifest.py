@@ -0,0 +1,309 @@
+"""Tests for the ``rodeos_ingest.manifest`` module."""
+
+import os
+
+import pytest
+
+from rodeos_ingest.digest import get_algorithms
+from rodeos_ingest.hashcache import HashCache
+from rodeos_ingest import manifest
+from rodeos_ingest.manifest import (
+    COMPRESSION_SUFFIXES,
+    PENDING_PER_WORKER,
+    ManifestRecord,
+    compress_manifest,
+    iter_chunks,
+    iter_manifest,
+    load_manifest,
+    write_manifest,
+)
+from rodeos_ingest.throttle import IOGovernor
+from rodeos_ingest.tuning import ConcurrencyController
+
+#: Manifest as written by ``hashdeep``.
+HASHDEEP_MANIFEST = "\n".join(
+    [
+        "%%%% HASHDEEP-1.0",
+        "%%%% size,md5,filename",
+        "## Invoked from: /tmp",
+        "## $ hashdeep -c md5 -f /dev/stdin -j 8",
+        "## ",
+        "10,d41d8cd98f00b204e9800998ecf8427e,./name.txt",
+        "20,0cc175b9c0f1b6a831c399e269772661,./with,comma.txt",
+        "",
+    ]
+)
+
+
+def test_iter_manifest(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text(HASHDEEP_MANIFEST)
+    assert list(iter_manifest(path)) == [
+        ManifestRecord(b"10", (b"d41d8cd98f00b204e9800998ecf8427e",), b"./name.txt"),
+        ManifestRecord(b"20", (b"0cc175b9c0f1b6a831c399e269772661",), b"./with,comma.txt"),
+    ]
+
+
+def test_iter_manifest_empty(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text("")
+    assert list(iter_manifest(path)) == []
+
+
+def test_load_manifest(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text(HASHDEEP_MANIFEST)
+    table = load_manifest(path)
+    assert len(table) == 2
+    assert list(table.sizes) == [10, 20]
+    assert table.checksums == {
+        "md5": [b"d41d8cd98f00b204e9800998ecf8427e", b"0cc175b9c0f1b6a831c399e269772661"]
+    }
+    assert table.index() == {b"./name.txt": 0, b"./with,comma.txt": 1}
+
+
+def test_load_manifest_irods(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text(
+        "CAT_NO_ROWS_FOUND: Nothing was found matching your query\r\n0,sha2:47DE,./x\r\n"
+    )
+    table = load_manifest(path)
+    assert list(table.sizes) == [0]
+    assert table.checksums == {"md5": [b"sha2:47DE"]}
+    assert table.paths == [b"./x"]
+
+
+@pytest.mark.parametrize(
+    "header,line",
+    [
+        ("", "10,d41d8cd98f00b204e9800998ecf8427e"),
+        ("", "garbage"),
+        ("", "x,abc,./y"),
+        ("%%%% size,md5,sha1,filename", "12,abc,./a"),
+    ],
+)
+def test_load_manifest_malformed(tmp_path, header, line):
+    path = tmp_path / "manifest.txt"
+    path.write_text("%s\n10,abc,./x\n%s\n" % (header, line))
+    with pytest.raises(ValueError, match="Malformed manifest line"):
+        load_manifest(path)
+    with pytest.raises(ValueError, match="Malformed manifest line"):
+        list(iter_manifest(path))
+    with pytest.raises(ValueError, match="Malformed manifest line"):
+        compress_manifest(path, tmp_path / "manifest.txt.gz", "gzip")
+
+
+def test_load_manifest_skipped_lines(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_bytes(b"\n\r\n%%%% size,md5,filename\r\n10,abc,./x\n\n## chunks\n\n20,def,./y")
+    assert load_manifest(path).paths == [b"./x", b"./y"]
+    assert len(list(iter_manifest(path))) == 2
+
+
+def test_load_manifest_empty(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text("")
+    assert len(load_manifest(path)) == 0
+
+
+def test_load_manifest_algorithm(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text(HASHDEEP_MANIFEST)
+    assert load_manifest(path).algorithms == ["md5"]
+
+
+def test_write_manifest(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.txt").write_bytes(b"a")
+    (src / "sub" / "b.txt").write_bytes(b"")
+    (src / "_MANIFEST_LOCAL.txt").write_bytes(b"")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 2, ("_MANIFEST_LOCAL.txt",))
+    table = load_manifest(path)
+    assert table.algorithms == ["md5"]
+    assert table.paths == [b"./a.txt", b"./sub/b.txt"]
+    assert list(table.sizes) == [1, 0]
+    assert table.checksums == {
+        "md5": [b"0cc175b9c0f1b6a831c399e269772661", b"d41d8cd98f00b204e9800998ecf8427e"]
+    }
+
+
+def test_write_manifest_regular_files_only(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.txt").write_bytes(b"a")
+    (src / "link.txt").symlink_to(src / "a.txt")
+    (src / "linked").symlink_to(src / "sub")
+    (src / "sub" / "b.txt").write_bytes(b"")
+    os.mkfifo(src / "sub" / "fifo")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 2)
+    # The same files as ``find -type f``, the FIFO is not opened.
+    assert load_manifest(path).paths == [b"./a.txt", b"./sub/b.txt"]
+
+
+def test_write_manifest_bounded(mocker, tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    for i in range(50):
+        (src / ("%02d.txt" % i)).write_bytes(b"a")
+    listed = []
+    list_files = manifest._list_files
+
+    def _list_files(*args):
+        for rel_path in list_files(*args):
+            listed.append(rel_path)
+            yield rel_path
+
+    mocker.patch.object(manifest, "_list_files", _list_files)
+    path = tmp_path / "manifest.txt"
+    pending = []
+    with path.open("wb") as outf:
+        write = outf.write
+
+        def _write(data):
+            if data[:1].isdigit():
+                pending.append(len(listed) - len(pending))
+            return write(data)
+
+        mocker.patch.object(outf, "write", _write)
+        write_manifest(str(src), outf, get_algorithms("md5"), 2)
+    # The records are written while the files are listed, not only after listing all of them.
+    assert max(pending) <= 2 * PENDING_PER_WORKER
+    assert load_manifest(path).paths == [b"./%02d.txt" % i for i in range(50)]
+
+
+def test_write_manifest_multiple_digests(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5,sha256"), 1)
+    table = load_manifest(path)
+    assert table.algorithms == ["md5", "sha256"]
+    assert table.checksums == {
+        "md5": [b"d41d8cd98f00b204e9800998ecf8427e"],
+        "sha256": [b"e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"],
+    }
+    assert list(iter_manifest(path)) == [
+        ManifestRecord(
+            b"0",
+            (
+                b"d41d8cd98f00b204e9800998ecf8427e",
+                b"e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855",
+            ),
+            b"./a.txt",
+        )
+    ]
+
+
+def test_write_manifest_chunked(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "big.bin").write_bytes(b"abcdefghij")
+    (src / "small.bin").write_bytes(b"a")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 2, chunk_threshold=5, chunk_size=4)
+    table = load_manifest(path)
+    assert table.paths == [b"./big.bin", b"./small.bin"]
+    assert table.checksums["md5"][0].startswith(b"tree:")
+    assert table.checksums["md5"][1] == b"0cc175b9c0f1b6a831c399e269772661"
+    (chunks,) = list(iter_chunks(path))
+    assert chunks.algorithm == "md5"
+    assert chunks.chunk_size == 4
+    assert chunks.path == b"./big.bin"
+    assert len(chunks.digests) == 3
+
+
+def test_write_manifest_governor(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a")
+    governor = IOGovernor(iops=1000)
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 1, governor=governor)
+    assert load_manifest(path).checksums == {"md5": [b"0cc175b9c0f1b6a831c399e269772661"]}
+    assert governor.ops.tokens < 1000
+
+
+def test_write_manifest_controller(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a")
+    (src / "b.txt").write_bytes(b"")
+    path = tmp_path / "manifest.txt"
+    controller = ConcurrencyController(1, maximum=4)
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 1, controller=controller)
+    assert load_manifest(path).paths == [b"./a.txt", b"./b.txt"]
+    assert controller.active == 0
+
+
+def test_write_manifest_cache(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a.txt").write_bytes(b"a")
+    cache = HashCache(tmp_path / "cache.sqlite")
+    cache.put(src / "a.txt", "md5", "00112233445566778899aabbccddeeff")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5,sha1"), 1, cache=cache)
+    # The cached digest is only used when all digests are cached.
+    assert load_manifest(path).checksums["md5"] == [b"0cc175b9c0f1b6a831c399e269772661"]
+    assert cache.get(src / "a.txt", "sha1") == "86f7e437faa5a7fce15d1ddcb9eaeaea377667b8"
+    cache.put(src / "a.txt", "md5", "00112233445566778899aabbccddeeff")
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5"), 1, cache=cache)
+    assert load_manifest(path).checksums["md5"] == [b"00112233445566778899aabbccddeeff"]
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compress_manifest(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    path = tmp_path / "manifest.txt"
+    path.write_text(
+        HASHDEEP_MANIFEST
+        + "## chunks,md5,4,00;11,./sub/name.txt\n"
+        + "30,tree:d41d8cd98f00b204e9800998ecf8427e,./sub/name.txt\n"
+    )
+    compressed = tmp_path / ("manifest.txt" + COMPRESSION_SUFFIXES[codec])
+    compress_manifest(path, compressed, codec)
+    with compressed.open("rb") as inputf:
+        assert b"./with,comma.txt" not in inputf.read()
+    table = load_manifest(compressed)
+    assert table.paths == [b"./name.txt", b"./sub/name.txt", b"./with,comma.txt"]
+    assert list(table.sizes) == [10, 30, 20]
+    assert table.algorithms == ["md5"]
+    assert list(iter_manifest(compressed))[2] == ManifestRecord(
+        b"20", (b"0cc175b9c0f1b6a831c399e269772661",), b"./with,comma.txt"
+    )
+    (chunks,) = list(iter_chunks(compressed))
+    assert chunks.path == b"./sub/name.txt"
+
+
+def test_compress_manifest_multiple_digests(tmp_path):
+    src = tmp_path / "src"
+    (src / "dir").mkdir(parents=True)
+    (src / "dir" / "a.txt").write_bytes(b"a")
+    (src / "dir" / "b.txt").write_bytes(b"")
+    path = tmp_path / "manifest.txt"
+    with path.open("wb") as outf:
+        write_manifest(str(src), outf, get_algorithms("md5,sha1"), 1)
+    compressed = tmp_path / "manifest.txt.gz"
+    compress_manifest(path, compressed, "gzip")
+    assert load_manifest(compressed) == load_manifest(path)
+
+
+def test_load_manifest_compressed_empty(tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_text("")
+    compressed = tmp_path / "manifest.txt.gz"
+    compress_manifest(path, compressed, "gzip")
+    assert len(load_manifest(compressed)) == 0
@@ -0,0 +1,98 @@
+"""Tests for the ``rodeos_ingest.memory`` module."""
+
+import logging
+from unittest.mock import MagicMock
+
+import pytest
+
+from rodeos_ingest import memory
+from rodeos_ingest.memory import (
+    DiskRecordStore,
+    MemoryMonitor,
+    RecordStore,
+    estimate_memory,
+    open_record_store,
+    over_budget,
+)
+
+
+def test_current_rss():
+    assert memory.current_rss() > 0
+
+
+def test_estimate_memory(tmp_path):
+    (tmp_path / "a.txt").write_bytes(b"x" * 10)
+    (tmp_path / "b.txt.gz").write_bytes(b"x" * 10)
+    assert estimate_memory(tmp_path / "a.txt") == 40
+    assert estimate_memory(tmp_path / "a.txt", tmp_path / "b.txt.gz") == 240
+
+
+@pytest.mark.parametrize(
+    "estimate,budget,expected", [(10, 0, False), (10, 10, False), (11, 10, True)]
+)
+def test_over_budget(estimate, budget, expected):
+    assert over_budget(estimate, budget) == expected
+
+
+def test_memory_monitor():
+    with MemoryMonitor(interval=0.001, trace=False) as monitor:
+        data = bytearray(16 * 1024**2)
+        data[::4096] = b"x" * len(data[::4096])
+    assert monitor.peak_rss >= len(data)
+    assert monitor.metrics() == {"finalize::peak_rss": monitor.peak_rss}
+    assert monitor.top() == []
+
+
+def test_memory_monitor_tracemalloc():
+    with MemoryMonitor(interval=0.001, trace=True) as monitor:
+        data = [bytes(1024) for _ in range(1024)]
+    del data
+    assert monitor.peak_traced >= 1024**2
+    assert set(monitor.metrics()) == {"finalize::peak_rss", "finalize::peak_traced"}
+    assert any("test_memory.py" in line for line in monitor.top())
+
+
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        result = RecordStore()
+    else:
+        result = DiskRecordStore(str(tmp_path), batch_size=2)
+    yield result
+    result.close()
+
+
+def test_record_store(store):
+    for name in (b"./c", b"./a", b"./d"):
+        store.add("local", name, 1, b"tree:" + name)
+    for name in (b"./b", b"./a", b"./c"):
+        store.add("irods", name, 1, b"sum" + name)
+    store.set_checksum("local", b"./a", b"sum./a")
+
+    assert store.get("irods", b"./b") == (1, b"sum./b")
+    assert store.get("irods", b"./d") is None
+    assert sorted(store.paths_with_checksum_prefix("local", b"tree:")) == [b"./c", b"./d"]
+    assert list(store.common()) == [
+        (b"./a", (1, b"sum./a"), (1, b"sum./a")),
+        (b"./c", (1, b"tree:./c"), (1, b"sum./c")),
+    ]
+    assert store.extra("local") == (1, [b"./d"])
+    assert store.extra("irods", limit=0) == (1, [])
+
+
+def test_open_record_store(mocker, tmp_path):
+    path = tmp_path / "manifest.txt"
+    path.write_bytes(b"0,abc,./a\n")
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    mocker.patch.object(memory, "FINALIZE_SPILL_DIR", str(spill_dir))
+    logger = MagicMock(logging.Logger)
+    mocker.patch.object(memory, "FINALIZE_MEMORY_BUDGET", 0)
+    assert type(open_record_store(logger, path)) is RecordStore
+    mocker.patch.object(memory, "FINALIZE_MEMORY_BUDGET", 1)
+    store = open_record_store(logger, path)
+    assert isinstance(store, DiskRecordStore)
+    assert sorted(tmp_path.iterdir()) == [path, spill_dir]
+    assert len(list(spill_dir.iterdir())) == 1
+    store.close()
+    assert list(spill_dir.iterdir()) == []
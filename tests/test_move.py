@@ -0,0 +1,120 @@
+"""Tests for the ``rodeos_ingest.move`` module."""
+
+import datetime
+import errno
+import logging
+import os
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from rodeos_ingest import common, move
+from rodeos_ingest.digest import get_algorithms
+from rodeos_ingest.manifest import write_manifest
+from rodeos_ingest.move import PROGRESS_NAME, MoveVerificationError, copy_file, move_tree
+
+
+def _make_src(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "a.txt").write_bytes(b"a")
+    (src / "big.bin").write_bytes(b"abcdefghij")
+    (src / "sub" / "b.txt").write_bytes(b"")
+    os.symlink("a.txt", src / "link")
+    with (src / "_MANIFEST_LOCAL.txt").open("wb") as outf:
+        write_manifest(
+            str(src),
+            outf,
+            get_algorithms("md5"),
+            1,
+            ("_MANIFEST_LOCAL.txt",),
+            chunk_threshold=5,
+            chunk_size=4,
+        )
+    return src
+
+
+@pytest.fixture
+def cross_device(mocker):
+    def rename(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    mocker.patch("rodeos_ingest.move.os.rename", side_effect=rename)
+    mocker.patch("rodeos_ingest.move._reflink", return_value=False)
+
+
+def test_copy_file(tmp_path):
+    (tmp_path / "a").write_bytes(b"x" * 1000)
+    copy_file(str(tmp_path / "a"), str(tmp_path / "b"))
+    assert (tmp_path / "b").read_bytes() == b"x" * 1000
+
+
+def test_move_tree_rename(tmp_path):
+    src = _make_src(tmp_path)
+    dst = tmp_path / "dst"
+    move_tree(logging.getLogger(), str(src), str(dst), str(src / "_MANIFEST_LOCAL.txt"))
+    assert not src.exists()
+    assert (dst / "a.txt").read_bytes() == b"a"
+
+
+def test_move_tree_copy(tmp_path, cross_device):
+    src = _make_src(tmp_path)
+    dst = tmp_path / "dst"
+    move_tree(logging.getLogger(), str(src), str(dst), str(src / "_MANIFEST_LOCAL.txt"), 2)
+    assert not src.exists()
+    assert (dst / "big.bin").read_bytes() == b"abcdefghij"
+    assert (dst / "sub" / "b.txt").exists()
+    assert os.readlink(dst / "link") == "a.txt"
+    assert (dst / "_MANIFEST_LOCAL.txt").exists()
+    assert not (dst / PROGRESS_NAME).exists()
+
+
+def test_move_tree_resume(tmp_path, cross_device, mocker):
+    src = _make_src(tmp_path)
+    dst = tmp_path / "dst"
+    dst.mkdir()
+    (dst / "a.txt").write_bytes(b"a")
+    (dst / PROGRESS_NAME).write_text("ok\ta.txt\n")
+    mock_copy = mocker.patch("rodeos_ingest.move.copy_file", wraps=move.copy_file)
+    move_tree(logging.getLogger(), str(src), str(dst), str(src / "_MANIFEST_LOCAL.txt"))
+    copied = sorted(os.path.relpath(call[0][0], src) for call in mock_copy.call_args_list)
+    assert copied == ["_MANIFEST_LOCAL.txt", "big.bin", "sub/b.txt"]
+    assert not src.exists()
+    assert not (dst / PROGRESS_NAME).exists()
+
+
+def test_post_job_resumes_move(tmp_path, cross_device, mocker):
+    (tmp_path / "landing").mkdir()
+    src = _make_src(tmp_path / "landing")
+    dst = common.to_ingested_path(src)
+    dst.mkdir(parents=True)
+    (dst / "a.txt").write_bytes(b"a")
+    (dst / PROGRESS_NAME).write_text("ok\ta.txt\n")
+    mocker.patch.object(common, "MOVE_AFTER_INGEST", True)
+    # The manifests were compared before the move was interrupted and are not computed again.
+    mocker.patch.object(common, "compute_local_manifest", side_effect=AssertionError)
+    mocker.patch.object(common, "compute_irods_manifest", side_effect=AssertionError)
+    dst_collection = MagicMock()
+    dst_collection.path = "/zone/src"
+    dst_collection.metadata.get_all.side_effect = lambda key: (
+        [Mock(value="success")] if key == common.KEY_MANIFEST_STATUS else []
+    )
+
+    assert common._post_job_run_folder_done(
+        Mock(), Mock(), src, dst_collection, lambda _: True, datetime.timedelta(seconds=0)
+    )
+    assert not src.exists()
+    assert (dst / "big.bin").read_bytes() == b"abcdefghij"
+    assert not (dst / PROGRESS_NAME).exists()
+    keys = [call.args[0] for call in dst_collection.metadata.__setitem__.call_args_list]
+    assert common.KEY_STATUS in keys
+
+
+def test_move_tree_mismatch(tmp_path, cross_device):
+    src = _make_src(tmp_path)
+    (src / "a.txt").write_bytes(b"b")
+    dst = tmp_path / "dst"
+    with pytest.raises(MoveVerificationError):
+        move_tree(logging.getLogger(), str(src), str(dst), str(src / "_MANIFEST_LOCAL.txt"))
+    assert src.exists()
+    assert (dst / PROGRESS_NAME).exists()
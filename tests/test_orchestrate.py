@@ -0,0 +1,103 @@
+"""Tests for the ``rodeos_ingest.orchestrate`` module."""
+
+import logging
+import threading
+import time
+
+import pytest
+
+from rodeos_ingest import orchestrate
+from rodeos_ingest.orchestrate import (
+    IngestPath,
+    Orchestrator,
+    ScanResult,
+    create_collections,
+    discover_paths,
+    format_report,
+    target_collection,
+)
+
+
+def test_target_collection():
+    assert target_collection("/zone/home/user/", "210101_X") == "/zone/home/user/2021/210101_X"
+
+
+def test_discover_paths(tmp_path):
+    (tmp_path / "210202_B").mkdir()
+    (tmp_path / "200101_A").mkdir()
+    (tmp_path / "file.txt").write_text("")
+    assert discover_paths(str(tmp_path), "/zone/t") == [
+        IngestPath(str(tmp_path / "200101_A"), "/zone/t/2020/200101_A"),
+        IngestPath(str(tmp_path / "210202_B"), "/zone/t/2021/210202_B"),
+    ]
+
+
+def test_create_collections(mocker):
+    mock_run = mocker.patch("rodeos_ingest.orchestrate.subprocess.run")
+    create_collections([IngestPath("/b", "/t/2021/b"), IngestPath("/a", "/t/2020/a")])
+    mock_run.assert_called_once_with(["imkdir", "-p", "/t/2020/a", "/t/2021/b"], check=True)
+
+
+def test_format_report():
+    report = format_report(
+        [ScanResult(IngestPath("/a", "/t/a"), 0, 1.0), ScanResult(IngestPath("/b", "/t/b"), 1, 2.0)]
+    )
+    assert report.splitlines() == ["duration_s\treturncode\tsource", "2.0\t1\t/b", "1.0\t0\t/a"]
+
+
+def test_orchestrator_concurrent():
+    paths = [IngestPath("/%d" % i, "/t/%d" % i) for i in range(4)]
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def scan(logger, path, event_handler, extra_args):
+        with lock:
+            active.append(path)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(path)
+        return ScanResult(path, 0, 0.05)
+
+    orchestrator = Orchestrator(
+        logging.getLogger(), paths, "handler", parallelism=2, interval=0, scan=scan
+    )
+    results = orchestrator.run(rounds=2)
+    assert len(results) == 8
+    assert sorted(r.path.source for r in results) == sorted(2 * [p.source for p in paths])
+    assert max(peak) == 2
+
+
+def test_orchestrator_no_busy_wait(mocker):
+    paths = [IngestPath("/%d" % i, "/t/%d" % i) for i in range(4)]
+
+    def scan(logger, path, event_handler, extra_args):
+        time.sleep(0.1)
+        return ScanResult(path, 0, 0.1)
+
+    mock_wait = mocker.patch("rodeos_ingest.orchestrate.wait", wraps=orchestrate.wait)
+    orchestrator = Orchestrator(
+        logging.getLogger(), paths, "handler", parallelism=2, interval=0, scan=scan
+    )
+    assert len(orchestrator.run(rounds=2)) == 8
+    # All slots are busy while other paths are due, waiting blocks until a scan finishes.
+    assert mock_wait.call_count <= 8
+    assert all(call.kwargs["timeout"] is None for call in mock_wait.call_args_list)
+
+
+def test_orchestrator_forever_keeps_latest(mocker):
+    paths = [IngestPath("/a", "/t/a")]
+    calls = []
+
+    def scan(logger, path, event_handler, extra_args):
+        calls.append(path)
+        if len(calls) == 3:
+            raise KeyboardInterrupt()
+        return ScanResult(path, 0, float(len(calls)))
+
+    logger = mocker.MagicMock()
+    orchestrator = Orchestrator(logger, paths, "handler", interval=0, scan=scan)
+    with pytest.raises(KeyboardInterrupt):
+        orchestrator.run()
+    assert logger.info.call_args_list[-1].args[0].splitlines()[2:] == ["2.0\t0\t/a"]
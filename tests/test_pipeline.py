@@ -0,0 +1,59 @@
+"""Tests for the ``rodeos_ingest.pipeline`` module."""
+
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from rodeos_ingest.pipeline import Pipeline, StageTimeout, parse_timeouts
+
+
+def test_parse_timeouts():
+    assert parse_timeouts("") == {}
+    assert parse_timeouts("a=1, b=2.5") == {"a": 1.0, "b": 2.5}
+
+
+def test_pipeline_gather_overlaps():
+    pipeline = Pipeline(MagicMock())
+
+    async def main():
+        return await pipeline.gather(
+            pipeline.stage("one", lambda: time.sleep(0.2) or 1),
+            pipeline.stage("two", lambda: time.sleep(0.2) or 2),
+        )
+
+    start = time.monotonic()
+    assert pipeline.run(main()) == [1, 2]
+    assert time.monotonic() - start < 0.39
+    assert set(pipeline.durations) == {"one", "two", "total"}
+
+
+def test_pipeline_timeout():
+    pipeline = Pipeline(MagicMock(), timeouts={"slow": 0.05})
+
+    async def main():
+        await pipeline.stage("slow", time.sleep, 0.5)
+
+    with pytest.raises(StageTimeout):
+        pipeline.run(main())
+    assert "slow" not in pipeline.durations
+
+
+def test_pipeline_gather_failure_cancels():
+    pipeline = Pipeline(MagicMock())
+    after = MagicMock()
+
+    def fail():
+        raise RuntimeError("fail")
+
+    async def slow_then_after():
+        await pipeline.stage("slow", time.sleep, 0.2)
+        after()
+
+    async def main():
+        await pipeline.gather(pipeline.stage("fail", fail), slow_then_after())
+
+    with pytest.raises(RuntimeError, match="fail"):
+        pipeline.run(main())
+    time.sleep(0.3)
+    assert not after.called
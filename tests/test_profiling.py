@@ -0,0 +1,96 @@
+"""Tests for the ``rodeos_ingest.profiling`` module."""
+
+import os
+import signal
+import sys
+import time
+
+import pytest
+
+from rodeos_ingest import profiling
+from rodeos_ingest.profiling import Profiler, fold_stack, profiled
+
+
+def _busy(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_fold_stack():
+    stack = fold_stack(sys._getframe())
+    assert stack.endswith(";test_profiling:test_fold_stack")
+
+
+def test_section(tmp_path):
+    profiler = Profiler(tmp_path, ratio=1.0, interval=0.001, enabled=True)
+    with profiler.section("bcl.post_job") as selected:
+        assert selected
+        with profiler.section("finalize") as nested:
+            assert not nested
+        _busy(0.05)
+
+    lines = profiler.path("bcl.post_job").read_text().splitlines()
+    assert lines
+    assert any(";test_profiling:_busy " in line for line in lines)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) > 5
+    assert not profiler.path("finalize").exists()
+
+
+def test_section_aggregates(tmp_path):
+    profiler = Profiler(tmp_path, ratio=1.0, interval=0.001, enabled=True)
+    for _ in range(2):
+        with profiler.section("bcl.post_job"):
+            _busy(0.02)
+    counts = sum(profiler.stacks["bcl.post_job"].values())
+    lines = profiler.path("bcl.post_job").read_text().splitlines()
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == counts
+
+
+@pytest.mark.parametrize(
+    "enabled,random_value,ratio,expected",
+    [
+        (False, 0.0, None, False),
+        (True, 0.5, None, False),
+        (True, 0.05, None, True),
+        (True, 0.5, 1.0, True),
+    ],
+)
+def test_section_selection(tmp_path, enabled, random_value, ratio, expected):
+    profiler = Profiler(tmp_path, 0.1, 0.001, enabled, lambda: random_value)
+    with profiler.section("bcl.on_data_obj_create", ratio) as selected:
+        assert selected == expected
+
+
+def test_signal_toggles(mocker, tmp_path):
+    mocker.patch.object(profiling, "PROFILE_DIR", str(tmp_path))
+    mocker.patch.object(profiling, "_profiler", None)
+    previous = signal.getsignal(signal.SIGUSR2)
+    try:
+        profiler = profiling.get_profiler()
+        assert profiling.get_profiler() is profiler
+        assert not profiler.enabled
+        os.kill(os.getpid(), signal.SIGUSR2)
+        assert profiler.enabled
+    finally:
+        signal.signal(signal.SIGUSR2, previous)
+
+
+def test_profiled(mocker, tmp_path):
+    profiler = Profiler(tmp_path, ratio=1.0, interval=0.001, enabled=True)
+    mocker.patch.object(profiling, "get_profiler", return_value=profiler)
+
+    @profiled
+    class _Handler:
+        @staticmethod
+        def post_job(hdlr_mod, logger, meta):
+            _busy(0.02)
+            return meta
+
+        @classmethod
+        def on_data_obj_create(cls, func, *args, **options):
+            return func(*args, **options)
+
+    assert _Handler.post_job(None, None, {"root": "/data"}) == {"root": "/data"}
+    assert _Handler.on_data_obj_create(lambda x: x + 1, 1) == 2
+    assert set(profiler.stacks) == {"test_profiling.post_job", "test_profiling.on_data_obj_create"}
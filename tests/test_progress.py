@@ -0,0 +1,13 @@
+"""Tests for the ``rodeos_ingest.progress`` module."""
+
+from rodeos_ingest.progress import Progress
+
+
+def test_progress(tmp_path):
+    progress = Progress(tmp_path / "progress.txt")
+    assert progress.succeeded() == set()
+    progress.record("/a", "ok")
+    progress.record("/b", "failed")
+    progress.record("/c", "ok")
+    progress.record("/c", "failed")
+    assert progress.succeeded() == {"/a"}
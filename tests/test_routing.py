@@ -0,0 +1,115 @@
+"""Tests for the ``rodeos_ingest.routing`` module."""
+
+import importlib
+from unittest.mock import Mock
+
+import pytest
+
+from rodeos_ingest import routing, settings
+from rodeos_ingest.genomics.illumina.bcl import is_metadata_file
+
+
+def _meta(tmp_path, name, **kwargs):
+    path = tmp_path / "run" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_text("x")
+    return {
+        "root": str(tmp_path),
+        "path": str(path),
+        "target": "/zone/ingest/run/%s" % name,
+        "queue_name": "file",
+        "size": 1,
+        **kwargs,
+    }
+
+
+@pytest.fixture(autouse=True)
+def queues(mocker):
+    mocker.patch.object(routing, "QUEUE_METADATA", "rodeos-metadata")
+    mocker.patch.object(routing, "QUEUE_LARGE", "rodeos-large")
+
+
+def test_routing_opt_in(monkeypatch):
+    monkeypatch.delenv("RODEOS_QUEUE_METADATA", raising=False)
+    monkeypatch.delenv("RODEOS_QUEUE_LARGE", raising=False)
+    assert importlib.reload(settings).RODEOS_QUEUE_METADATA == ""
+    assert settings.RODEOS_QUEUE_LARGE == ""
+
+
+def test_is_metadata_file():
+    assert is_metadata_file("RunInfo.xml")
+    assert is_metadata_file("runParameters.xml")
+    assert is_metadata_file("RTAComplete.txt")
+    assert is_metadata_file("Basecalling_Netcopy_complete_Read1.txt")
+    assert not is_metadata_file("s_1_1101.bcl.gz")
+
+
+def test_target_queue(tmp_path):
+    assert (
+        routing.target_queue(_meta(tmp_path, "RunInfo.xml"), is_metadata_file) == "rodeos-metadata"
+    )
+    meta = _meta(tmp_path, "a.bcl", size=2 * 1024**3)
+    assert routing.target_queue(meta, is_metadata_file) == "rodeos-large"
+    assert routing.target_queue(_meta(tmp_path, "a.bcl"), is_metadata_file) is None
+    assert routing.target_queue(Mock(), is_metadata_file) is None
+
+
+def test_is_rerouted(tmp_path):
+    assert routing.is_rerouted(_meta(tmp_path, "RunInfo.xml"), is_metadata_file)
+    meta = _meta(tmp_path, "RunInfo.xml", queue_name="rodeos-metadata")
+    assert not routing.is_rerouted(meta, is_metadata_file)
+    assert not routing.is_rerouted(_meta(tmp_path, "a.bcl"), is_metadata_file)
+
+
+def test_reroute(mocker, tmp_path):
+    enqueue = mocker.patch.object(routing, "_enqueue")
+    assert not routing.reroute(_meta(tmp_path, "a.bcl"), is_metadata_file)
+    assert not enqueue.called
+
+    meta = _meta(tmp_path, "RunInfo.xml")
+    assert routing.reroute(meta, is_metadata_file)
+    args = enqueue.call_args.args
+    assert args[1] == "/zone/ingest"
+    assert args[2] == meta["path"]
+    assert args[3]["size"] == 1
+    assert args[4] == "rodeos-metadata"
+
+
+def test_reroute_disabled(mocker, tmp_path):
+    mocker.patch.object(routing, "QUEUE_METADATA", "")
+    enqueue = mocker.patch.object(routing, "_enqueue")
+    assert not routing.reroute(_meta(tmp_path, "RunInfo.xml"), is_metadata_file)
+    assert routing.dispatch_metadata_files(Mock(), {"root": str(tmp_path)}, is_metadata_file) == 0
+    assert not enqueue.called
+
+
+def test_enqueue(mocker, tmp_path):
+    from irods_capability_automated_ingest import utils
+
+    enqueue_task = mocker.patch.object(utils, "enqueue_task")
+    meta = _meta(tmp_path, "RunInfo.xml")
+    routing._enqueue(meta, "/zone/ingest", meta["path"], {"size": 1}, "rodeos-metadata")
+    task_meta = enqueue_task.call_args.args[1]
+    assert task_meta["chunk"] == {meta["path"]: {"size": 1}}
+    assert task_meta["queue_name"] == "rodeos-metadata"
+    assert task_meta["target"] == "/zone/ingest"
+    assert task_meta["ignore_cache"]
+    assert meta["queue_name"] == "file"
+
+
+def test_dispatch_metadata_files(mocker, tmp_path):
+    enqueue = mocker.patch.object(routing, "_enqueue")
+    for name in ("RunInfo.xml", "RTAComplete.txt", "a.bcl"):
+        _meta(tmp_path, name)
+    (tmp_path / "run" / "Data").mkdir()
+    (tmp_path / "run" / "Data" / "RunInfo.xml").write_text("x")
+    (tmp_path / "stray.txt").write_text("x")
+    meta = {"root": str(tmp_path), "target": "/zone/ingest"}
+
+    assert routing.dispatch_metadata_files(Mock(), meta, is_metadata_file) == 2
+    paths = [call.args[2] for call in enqueue.call_args_list]
+    assert paths == [
+        str(tmp_path / "run" / "RTAComplete.txt"),
+        str(tmp_path / "run" / "RunInfo.xml"),
+    ]
+    assert all(call.args[1] == "/zone/ingest" for call in enqueue.call_args_list)
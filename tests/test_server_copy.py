@@ -0,0 +1,132 @@
+"""Tests for the ``rodeos_ingest.server_copy`` module."""
+
+import hashlib
+import logging
+from unittest.mock import MagicMock
+
+from rodeos_ingest import server_copy
+from rodeos_ingest.server_copy import (
+    KEY_COPY_SOURCE,
+    copy_on_server,
+    destination_root,
+    escape_like,
+    find_candidates,
+    find_duplicate,
+)
+from rodeos_ingest.digest import format_irods_checksum, get_algorithm
+from rodeos_ingest.hashcache import HashCache
+
+
+def _meta(tmp_path):
+    path = tmp_path / "src" / "210101_FLOWCELL_2" / "Undetermined_S0_R1.fastq.gz"
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"@read\nACGT\n+\nIIII\n")
+    return {
+        "root": str(tmp_path / "src"),
+        "path": str(path),
+        "target": "/zone/demux/210101_FLOWCELL_2/Undetermined_S0_R1.fastq.gz",
+        "size": path.stat().st_size,
+    }
+
+
+def test_destination_root(tmp_path):
+    assert destination_root(_meta(tmp_path)) == "/zone/demux"
+
+
+def test_find_candidates(mocker):
+    iquest = mocker.patch.object(
+        server_copy,
+        "_iquest",
+        return_value=[
+            "sha2:AAAA\t/zone/demux/b/x",
+            "sha2:AAAA\t/zone/demux/a/x",
+            "sha2:BBBB\t/zone/demux/c/x",
+            "\t/zone/demux/d/x",
+        ],
+    )
+    assert find_candidates(10, "/zone/demux/", "/zone/demux/a/x") == {
+        "sha2:AAAA": ["/zone/demux/b/x"],
+        "sha2:BBBB": ["/zone/demux/c/x"],
+    }
+    query = iquest.call_args.args[1]
+    assert "DATA_SIZE = '10'" in query
+    assert "COLL_NAME like '/zone/demux/%'" in query
+    iquest.return_value = []
+    assert find_candidates(10, "/zone/demux") == {}
+
+
+def test_find_candidates_escaped(mocker):
+    iquest = mocker.patch.object(server_copy, "_iquest", return_value=[])
+    assert escape_like("/zone/a_b%c\\d") == "/zone/a\\_b\\%c\\\\d"
+    find_candidates(10, "/zone/demux_2021/")
+    assert "COLL_NAME like '/zone/demux\\_2021/%'" in iquest.call_args.args[1]
+
+
+def test_find_duplicate(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"abc")
+    md5 = hashlib.md5(b"abc").hexdigest()  # nosec
+    candidates = {
+        "sha2:AAAA": ["/z/a"],
+        format_irods_checksum("md5", md5): ["/z/c"],
+        "blake:xyz": ["/z/b"],
+    }
+    assert find_duplicate(str(path), candidates, get_algorithm("sha256")) == "/z/c"
+    assert find_duplicate(str(path), {"sha2:AAAA": ["/z/a"]}, get_algorithm("md5")) is None
+    assert find_duplicate(str(path), {"blake:xyz": ["/z/b"]}, get_algorithm("md5")) is None
+
+
+def test_copy_on_server(tmp_path, mocker):
+    meta = _meta(tmp_path)
+    session = MagicMock()
+    cache = HashCache(tmp_path / "cache.sqlite")
+    digest = hashlib.sha256(open(meta["path"], "rb").read()).hexdigest()
+    find = mocker.patch.object(
+        server_copy,
+        "find_candidates",
+        return_value={format_irods_checksum("sha256", digest): ["/zone/demux/1/u.fastq.gz"]},
+    )
+    algorithm = get_algorithm("sha256")
+
+    assert copy_on_server(logging.getLogger(), session, meta, algorithm, 1, cache)
+
+    assert find.call_args.args == (meta["size"], "/zone/demux", meta["target"])
+    assert cache.get(meta["path"], "sha256") == digest
+    session.data_objects.copy.assert_called_once_with("/zone/demux/1/u.fastq.gz", meta["target"])
+    obj = session.data_objects.get.return_value
+    assert obj.metadata.__setitem__.call_args.args[0] == KEY_COPY_SOURCE
+
+
+def test_copy_on_server_sha2_zone(tmp_path, mocker):
+    # The manifests use MD5 but the zone computes SHA-256 checksums.
+    meta = _meta(tmp_path)
+    session = MagicMock()
+    cache = HashCache(tmp_path / "cache.sqlite")
+    data = open(meta["path"], "rb").read()
+    checksum = format_irods_checksum("sha256", hashlib.sha256(data).hexdigest())
+    mocker.patch.object(
+        server_copy, "_iquest", return_value=["%s\t/zone/demux/1/u.fastq.gz" % checksum]
+    )
+
+    assert copy_on_server(logging.getLogger(), session, meta, get_algorithm("md5"), 1, cache)
+
+    session.data_objects.copy.assert_called_once_with("/zone/demux/1/u.fastq.gz", meta["target"])
+    assert cache.get(meta["path"], "md5") == hashlib.md5(data).hexdigest()  # nosec
+
+
+def test_copy_on_server_skipped(tmp_path, mocker):
+    meta = _meta(tmp_path)
+    session = MagicMock()
+    cache = HashCache(tmp_path / "cache.sqlite")
+    find = mocker.patch.object(server_copy, "find_candidates", return_value={})
+    algorithm = get_algorithm("md5")
+    assert not copy_on_server(logging.getLogger(), session, meta, algorithm, 0)
+    assert not copy_on_server(logging.getLogger(), session, meta, algorithm, meta["size"] + 1)
+    assert not find.called
+    assert not copy_on_server(logging.getLogger(), session, meta, algorithm, 1, cache)
+    assert find.called
+    # The file is not hashed without data objects of the same size.
+    assert cache.get(meta["path"], "md5") is None
+    find.return_value = {"0cc175b9c0f1b6a831c399e269772661": ["/zone/demux/1/a"]}
+    assert not copy_on_server(logging.getLogger(), session, meta, algorithm, 1, cache)
+    assert not session.data_objects.copy.called
@@ -0,0 +1,68 @@
+"""Tests for the ``rodeos_ingest.throttle`` module."""
+
+from rodeos_ingest.throttle import IOGovernor, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_unlimited():
+    assert TokenBucket(0).acquire(1e12) == 0.0
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire(10) == 0.0
+    assert bucket.acquire(5) == 0.5
+    clock.now += 1.0
+    assert bucket.acquire(5) == 0.0
+
+
+def test_token_bucket_debt():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    assert bucket.acquire(30) == 2.0
+    assert bucket.acquire(10) == 1.0
+
+
+def test_token_bucket_set_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+    bucket.set_rate(2)
+    assert bucket.tokens == 2
+    assert bucket.acquire(4) == 1.0
+
+
+def test_io_governor(tmp_path):
+    clock = FakeClock()
+    governor = IOGovernor(bytes_per_second=4, iops=100, clock=clock, sleep=clock.sleep)
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abcdefgh")
+    with path.open("rb") as inputf:
+        assert governor.read(inputf, 4) == b"abcd"
+        assert clock.now == 0.0
+        assert governor.read(inputf, 4) == b"efgh"
+        assert clock.now == 1.0
+
+
+def test_io_governor_adapt():
+    governor = IOGovernor(bytes_per_second=100, iops=10, target_latency=0.01)
+    governor.observe(0.1)
+    assert governor.fraction == 0.9
+    assert governor.bytes.rate == 90
+    assert governor.ops.rate == 9
+    for _ in range(100):
+        governor.observe(0.1)
+    assert governor.fraction == 0.1
+    for _ in range(200):
+        governor.observe(0.0)
+    assert governor.fraction == 1.0
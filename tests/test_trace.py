@@ -0,0 +1,140 @@
+"""Tests for the ``rodeos_ingest.trace`` module."""
+
+from unittest.mock import Mock
+
+import pytest
+
+from rodeos_ingest import common, trace
+from rodeos_ingest.common import KEY_LAST_UPDATE
+from rodeos_ingest.genomics.illumina import bcl
+from rodeos_ingest.trace import (
+    FakeIrods,
+    Replayer,
+    TraceEvent,
+    TraceRecorder,
+    fake_backend,
+    percentile,
+    read_trace,
+    traced,
+)
+
+
+@pytest.fixture
+def recording(mocker, tmp_path):
+    mocker.patch.object(trace, "TRACE_DIR", str(tmp_path / "traces"))
+    mocker.patch.object(trace, "_recorder", None)
+    return tmp_path / "traces"
+
+
+def _handler():
+    @traced
+    class _Handler:
+        @staticmethod
+        def pre_job(hdlr_mod, logger, meta):
+            pass
+
+        @staticmethod
+        def post_data_obj_create(hdlr_mod, logger, session, meta, **options):
+            if meta.get("fail"):
+                raise ValueError("broken")
+
+    return _Handler
+
+
+def test_recorder_round_trip(tmp_path):
+    recorder = TraceRecorder(tmp_path / "trace.jsonl.gz", buffer_size=2)
+    recorder.record("pre_job", 10.0, 0.5, {"root": "/data", "config": {"secret": 1}})
+    recorder.record("post_data_obj_create", 11.0, 0.25, {"path": "/data/a", "size": 3})
+    recorder.record("post_job", 9.0, 1.0, Mock(), "OSError: gone")
+    recorder.flush()
+
+    assert read_trace([tmp_path / "trace.jsonl.gz"]) == [
+        TraceEvent(9.0, 1.0, "post_job", {}, "OSError: gone"),
+        TraceEvent(10.0, 0.5, "pre_job", {"root": "/data"}),
+        TraceEvent(11.0, 0.25, "post_data_obj_create", {"path": "/data/a", "size": 3}),
+    ]
+
+
+def test_traced(recording):
+    handler = _handler()
+    handler.pre_job(handler, Mock(), {"root": "/data"})
+    with pytest.raises(ValueError):
+        handler.post_data_obj_create(handler, Mock(), None, {"path": "/data/a", "fail": True})
+    trace.get_recorder().flush()
+
+    events = read_trace(sorted(recording.iterdir()))
+    assert [event.event for event in events] == ["pre_job", "post_data_obj_create"]
+    assert events[1].error == "ValueError: broken"
+
+
+def test_traced_disabled(mocker, tmp_path):
+    mocker.patch.object(trace, "TRACE_DIR", "")
+    handler = _handler()
+    handler.pre_job(handler, Mock(), {"root": "/data"})
+    assert trace.get_recorder() is None
+
+
+def test_fake_irods():
+    backend = FakeIrods()
+    backend.register("/zone/ingest/run/Data")
+    coll = backend.collections.get("/zone/ingest")
+    assert [c.name for c in coll.subcollections] == ["run"]
+    coll.metadata["key"] = Mock(value="a")
+    assert coll.metadata.get_one("key").value == "a"
+    coll.metadata.add("other", "b")
+    coll.metadata.add("other", "c")
+    assert [avu.value for avu in coll.metadata.get_all("other")] == ["b", "c"]
+    with pytest.raises(KeyError):
+        coll.metadata.get_one("other")
+    assert backend.data_objects.get("/zone/x") is backend.data_objects.get("/zone/x")
+    assert backend.operations == 9
+
+
+def test_fake_backend_restores(recording):
+    run_ichksum = bcl.run_ichksum
+    with fake_backend(bcl, FakeIrods()) as backend:
+        bcl.run_ichksum("/zone/x")
+        assert common._iquest("%s", "SELECT") == []
+        assert common.open_lease({}, "run") is None
+        assert trace.get_recorder() is None
+    assert backend.operations == 2
+    assert bcl.run_ichksum is run_ichksum
+    assert trace.get_recorder() is not None
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([5.0], 90) == 5.0
+
+
+def test_replay(tmp_path):
+    run_folder = tmp_path / "210101_A00123_0001_AXXX"
+    (run_folder / "Data").mkdir(parents=True)
+    events = []
+    for i in range(4):
+        (run_folder / "Data" / ("%d.bcl" % i)).write_text("x")
+        meta = {
+            "root": "/landing",
+            "path": "/landing/%s/Data/%d.bcl" % (run_folder.name, i),
+            "target": "/zone/ingest/%s/Data/%d.bcl" % (run_folder.name, i),
+            "size": 2 * 1024**2,
+        }
+        events.append(TraceEvent(100.0 + i * 0.01, 0.5, "post_data_obj_create", meta))
+    events.append(TraceEvent(101.0, 0.5, "post_data_obj_update", {"path": "/landing/missing"}))
+
+    replayer = Replayer(Mock(), bcl, speed=0, workers=2, path_map=[("/landing", str(tmp_path))])
+    report = replayer.run(events)
+
+    assert len(report.results) == 5
+    assert [bool(result.error) for result in report.results] == [False] * 4 + [True]
+    coll = replayer.backend.collections.get("/zone/ingest/%s" % run_folder.name)
+    assert coll.metadata.get_one(KEY_LAST_UPDATE)
+    lines = report.format().splitlines()
+    assert lines[0].startswith("calls: 5")
+    assert lines[2].startswith("post_data_obj_create\t4\t0\t")
+    assert lines[3].startswith("post_data_obj_update\t1\t1\t")
+    assert lines[2].endswith("\t500.00\t500.00")
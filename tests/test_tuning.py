@@ -0,0 +1,83 @@
+"""Tests for the ``rodeos_ingest.tuning`` module."""
+
+import threading
+
+from rodeos_ingest.digest import get_algorithms
+from rodeos_ingest.tuning import (
+    ConcurrencyController,
+    TuningStore,
+    calibrate,
+    mount_point,
+    optimal_threads,
+    threads_for,
+)
+
+
+def test_mount_point(tmp_path):
+    assert mount_point("/") == "/"
+    assert mount_point(tmp_path).startswith("/")
+
+
+def test_calibrate(tmp_path):
+    (tmp_path / "a.bin").write_bytes(b"x" * 1000)
+    (tmp_path / "b.bin").write_bytes(b"x" * 10)
+    result = calibrate(str(tmp_path), get_algorithms("md5"), levels=(1, 2), sample_bytes=100)
+    assert sorted(result) == [1, 2]
+    assert all(value > 0 for value in result.values())
+
+
+def test_optimal_threads():
+    assert optimal_threads({1: 100.0, 2: 180.0, 4: 200.0, 8: 199.0}) == 4
+    assert optimal_threads({1: 100.0, 2: 98.0}) == 1
+
+
+def test_tuning_store(tmp_path):
+    path = tmp_path / "tuning.json"
+    assert threads_for(tmp_path, str(path), 8) == 8
+    store = TuningStore(str(path))
+    assert store.put(mount_point(tmp_path), {1: 10.0, 2: 20.0, 4: 20.5}) == 2
+    assert store.get(mount_point(tmp_path)) == 2
+    assert threads_for(tmp_path, str(path), 8) == 2
+    assert threads_for(tmp_path, "", 8) == 8
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrency_controller():
+    clock = FakeClock()
+    controller = ConcurrencyController(4, maximum=16, interval=1.0, clock=clock)
+    clock.now = 1.0
+    controller.record(100)
+    assert controller.limit == 8
+    clock.now = 2.0
+    controller.record(200)
+    assert controller.limit == 16
+    clock.now = 3.0
+    controller.record(150)
+    assert controller.limit == 8
+    assert controller.direction == -1
+
+
+def test_concurrency_controller_slot():
+    controller = ConcurrencyController(2)
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with controller.slot():
+            with lock:
+                peak.append(controller.active)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
+    assert controller.active == 0
@@ -0,0 +1,146 @@
+"""Tests for the ``rodeos_ingest.upload`` module."""
+
+from unittest.mock import MagicMock, Mock
+
+from irods_capability_automated_ingest import sync_irods
+from irods_capability_automated_ingest.sync_irods import no_op, sync_file, upload_file
+from irods_capability_automated_ingest.utils import Operation
+import pytest
+
+from rodeos_ingest import upload
+from rodeos_ingest.upload import (
+    STRATEGY_LARGE,
+    STRATEGY_SMALL,
+    STRATEGY_STANDARD,
+    TieredUpload,
+    checksum_deferred,
+    choose_strategy,
+    strategy_for,
+    transfer_options,
+)
+
+
+def test_choose_strategy():
+    assert choose_strategy(0, 10, 100) == STRATEGY_SMALL
+    assert choose_strategy(9, 10, 100) == STRATEGY_SMALL
+    assert choose_strategy(10, 10, 100) == STRATEGY_STANDARD
+    assert choose_strategy(99, 10, 100) == STRATEGY_STANDARD
+    assert choose_strategy(100, 10, 100) == STRATEGY_LARGE
+    assert choose_strategy(5, 0, 0) == STRATEGY_STANDARD
+    assert choose_strategy(10**12, 0, 0) == STRATEGY_STANDARD
+
+
+def test_strategy_for():
+    assert strategy_for({}) == STRATEGY_STANDARD
+    # Small files are opt-in, by default every file gets its checksum on upload.
+    assert strategy_for({"size": 1}) == STRATEGY_STANDARD
+    assert strategy_for({"size": 100 * 1024**3}) == STRATEGY_LARGE
+    assert not checksum_deferred({"size": 1})
+    assert not checksum_deferred({})
+
+
+def test_strategy_for_small(mocker):
+    mocker.patch.object(upload, "UPLOAD_SMALL_THRESHOLD", 10)
+    assert strategy_for({"size": 1}) == STRATEGY_SMALL
+    assert checksum_deferred({"size": 1})
+    assert not checksum_deferred({"size": 10})
+
+
+def test_transfer_options():
+    options = {"destRescName": "fast"}
+    assert transfer_options(STRATEGY_LARGE, options, 8) == {
+        "destRescName": "fast",
+        "num_threads": 8,
+    }
+    assert transfer_options(STRATEGY_SMALL, options) == {"destRescName": "fast", "num_threads": 1}
+    assert transfer_options(STRATEGY_STANDARD, options) == options
+    assert options == {"destRescName": "fast"}
+
+
+class _Handler(TieredUpload):
+    calls = []
+
+    @staticmethod
+    def post_data_obj_create(hdlr_mod, logger, session, meta, *args, **options):
+        _Handler.calls.append(("post", options))
+
+
+@pytest.fixture
+def handler():
+    _Handler.calls = []
+    return _Handler
+
+
+@pytest.mark.parametrize("size,threads", [(10, 1), (2 * 1024**2, None), (2 * 1024**3, 16)])
+def test_tiered_upload(mocker, handler, size, threads):
+    mocker.patch.object(upload, "UPLOAD_SMALL_THRESHOLD", 1024**2)
+    func = mocker.patch.object(sync_irods, "upload_file", Mock(spec=upload_file))
+    logger, session = Mock(), MagicMock()
+    meta = {"path": "/src/run/a.bin", "target": "/zone/run/a.bin", "size": size}
+
+    handler.on_data_obj_create(func, None, logger, session, meta, None, Operation.PUT_SYNC)
+
+    assert func.call_count == 1
+    assert func.call_args.kwargs.get("num_threads") == threads
+    assert handler.calls == [("post", func.call_args.kwargs)]
+    assert "with strategy" in logger.info.call_args.args[0]
+    # The timing is only logged, there are no per-object AVUs.
+    assert not session.data_objects.get.called
+    assert not session.cleanup.called
+
+
+def test_tiered_upload_append(mocker, handler):
+    func = mocker.patch.object(sync_irods, "sync_file", Mock(spec=sync_file))
+    meta = {"path": "/src/run/a.fastq.gz", "target": "/zone/run/a.fastq.gz", "size": 2 * 1024**3}
+
+    handler.on_data_obj_modify(func, None, Mock(), MagicMock(), meta, None, Operation.PUT_APPEND)
+
+    assert "num_threads" not in func.call_args.kwargs
+
+
+def test_tiered_upload_no_transfer(handler):
+    func, logger, session = Mock(spec=no_op), Mock(), Mock()
+    handler.on_data_obj_create(func, None, logger, session, {"size": 1}, keep="yes")
+    func.assert_called_once_with(None, logger, session, {"size": 1}, keep="yes")
+    assert not logger.info.called
+
+
+def test_tiered_upload_copied_on_server(mocker, handler):
+    func = mocker.patch.object(sync_irods, "upload_file", Mock(spec=upload_file))
+    mocker.patch.object(handler, "copy_on_server", return_value=True)
+    meta = {"path": "/src/run/a.fastq.gz", "target": "/zone/run/a.fastq.gz", "size": 2 * 1024**3}
+
+    handler.on_data_obj_create(func, None, Mock(), MagicMock(), meta, None, Operation.PUT_SYNC)
+
+    assert not func.called
+    assert len(handler.calls) == 1
+
+
+def _chunk_meta(chunk, path, size=10):
+    return {"chunk": chunk, "path": path, "size": size}
+
+
+def test_small_file_batches(mocker):
+    mocker.patch.object(upload, "UPLOAD_SMALL_THRESHOLD", 1024**2)
+    batches = upload.SmallFileBatches()
+    chunk = {"/src/a": {}, "/src/b": {}, "/src/c": {}}
+    assert batches.key(_chunk_meta(chunk, "/src/b")) == "/src/a"
+    assert batches.key(_chunk_meta(chunk, "/src/b", 2 * 1024**2)) is None
+    assert batches.key(_chunk_meta({"/src/a": {}}, "/src/a")) is None
+    assert batches.key({"path": "/src/a", "size": 10}) is None
+
+    assert batches.add(_chunk_meta(chunk, "/src/a"), "/zone/a") == (True, [])
+    assert batches.add(_chunk_meta(chunk, "/src/b")) == (False, [])
+    assert batches.add(_chunk_meta(chunk, "/src/c"), "/zone/c") == (False, ["/zone/a", "/zone/c"])
+    assert batches.targets == {}
+
+
+def test_small_file_batches_incomplete(mocker):
+    mocker.patch.object(upload, "UPLOAD_SMALL_THRESHOLD", 1024**2)
+    batches = upload.SmallFileBatches()
+    first = {"/src/a": {}, "/src/b": {}}
+    second = {"/src/c": {}, "/src/d": {}}
+    assert batches.add(_chunk_meta(first, "/src/a"), "/zone/a") == (True, [])
+    # The last file of the first chunk was unchanged, so the next task completes the batch.
+    assert batches.add(_chunk_meta(second, "/src/c"), "/zone/c") == (True, ["/zone/a"])
+    assert batches.targets == {"/src/c": ["/zone/c"]}
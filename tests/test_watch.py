@@ -0,0 +1,42 @@
+"""Tests for the ``rodeos_ingest.watch`` module."""
+
+import pathlib
+from unittest.mock import MagicMock
+
+from rodeos_ingest.watch import ChangeJournal, Watcher
+
+
+def test_change_journal(tmp_path):
+    journal = ChangeJournal(str(tmp_path / "journal"), "run")
+    assert journal.is_done() is None
+    journal.record(["a.txt"], now=10.0)
+    journal.record(["b.txt", "sub/c.txt"], now=20.0)
+    assert journal.changes_since(15.0) == ["b.txt", "sub/c.txt"]
+    assert journal.read_state() == {"last_change": 20.0}
+    journal.write_state(done=True)
+    assert journal.is_done() is True
+
+
+def test_watcher(tmp_path):
+    root = tmp_path / "root"
+    (root / "run1" / "sub").mkdir(parents=True)
+    (root / "run2").mkdir()
+    on_changes = MagicMock()
+    watcher = Watcher(
+        MagicMock(),
+        str(root),
+        lambda path: (pathlib.Path(path) / "DONE.txt").exists(),
+        on_changes,
+        str(tmp_path / "journal"),
+    )
+    watcher.start()
+    assert watcher.journal("run1").is_done() is False
+    (root / "run1" / "sub" / "x.bin").write_bytes(b"x")
+    (root / "run1" / "DONE.txt").write_bytes(b"")
+    changes = watcher.poll(1.0)
+    assert sorted(set(changes["run1"])) == ["DONE.txt", "sub/x.bin"]
+    assert "run2" not in changes
+    assert on_changes.called
+    assert watcher.journal("run1").is_done() is True
+    assert sorted(set(watcher.journal("run1").changes_since(0))) == ["DONE.txt", "sub/x.bin"]
+    watcher.inotify.close()
@@ -14,4 +14,19 @@ LOG_LEVEL=${-error}
 
 export CELERY_BROKER_URL=redis://127.0.0.1:6379/0
 export PYTHONPATH=`pwd`
-celery -A irods_capability_automated_ingest.sync_task worker -l "$LOG_LEVEL" -Q restart,path,file
+CONCURRENCY_METADATA=${CONCURRENCY_METADATA:-2}
+CONCURRENCY_LARGE=${CONCURRENCY_LARGE:-2}
+
+# Separate worker pools for the queues that files are routed to (if enabled), such that meta data
+# files do not wait behind bulk uploads and large files do not occupy all workers.
+if [[ -n "$RODEOS_QUEUE_METADATA" ]]; then
+    celery -A irods_capability_automated_ingest.sync_task worker -l "$LOG_LEVEL" \
+        -Q $RODEOS_QUEUE_METADATA -c $CONCURRENCY_METADATA -n metadata@%h &
+fi
+if [[ -n "$RODEOS_QUEUE_LARGE" ]]; then
+    celery -A irods_capability_automated_ingest.sync_task worker -l "$LOG_LEVEL" \
+        -Q $RODEOS_QUEUE_LARGE -c $CONCURRENCY_LARGE -n large@%h &
+fi
+celery -A irods_capability_automated_ingest.sync_task worker -l "$LOG_LEVEL" \
+    -Q restart,path,file -n file@%h &
+wait